@@ -1,10 +1,36 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
 import gspread
 from google.oauth2.service_account import Credentials
 import bcrypt
+import atexit
+import logging
+import os
+import queue
+import time
 import streamlit.components.v1 as components # Import for custom HTML/JS
+from audit_archive import AuditLogArchive, RetentionJob
+from audit_index import AUDIT_COLUMNS, AuditLogIndex
+from auth import LoginThrottled, PasswordVerifier, VerifierBusy
+from export import EXPORT_FORMATS, available_formats, export_frame
+from journal import JournalReplayer, SubmissionJournal
+from paging import paginate_frame
+from rollups import DIMENSIONS, HoursRollup
+from sheet_cache import (DiskSnapshotStore, SharedFileLock, SharedSheetVersions, SheetVersions, SingleFlight,
+                         SnapshotRefresher)
+from storage import (AppendOnlySync, BatchedAppendWriter, FaultInjectingBackend, GoogleSheetsBackend, MonthPartitionedSheet,
+                     RequestScheduler, ScheduledBackend, SheetRowMap, SQLiteBackend, WorksheetNotFound, apply_schema,
+                     build_value_indexes, concat_typed, key_index, select_positions)
+from validation import SHIFT_OPTIONS, build_presensi_rows, normalize_import, validate_timesheet
+
+# Shared cached frames are handed out as shallow copies; copy-on-write (always on from pandas 3)
+# makes sure a session modifying its copy never changes the shared frame.
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+logger = logging.getLogger("timesheet")
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -19,21 +45,146 @@ scope = [
     "https://www.googleapis.com/auth/drive"
 ]
 
-key_dict = st.secrets["gcp_service_account"]
-creds = Credentials.from_service_account_info(key_dict, scopes=scope)
 SHEET_ID = "1BwwoNx3t3MBrsOB3H9BSxnWbYCwChwgl4t1HrpFYWpA"
 
-@st.cache_resource(ttl=3600) # Cache connection for 1 hour (3600 seconds)
-def get_google_sheet_client(sheet_id):
+# --- Storage Backend Configuration ---
+# "gsheets" (default) uses Google Sheets, "sqlite" uses a local SQLite file with the same worksheets.
+STORAGE_BACKEND = st.secrets.get("storage_backend", "gsheets")
+SQLITE_PATH = st.secrets.get("sqlite_path", "timesheet.db")
+# Timesheet rows are only ever appended, so 'presensi' refreshes fetch only the new rows
+PRESENSI_INCREMENTAL_SYNC = st.secrets.get("presensi_incremental_sync", True)
+# ...but hand edits to earlier rows are only seen by a full reload, done at least this often (seconds)
+PRESENSI_FULL_RELOAD_SECONDS = st.secrets.get("presensi_full_reload_seconds", 600)
+# Requests per minute allowed by the Sheets API quota; requests beyond the budget wait instead of failing
+SHEETS_READS_PER_MINUTE = st.secrets.get("sheets_reads_per_minute", 60)
+SHEETS_WRITES_PER_MINUTE = st.secrets.get("sheets_writes_per_minute", 60)
+# Level of the app's own log output on stderr (startup timings, retries, background jobs)
+LOG_LEVEL = st.secrets.get("log_level", "INFO")
+# Optional latency / quota-error injection for load tests, e.g. {latency = 0.3, error_rate = 0.05}
+FAULT_INJECTION = dict(st.secrets.get("fault_injection", {}))
+# Store 'presensi' as one worksheet per month (presensi_YYYY_MM) and load only the months a view needs.
+# Existing rows are moved over once by a Site Admin (Master Edit -> Run Migration).
+PRESENSI_PARTITIONED = st.secrets.get("presensi_partitioned", False)
+# (Id, Date) identifies a timesheet entry; used for duplicate checks
+PRESENSI_KEY_COLUMNS = ("Id", "Date")
+# Compact dtypes applied once when 'presensi' rows are loaded
+PRESENSI_SCHEMA = {
+    "Date": "datetime",
+    "Hours": "float32",
+    "Overtime": "float32",
+    "Username": "category",
+    "Day": "category",
+    "Shift": "category",
+    "Area 1": "category",
+    "Area 2": "category",
+    "Area 3": "category",
+    "Area 4": "category",
+}
+# Secondary indexes over presensi used by the Activity Log filters (index name -> columns)
+PRESENSI_INDEX_COLUMNS = {
+    "Username": ["Username"],
+    "Shift": ["Shift"],
+    "Area": ["Area 1", "Area 2", "Area 3", "Area 4"],
+}
+# Login: bcrypt runs on a small shared pool, repeated failures lock the Id for a while
+BCRYPT_WORKERS = 2
+BCRYPT_MAX_PENDING = 16
+LOGIN_MAX_FAILURES = 5
+LOGIN_FAILURE_WINDOW_SECONDS = 900
+LOGIN_LOCKOUT_SECONDS = 900
+# Audit events are written in the background, in batches of up to AUDIT_LOG_BATCH_SIZE rows
+AUDIT_LOG_BATCH_SIZE = 50
+AUDIT_LOG_FLUSH_SECONDS = 2.0
+# Audit entries older than this many days are moved to monthly archive files (0, the default, keeps everything
+# in the sheet). Archived entries are deleted from the sheet, so AUDIT_LOG_ARCHIVE_DIR must be on persistent
+# storage: on an ephemeral container or Codespace the archive is lost with the next redeploy.
+AUDIT_LOG_RETENTION_DAYS = st.secrets.get("audit_log_retention_days", 0)
+AUDIT_LOG_ARCHIVE_DIR = st.secrets.get("audit_log_archive_dir", "audit_archive")
+AUDIT_LOG_RETENTION_INTERVAL_SECONDS = 24 * 3600
+# Worksheets kept as stale-while-revalidate snapshots (title -> refresh interval in seconds): a background
+# thread reloads them before they get old, so no page view waits for a full sheet download. A write only
+# marks its snapshot stale. 'user' is not in the list: a login right after a password change must see the
+# new hash, so it is reloaded on the next read after a write instead.
+SNAPSHOT_REFRESH_SECONDS = dict(st.secrets.get("snapshot_refresh_seconds",
+                                                {"presensi": 600, "audit_log": 600, "areas": 600}))
+# Last good snapshots are kept here as Arrow files so a restarted app serves data right away ("" to disable)
+SNAPSHOT_DIR = st.secrets.get("snapshot_dir", ".snapshots")
+# Never written to snapshot files or the shared cache: 'user' holds password hashes (and legacy plain-text passwords)
+UNPERSISTED_SHEETS = {"user"}
+# Optional cache tier shared by several app processes on one host, e.g. "/dev/shm/timesheet": sheet versions
+# and snapshots live there, so a write in one replica invalidates all of them and only one of them downloads
+SHARED_CACHE_DIR = st.secrets.get("shared_cache_dir", "")
+# How long a replica waits for another one's download of the same sheet before downloading itself
+SHARED_DOWNLOAD_WAIT_SECONDS = 120
+# Only the selected tab loads data and renders (tabs are re-run when switched); False runs every tab on each rerun
+LAZY_TABS = st.secrets.get("lazy_tabs", True)
+# Submissions are written to a local journal first and pushed to 'presensi' in the background
+SUBMISSION_JOURNAL = st.secrets.get("submission_journal", True)
+SUBMISSION_JOURNAL_PATH = st.secrets.get("submission_journal_path", "submission_journal.db")
+
+# Bulk timesheet import (Master Edit): accepted rows are appended this many at a time
+IMPORT_CHUNK_ROWS = 500
+
+# Headers used when a worksheet has to be created in the local store
+SHEET_HEADERS = {
+    "user": ["Id", "Username", "Password", "Role", "Grade", "Preferred Areas", "Preferred Shift", "Number of Areas"],
+    "presensi": ["Id", "Username", "Date", "Day", "Hours", "Overtime", "Area 1", "Area 2", "Area 3", "Area 4", "Shift", "Remark"],
+    "audit_log": ["Timestamp", "User ID", "Username", "Action", "Description", "Status"],
+    "areas": ["AreaName"],
+}
+
+@st.cache_resource
+def configure_logging():
+    """Sends log records of the app and its modules to stderr; Python's default only shows warnings."""
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    for name in ("timesheet", "storage", "sheet_cache", "journal", "audit_archive"):
+        module_logger = logging.getLogger(name)
+        module_logger.setLevel(LOG_LEVEL)
+        module_logger.addHandler(handler)
+        module_logger.propagate = False
+    return handler
+
+configure_logging()
+
+
+@st.cache_resource # Kept for the life of the process, the access token is refreshed in the background
+def get_storage_backend(sheet_id):
     try:
-        client = gspread.authorize(creds)
-        sheet_user_obj = client.open_by_key(sheet_id).worksheet("user")
-        sheet_presensi_obj = client.open_by_key(sheet_id).worksheet("presensi")
-        sheet_audit_log_obj = client.open_by_key(sheet_id).worksheet("audit_log")
+        startup_started = time.perf_counter()
+        # Every request goes through the scheduler: quota budget, retries with backoff, merged identical reads
+        scheduler = RequestScheduler(reads_per_minute=SHEETS_READS_PER_MINUTE, writes_per_minute=SHEETS_WRITES_PER_MINUTE)
+        if STORAGE_BACKEND == "sqlite":
+            backend = SQLiteBackend(SQLITE_PATH)
+            existing_titles = backend.worksheet_titles()
+            for title, header in SHEET_HEADERS.items():
+                if title not in existing_titles:
+                    backend.create_worksheet(title, header)
+        else:
+            key_dict = st.secrets["gcp_service_account"]
+            creds = Credentials.from_service_account_info(key_dict, scopes=scope)
+            authorize_started = time.perf_counter()
+            backend = GoogleSheetsBackend(gspread.authorize(creds), sheet_id, credentials=creds)
+            backend.timings["authorize"] = time.perf_counter() - authorize_started
+            # One open_by_key + one metadata call resolves every worksheet handle
+            scheduler.call("read", backend.open)
+            backend.start_credential_refresh()
+        if FAULT_INJECTION:
+            backend = FaultInjectingBackend(backend, latency=FAULT_INJECTION.get("latency", 0.0),
+                                            error_rate=FAULT_INJECTION.get("error_rate", 0.0),
+                                            seed=FAULT_INJECTION.get("seed"))
+        backend = ScheduledBackend(backend, scheduler)
+
+        sheet_user_obj = backend.worksheet("user")
+        sheet_presensi_obj = backend.worksheet("presensi")
+        sheet_audit_log_obj = backend.worksheet("audit_log")
         # NEW: Areas sheet
-        sheet_areas_obj = client.open_by_key(sheet_id).worksheet("areas")
+        sheet_areas_obj = backend.worksheet("areas")
 
-        return client, sheet_user_obj.title, sheet_presensi_obj.title, sheet_audit_log_obj.title, sheet_areas_obj.title
+        startup_seconds = time.perf_counter() - startup_started
+        backend.timings["startup"] = startup_seconds
+        logger.info("Storage backend '%s' ready in %.3fs", backend.name, startup_seconds)
+        return backend, sheet_user_obj.title, sheet_presensi_obj.title, sheet_audit_log_obj.title, sheet_areas_obj.title
     except gspread.exceptions.SpreadsheetNotFound:
         st.error(
             "**Error:** Spreadsheet not found. "
@@ -41,7 +192,7 @@ def get_google_sheet_client(sheet_id):
             "Also, ensure your service account (email in credential) has Editor access to this Google Sheet."
         )
         st.stop()
-    except gspread.exceptions.WorksheetNotFound as e:
+    except WorksheetNotFound as e:
         # Simplified error message to prevent IndexError
         st.error(
             f"**Error:** Worksheet not found: {e.args[0]}. "
@@ -54,14 +205,271 @@ def get_google_sheet_client(sheet_id):
                  "If it's a 503 error, try refreshing the app in a few moments.")
         st.stop()
 
-client, sheet_user_title, sheet_presensi_title, sheet_audit_log_title, sheet_areas_title = get_google_sheet_client(SHEET_ID)
+backend, sheet_user_title, sheet_presensi_title, sheet_audit_log_title, sheet_areas_title = get_storage_backend(SHEET_ID)
+
+
+@st.cache_resource
+def get_append_only_sync(worksheet_title):
+    """Process-wide incremental loader for an append-only worksheet."""
+    return AppendOnlySync(worksheet_title, key_columns=PRESENSI_KEY_COLUMNS, schema=PRESENSI_SCHEMA,
+                          index_columns=PRESENSI_INDEX_COLUMNS, rollup=HoursRollup(),
+                          full_reload_interval=PRESENSI_FULL_RELOAD_SECONDS)
+
+
+@st.cache_resource
+def get_sheet_versions():
+    """Per-worksheet version counters used to invalidate cached data, shared by all replicas with SHARED_CACHE_DIR."""
+    if SHARED_CACHE_DIR:
+        os.makedirs(SHARED_CACHE_DIR, exist_ok=True)
+        return SharedSheetVersions(os.path.join(SHARED_CACHE_DIR, "versions.db"))
+    return SheetVersions()
+
+
+@st.cache_resource
+def get_shared_snapshots():
+    """Snapshots shared by all replicas (memory-mapped Arrow files in SHARED_CACHE_DIR), or None."""
+    store = DiskSnapshotStore(SHARED_CACHE_DIR) if SHARED_CACHE_DIR else None
+    if store is None or not store.available:
+        return None
+    for title in UNPERSISTED_SHEETS: # Left behind by earlier versions
+        store.discard(title)
+    return store
+
+
+@st.cache_resource
+def get_cache_fill():
+    """Process-wide single-flight for cache fills: concurrent sessions missing the same entry share one load."""
+    return SingleFlight()
+
+
+def invalidate_sheet(worksheet_title):
+    """
+    Invalidates the cached data of a single worksheet after a write to it. Nothing is downloaded here:
+    a refreshed snapshot is only marked stale and reloaded in the background once somebody reads it.
+    """
+    get_sheet_versions().bump(worksheet_title)
+
+
+@st.cache_resource
+def get_disk_snapshots():
+    """On-disk Arrow snapshots of the worksheets, or None if disabled / pyarrow is missing."""
+    store = DiskSnapshotStore(SNAPSHOT_DIR) if SNAPSHOT_DIR else None
+    if store is None or not store.available:
+        return None
+    for title in UNPERSISTED_SHEETS: # Left behind by earlier versions
+        store.discard(title)
+    return store
+
+
+def load_persisted_snapshot(worksheet_title):
+    """(snapshot, age in seconds) from the on-disk copy, or None."""
+    store = get_disk_snapshots()
+    stored = store.load(worksheet_title) if store and worksheet_title not in UNPERSISTED_SHEETS else None
+    if stored is None:
+        return None
+    df, meta, age = stored
+    if worksheet_title != sheet_presensi_title:
+        return (df, {}), age
+    if PRESENSI_INCREMENTAL_SYNC and meta.get("sync"):
+        # The sync resumes from the persisted position, so the reconcile only fetches newer rows
+        presensi_sync = get_append_only_sync(worksheet_title)
+        df = presensi_sync.restore(df, meta["sync"])
+        return (df, presensi_sync.indexes_for(df)), age
+    return (df, build_value_indexes(df, PRESENSI_INDEX_COLUMNS)), age
+
+
+def persist_snapshot(worksheet_title, snapshot):
+    """Writes a freshly loaded snapshot to disk for the next start."""
+    store = get_disk_snapshots()
+    df, _ = snapshot
+    if store is None or df.empty or worksheet_title in UNPERSISTED_SHEETS:
+        return
+    meta = {}
+    if worksheet_title == sheet_presensi_title and PRESENSI_INCREMENTAL_SYNC:
+        sync_df, sync_state = get_append_only_sync(worksheet_title).state()
+        if sync_df is df:
+            meta["sync"] = sync_state
+    store.save(worksheet_title, df, meta)
+
+
+@st.cache_resource
+def get_snapshot_refresher():
+    """Background refresher for the worksheets in SNAPSHOT_REFRESH_SECONDS, shared by all sessions."""
+    refresher = SnapshotRefresher(load_sheet_snapshot, SNAPSHOT_REFRESH_SECONDS,
+                                  get_sheet_versions().get, single_flight=get_cache_fill(),
+                                  warm_start=load_persisted_snapshot, on_refresh=persist_snapshot)
+    atexit.register(refresher.close)
+    return refresher
+
+
+def load_sheet_snapshot(worksheet_title):
+    """
+    Loads a snapshot for the refresher: from the shared tier if another replica already
+    published a fresh one for the current version, otherwise from the backend (and publishes it).
+    """
+    shared = get_shared_snapshots()
+    if shared is None or worksheet_title in UNPERSISTED_SHEETS:
+        return build_sheet_snapshot(worksheet_title, raise_errors=True)
+    version = get_sheet_versions().get(worksheet_title)
+    published = load_published_snapshot(shared, worksheet_title, version)
+    if published is not None:
+        return published
+    # One replica downloads and publishes; the others wait for the lock and then read what it published
+    download_lock = shared.lock(worksheet_title)
+    locked = download_lock.acquire(SHARED_DOWNLOAD_WAIT_SECONDS)
+    try:
+        if locked:
+            published = load_published_snapshot(shared, worksheet_title, version)
+            if published is not None:
+                return published
+        snapshot = build_sheet_snapshot(worksheet_title, raise_errors=True)
+        if not snapshot[0].empty:
+            try:
+                shared.save(worksheet_title, snapshot[0], {"version": version})
+            except Exception as e:
+                logger.warning("Publishing '%s' to the shared cache failed: %s", worksheet_title, e)
+        return snapshot
+    finally:
+        if locked:
+            download_lock.release()
+
+
+def load_published_snapshot(shared, worksheet_title, version):
+    """(frame, secondary indexes) another replica published for `version`, if it is still fresh enough."""
+    stored = shared.load(worksheet_title)
+    if stored is None:
+        return None
+    df, meta, age = stored
+    if meta.get("version") != version or age >= SNAPSHOT_REFRESH_SECONDS[worksheet_title] / 2:
+        return None
+    if worksheet_title == sheet_presensi_title:
+        return df, build_value_indexes(df, PRESENSI_INDEX_COLUMNS)
+    return df, {}
+
+
+def get_sheet_snapshot(worksheet_title):
+    """Returns (frame, secondary indexes, age in seconds) of a refreshed worksheet snapshot."""
+    try:
+        (df, indexes), age = get_snapshot_refresher().get(worksheet_title)
+    except Exception as e:
+        st.error(f"Error fetching data from sheet '{worksheet_title}': {e}")
+        return pd.DataFrame(), {}, None
+    return df.copy(deep=False), indexes, age
+
+
+def sheet_data_key(worksheet_title):
+    """
+    (version, snapshot stamp) of a worksheet, for caching results derived from its data. A refreshed
+    worksheet only gets its new data once the refresher swaps the snapshot in, so the stamp is part of the key.
+    """
+    snapshot_stamp = get_snapshot_refresher().stamp(worksheet_title) if worksheet_title in SNAPSHOT_REFRESH_SECONDS else None
+    return get_sheet_versions().get(worksheet_title), snapshot_stamp
+
+
+def show_snapshot_age(worksheet_title):
+    age = get_snapshot_refresher().age(worksheet_title)
+    if age is not None:
+        st.caption(f"🕒 Data '{worksheet_title}' diperbarui {int(age // 60)} menit {int(age % 60)} detik yang lalu.")
 
 
-@st.cache_data(ttl=600) # Cache data for 10 minutes (600 seconds)
 def get_data_from_sheet(spreadsheet_id, worksheet_title):
+    if worksheet_title in SNAPSHOT_REFRESH_SECONDS:
+        return get_sheet_snapshot(worksheet_title)[0]
+    version = get_sheet_versions().get(worksheet_title)
+    if worksheet_title == sheet_presensi_title:
+        # One typed frame shared by all sessions instead of a pickled copy per caller
+        return load_shared_sheet_data(spreadsheet_id, worksheet_title, version)[0].copy(deep=False)
+    return load_sheet_data(spreadsheet_id, worksheet_title, version)
+
+
+def get_presensi_snapshot(start_date=None, end_date=None):
+    """
+    Returns (presensi frame, secondary indexes) from the same cached snapshot.
+    With month partitions and a date range, only the overlapping months are loaded.
+    """
+    version = get_sheet_versions().get(sheet_presensi_title)
+    if PRESENSI_PARTITIONED and start_date is not None and end_date is not None:
+        df, indexes = load_presensi_range(SHEET_ID, start_date.strftime("%Y-%m"), end_date.strftime("%Y-%m"), version)
+    elif sheet_presensi_title in SNAPSHOT_REFRESH_SECONDS:
+        df, indexes, _ = get_sheet_snapshot(sheet_presensi_title)
+        if not indexes: # Failed first load
+            indexes = build_value_indexes(df, PRESENSI_INDEX_COLUMNS)
+    else:
+        df, indexes = load_shared_sheet_data(SHEET_ID, sheet_presensi_title, version)
+    return df.copy(deep=False), indexes
+
+
+@st.cache_resource
+def get_presensi_partitions():
+    """Month partitions of 'presensi', shared by all sessions."""
+    partitions = MonthPartitionedSheet(sheet_presensi_title, SHEET_HEADERS["presensi"],
+                                       key_columns=PRESENSI_KEY_COLUMNS, schema=PRESENSI_SCHEMA, rollup_factory=HoursRollup,
+                                       full_reload_interval=PRESENSI_FULL_RELOAD_SECONDS)
+    return partitions
+
+
+def migrate_presensi_to_partitions():
+    """
+    Splits the existing 'presensi' sheet into month partitions, started by a
+    Site Admin from Master Edit. Returns the number of rows copied, or None if
+    a migration is already running in another process.
+    """
+    lock_dir = SHARED_CACHE_DIR or SNAPSHOT_DIR or "."
+    os.makedirs(lock_dir, exist_ok=True)
+    lock = SharedFileLock(os.path.join(lock_dir, "presensi_migration.lock"))
+    if not lock.acquire(0):
+        return None
     try:
-        worksheet = client.open_by_key(spreadsheet_id).worksheet(worksheet_title)
-        df = pd.DataFrame(worksheet.get_all_records())
+        # Resumes an interrupted run without copying rows twice; a finished one leaves a marker worksheet
+        copied = get_presensi_partitions().import_sheet(backend, sheet_presensi_title)
+    finally:
+        lock.release()
+    get_sheet_versions().bump(sheet_presensi_title)
+    return copied
+
+
+@st.cache_resource(ttl=600, max_entries=16) # Closed months stay loaded inside the partitions object
+def load_presensi_range(spreadsheet_id, start_month, end_month, version):
+    """Returns (frame, secondary indexes) for the months from start_month to end_month ('YYYY-MM')."""
+    try:
+        df = get_presensi_partitions().load_range(backend, start_month, end_month)
+    except Exception as e:
+        st.error(f"Error fetching data from sheet '{sheet_presensi_title}': {e}")
+        df = pd.DataFrame(columns=SHEET_HEADERS["presensi"])
+    return df, build_value_indexes(df, PRESENSI_INDEX_COLUMNS)
+
+
+@st.cache_data(ttl=600, max_entries=32) # Cache data for 10 minutes (600 seconds), keyed by worksheet version
+def load_sheet_data(spreadsheet_id, worksheet_title, version):
+    return get_cache_fill().do((worksheet_title, version), fetch_sheet_data, worksheet_title)
+
+
+@st.cache_resource(ttl=600, max_entries=8) # Same TTL, but the frame is shared instead of copied
+def load_shared_sheet_data(spreadsheet_id, worksheet_title, version):
+    """Returns (frame, secondary indexes) shared by all sessions."""
+    return get_cache_fill().do((worksheet_title, version), build_sheet_snapshot, worksheet_title)
+
+
+def build_sheet_snapshot(worksheet_title, raise_errors=False):
+    """Loads a worksheet as (frame, secondary indexes); only 'presensi' has indexes."""
+    df = fetch_sheet_data(worksheet_title, raise_errors=raise_errors)
+    if worksheet_title != sheet_presensi_title:
+        return df, {}
+    if PRESENSI_INCREMENTAL_SYNC:
+        # Indexes are extended by the sync as rows are appended
+        return df, get_append_only_sync(worksheet_title).indexes_for(df)
+    return df, build_value_indexes(df, PRESENSI_INDEX_COLUMNS)
+
+
+def fetch_sheet_data(worksheet_title, raise_errors=False):
+    try:
+        if worksheet_title == sheet_presensi_title and PRESENSI_INCREMENTAL_SYNC:
+            df = get_append_only_sync(worksheet_title).sync(backend)
+        else:
+            worksheet = backend.worksheet(worksheet_title)
+            df = pd.DataFrame(worksheet.get_all_records())
+            if worksheet_title == sheet_presensi_title:
+                df = apply_schema(df, PRESENSI_SCHEMA)
         
         # --- Robustness check for crucial columns ---
         if worksheet_title == sheet_presensi_title:
@@ -97,38 +505,192 @@ def get_data_from_sheet(spreadsheet_id, worksheet_title):
             df['Number of Areas'] = pd.to_numeric(df['Number of Areas'], errors='coerce').fillna(1).astype(int)
         return df
     except Exception as e:
+        if raise_errors:
+            raise
         st.error(f"Error fetching data from sheet '{worksheet_title}': {e}")
         return pd.DataFrame()
 
 
-# --- Helper Functions ---
-def check_login(user_id, password):
-    df_users = get_data_from_sheet(SHEET_ID, sheet_user_title)
+def get_presensi_key_index(dates=None):
+    """
+    Returns (columns, keys) of the 'presensi' sheet, where keys is the set of existing (Id, Date) pairs.
+    With month partitions only the months of `dates` are looked at.
+    """
+    if PRESENSI_PARTITIONED and dates is not None:
+        partitions = get_presensi_partitions()
+        months = [MonthPartitionedSheet.month_of(d) for d in dates]
+        return partitions.header, partitions.keys_for(backend, months)
+    if PRESENSI_INCREMENTAL_SYNC:
+        # Pulls only rows appended since the last sync, the key set is kept up to date by the sync
+        presensi_sync = get_append_only_sync(sheet_presensi_title)
+        df_presensi = presensi_sync.sync(backend)
+        return list(df_presensi.columns), presensi_sync.keys
+    df_presensi = get_data_from_sheet(SHEET_ID, sheet_presensi_title)
+    return list(df_presensi.columns), key_index(df_presensi, PRESENSI_KEY_COLUMNS)
+
+
+def get_cached_presensi_keys(dates):
+    """
+    Like `get_presensi_key_index`, but only from what this process already has
+    in memory; makes no backend request. Duplicates it misses are caught by the
+    journal replay, which skips entries whose key is already in the sheet.
+    """
+    if PRESENSI_PARTITIONED:
+        partitions = get_presensi_partitions()
+        return partitions.header, partitions.cached_keys(MonthPartitionedSheet.month_of(d) for d in dates)
+    presensi_sync = get_append_only_sync(sheet_presensi_title)
+    if presensi_sync.df is not None:
+        with presensi_sync.lock:
+            return list(presensi_sync.df.columns), set(presensi_sync.keys)
+    if sheet_presensi_title in SNAPSHOT_REFRESH_SECONDS and get_snapshot_refresher().age(sheet_presensi_title) is not None:
+        df_presensi = get_sheet_snapshot(sheet_presensi_title)[0] # Already loaded, so this doesn't block
+        return list(df_presensi.columns) or SHEET_HEADERS["presensi"], key_index(df_presensi, PRESENSI_KEY_COLUMNS)
+    return SHEET_HEADERS["presensi"], set()
 
-    user_row = df_users[df_users['Id'].astype(str) == str(user_id)]
 
-    if user_row.empty:
-        return None
+@st.cache_resource(ttl=600, max_entries=4)
+def build_presensi_rollup(spreadsheet_id, data_key):
+    """Rollup built from the presensi snapshot, for when no incremental sync maintains one."""
+    return HoursRollup.build(get_presensi_snapshot()[0])
+
 
-    password_bytes = password.encode('utf-8')
+@st.cache_resource(ttl=600, max_entries=4) # Closed months are not re-read, only their totals are summed again
+def build_partitioned_rollup(spreadsheet_id, version):
+    """Totals over every month partition, summed from the rollup each partition sync maintains."""
+    return HoursRollup.merged(get_presensi_partitions().rollups(backend))
 
-    stored_password_value = str(user_row.iloc[0]['Password']).strip()
-    stored_hash_bytes = stored_password_value.encode('utf-8')
 
-    if stored_hash_bytes.startswith(b'$2a$') or stored_hash_bytes.startswith(b'$2b$') or stored_hash_bytes.startswith(b'$2y$'):
+def get_presensi_rollup():
+    """
+    Hours / Overtime totals of the 'presensi' data being shown. The incremental sync keeps them current as
+    rows are appended; otherwise they are built once per snapshot.
+    """
+    if PRESENSI_PARTITIONED:
+        return build_partitioned_rollup(SHEET_ID, get_sheet_versions().get(sheet_presensi_title))
+    if PRESENSI_INCREMENTAL_SYNC:
         try:
-            if bcrypt.checkpw(password_bytes, stored_hash_bytes):
-                return user_row.iloc[0]
+            # The shared frame itself, not a copy: the sync's rollup only matches it if the sync produced it
+            if sheet_presensi_title in SNAPSHOT_REFRESH_SECONDS:
+                (df_presensi, _), _ = get_snapshot_refresher().get(sheet_presensi_title)
             else:
-                return None
-        except ValueError:
-            st.warning("Invalid hash format detected for existing password. Please contact support.")
-            return None
+                df_presensi, _ = load_shared_sheet_data(SHEET_ID, sheet_presensi_title,
+                                                        get_sheet_versions().get(sheet_presensi_title))
+        except Exception:
+            df_presensi = None # Reported by build_presensi_rollup's own load
+        presensi_sync = get_append_only_sync(sheet_presensi_title)
+        # Not the case for a snapshot published by another replica, or once this replica's sync moved past it
+        if df_presensi is not None and presensi_sync.state()[0] is df_presensi:
+            return presensi_sync.rollup
+    return build_presensi_rollup(SHEET_ID, sheet_data_key(sheet_presensi_title))
+
+
+def record_presensi_keys(keys):
+    """Adds freshly submitted (Id, Date) keys to the index so they count as duplicates right away."""
+    if PRESENSI_INCREMENTAL_SYNC and not PRESENSI_PARTITIONED: # Partitions record their keys on append
+        get_append_only_sync(sheet_presensi_title).add_keys(keys)
+
+
+def append_presensi_rows(rows):
+    """Appends timesheet rows to 'presensi', or to its month partitions."""
+    if PRESENSI_PARTITIONED:
+        get_presensi_partitions().append_rows(backend, rows)
     else:
-        if password == stored_password_value:
-            return user_row.iloc[0]
-        else:
-            return None
+        backend.worksheet(sheet_presensi_title).append_rows(rows)
+
+
+@st.cache_resource
+def get_submission_journal():
+    """Local submission journal and its background replayer, shared by all sessions."""
+    journal = SubmissionJournal(SUBMISSION_JOURNAL_PATH, SHEET_HEADERS["presensi"], PRESENSI_KEY_COLUMNS)
+    sheet_versions = get_sheet_versions()
+    # Resolved here, on the script thread; the replayer thread only uses these objects
+    if PRESENSI_PARTITIONED:
+        partitions = get_presensi_partitions()
+        presensi_sync = None
+        key_lookup = lambda dates: partitions.keys_for(backend, [MonthPartitionedSheet.month_of(d) for d in dates])
+        append_rows = lambda rows: partitions.append_rows(backend, rows)
+    else:
+        presensi_sync = get_append_only_sync(sheet_presensi_title)
+        def key_lookup(dates):
+            presensi_sync.sync(backend)
+            return presensi_sync.keys
+        append_rows = lambda rows: backend.worksheet(sheet_presensi_title).append_rows(rows)
+
+    def on_commit(rows):
+        if presensi_sync is not None:
+            presensi_sync.add_keys([journal.key_of(row) for row in rows])
+        sheet_versions.bump(sheet_presensi_title)
+
+    replayer = JournalReplayer(journal, key_lookup, append_rows, on_commit=on_commit)
+    atexit.register(replayer.close)
+    return journal, replayer
+
+
+def get_pending_presensi_frame():
+    """
+    Journaled submissions the presensi data being shown may not have yet, typed
+    like the presensi snapshot: entries not yet written to the sheet, plus, for
+    a snapshot refreshed in the background, entries committed after its download
+    started. Other presensi views are reloaded as soon as a commit bumps the version.
+    """
+    if not SUBMISSION_JOURNAL:
+        return pd.DataFrame(columns=SHEET_HEADERS["presensi"])
+    committed_since = None
+    if not PRESENSI_PARTITIONED and sheet_presensi_title in SNAPSHOT_REFRESH_SECONDS:
+        committed_since = get_snapshot_refresher().loaded_from(sheet_presensi_title)
+    rows = get_submission_journal()[0].pending_rows(committed_since)
+    if not rows:
+        return pd.DataFrame(columns=SHEET_HEADERS["presensi"])
+    return apply_schema(pd.DataFrame(rows, columns=SHEET_HEADERS["presensi"]), PRESENSI_SCHEMA)
+
+
+# --- Helper Functions ---
+@st.cache_resource
+def get_password_verifier():
+    """Shared bcrypt pool and failed-login throttle."""
+    return PasswordVerifier(max_workers=BCRYPT_WORKERS, max_pending=BCRYPT_MAX_PENDING,
+                            max_failures=LOGIN_MAX_FAILURES, failure_window=LOGIN_FAILURE_WINDOW_SECONDS,
+                            lockout=LOGIN_LOCKOUT_SECONDS)
+
+
+@st.cache_resource(ttl=600, max_entries=4)
+def load_user_index(spreadsheet_id, data_key):
+    """Id -> user record, built once per load of the 'user' sheet."""
+    df_users = get_data_from_sheet(spreadsheet_id, sheet_user_title)
+    if 'Id' not in df_users.columns:
+        return {}
+    return {str(record['Id']): record for record in df_users.to_dict('records')}
+
+
+def get_user_record(user_id):
+    """Returns a copy of the user's record (as a Series, like a DataFrame row) or None."""
+    record = load_user_index(SHEET_ID, sheet_data_key(sheet_user_title)).get(str(user_id))
+    return None if record is None else pd.Series(record)
+
+
+def check_login(user_id, password):
+    """Returns the user's record or None. Raises LoginThrottled / VerifierBusy."""
+    verifier = get_password_verifier()
+    throttle_key = str(user_id).strip()
+    verifier.check_throttle(throttle_key) # Before any bcrypt work
+
+    user_record = get_user_record(user_id)
+    if user_record is None:
+        verifier.record_failure(throttle_key)
+        return None
+
+    stored_password_value = str(user_record['Password']).strip()
+    try:
+        password_match = verifier.verify(password, stored_password_value)
+    except ValueError:
+        st.warning("Invalid hash format detected for existing password. Please contact support.")
+        return None
+
+    if password_match:
+        verifier.record_success(throttle_key)
+        return user_record
+    verifier.record_failure(throttle_key)
+    return None
 
 
 def get_day_name(date_obj):
@@ -138,58 +700,238 @@ def get_date_range(start, end):
     return pd.date_range(start=start, end=end).to_list()
 
 # --- Functions for User Settings ---
+@st.cache_resource(ttl=600, max_entries=4) # Rebuilt whenever the 'user' sheet version or snapshot changes
+def load_user_row_map(spreadsheet_id, data_key):
+    """Id -> sheet row and header -> column map of the 'user' sheet."""
+    return SheetRowMap.load(backend.worksheet(sheet_user_title), "Id")
+
+def get_user_row_map():
+    """
+    The row map with the Id column re-read (one request): admins edit the 'user' sheet by hand,
+    so rows may have been sorted or deleted since the map was built.
+    """
+    row_map = load_user_row_map(SHEET_ID, sheet_data_key(sheet_user_title))
+    return row_map.with_current_keys(backend.worksheet(sheet_user_title))
+
+def update_users_in_sheet(updates):
+    """
+    Writes several columns for one or many users in the 'user' Google Sheet with a single batch update.
+    `updates` maps user Id -> {column name: new value}. Passwords are hashed before writing.
+    """
+    try:
+        row_map = get_user_row_map()
+        cells = []
+        for user_id, columns in updates.items():
+            gsheet_row = row_map.row_of(user_id)
+            if gsheet_row is None:
+                st.error(f"User with ID {user_id} not found in the 'user' sheet.")
+                return False
+            for column_name, new_value in columns.items():
+                col_index = row_map.col_of(column_name)
+                if col_index is None:
+                    st.error(f"Error: Column '{column_name}' not found in 'user' sheet headers. Please add this column to your 'user' Google Sheet.")
+                    return False
+                if column_name == "Password":
+                    new_value_bytes = str(new_value).encode('utf-8')
+                    new_value = bcrypt.hashpw(new_value_bytes, bcrypt.gensalt()).decode('utf-8')
+                cells.append((gsheet_row, col_index, new_value))
+
+        backend.update_cells(sheet_user_title, cells)
+        invalidate_sheet(sheet_user_title)
+        return True
+    except Exception as e:
+        st.error(f"Failed to update {', '.join(sorted({c for columns in updates.values() for c in columns}))}: {e}")
+        return False
+
 def update_user_data_in_sheet(user_id, column_name, new_value):
     """Updates a specific column for a user in the 'user' Google Sheet."""
-    sheet_user_actual = client.open_by_key(SHEET_ID).worksheet(sheet_user_title)
+    return update_users_in_sheet({user_id: {column_name: new_value}})
+
+@st.cache_resource
+def get_audit_log_writer():
+    """Background writer for audit events, shared by all sessions and flushed on shutdown."""
+    sheet_versions = get_sheet_versions()
+    writer = BatchedAppendWriter(
+        lambda: backend.worksheet(sheet_audit_log_title),
+        max_batch=AUDIT_LOG_BATCH_SIZE,
+        flush_interval=AUDIT_LOG_FLUSH_SECONDS,
+        on_flush=lambda: sheet_versions.bump(sheet_audit_log_title),
+        name="audit-log-writer",
+    )
+    atexit.register(writer.close)
+    return writer
 
-    df_users = pd.DataFrame(sheet_user_actual.get_all_records())
+def audit_retention_cutoff():
+    """Entries before this moment belong in the archive."""
+    return datetime.combine(datetime.today().date() - timedelta(days=AUDIT_LOG_RETENTION_DAYS), datetime.min.time())
 
-    try:
-        df_row_index = df_users[df_users['Id'].astype(str) == str(user_id)].index[0]
 
-        header = sheet_user_actual.row_values(1)
-        if column_name not in header:
-            st.error(f"Error: Column '{column_name}' not found in 'user' sheet headers. Please add this column to your 'user' Google Sheet.")
-            return False
+@st.cache_resource
+def get_audit_archive():
+    """Monthly audit log archive and its background retention job, or None if retention is off."""
+    if not AUDIT_LOG_RETENTION_DAYS:
+        return None
+    archive = AuditLogArchive(AUDIT_LOG_ARCHIVE_DIR)
+    sheet_versions = get_sheet_versions()
 
-        col_index = header.index(column_name) + 1
-        gsheet_row = df_row_index + 2
+    def run_retention():
+        moved = archive.archive_old_entries(backend, sheet_audit_log_title, audit_retention_cutoff())
+        if moved:
+            sheet_versions.bump(sheet_audit_log_title)
+        return moved
 
-        if column_name == "Password":
-            new_value_bytes = str(new_value).encode('utf-8')
-            hashed_password = bcrypt.hashpw(new_value_bytes, bcrypt.gensalt()).decode('utf-8')
-            sheet_user_actual.update_cell(gsheet_row, col_index, hashed_password)
-        else:
-            sheet_user_actual.update_cell(gsheet_row, col_index, new_value)
+    job = RetentionJob(run_retention, interval=AUDIT_LOG_RETENTION_INTERVAL_SECONDS)
+    atexit.register(job.close)
+    return archive
+
+
+@st.cache_data(ttl=600, max_entries=8) # Keyed by the archive stamp, so a retention run invalidates it
+def load_archived_audit_log(start_date, end_date, archive_stamp):
+    return get_audit_archive().load_range(start_date, end_date)
+
+
+@st.cache_resource(ttl=600, max_entries=4)
+def load_audit_log_index(spreadsheet_id, data_key, archive_from=None, archive_to=None, archive_stamp=None):
+    """
+    Returns (AuditLogIndex, archived row count) over the live audit log, plus the
+    archived entries from archive_from to archive_to when those are given.
+    """
+    df = get_data_from_sheet(spreadsheet_id, sheet_audit_log_title)
+    archived_rows = 0
+    if archive_from is not None:
+        df_archived = load_archived_audit_log(archive_from, archive_to, archive_stamp)
+        archived_rows = len(df_archived)
+        if archived_rows:
+            df = pd.concat([df_archived, df], ignore_index=True)
+    return AuditLogIndex(df), archived_rows
+
+
+def get_audit_log_index(start_date):
+    """The audit log index for a view starting at `start_date`; archived months are included only if needed."""
+    archive_range = ()
+    audit_archive = get_audit_archive()
+    if audit_archive is not None and start_date < audit_retention_cutoff().date():
+        # Whole months, so moving the start date within a month reuses the same index
+        archive_range = (start_date.replace(day=1), audit_retention_cutoff().date(), audit_archive.stamp())
+    return load_audit_log_index(SHEET_ID, sheet_data_key(sheet_audit_log_title), *archive_range)
 
-        get_data_from_sheet.clear()
-        return True
-    except IndexError:
-        st.error(f"User with ID {user_id} not found in the 'user' sheet.")
-        return False
-    except Exception as e:
-        st.error(f"Failed to update {column_name}: {e}")
-        return False
 
 def log_audit_event(user_id, username, action, description, status="Success"):
-    """Logs an audit event to the 'audit_log' Google Sheet."""
+    """Queues an audit event for the 'audit_log' Google Sheet."""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    log_entry = [timestamp, user_id, username, action, description, status]
     try:
-        sheet_audit_log_actual = client.open_by_key(SHEET_ID).worksheet(sheet_audit_log_title)
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_entry = [timestamp, user_id, username, action, description, status]
-        sheet_audit_log_actual.append_row(log_entry)
-        get_data_from_sheet.clear()
-    except Exception as e:
-        st.error(f"Error logging audit event: {e}")
+        get_audit_log_writer().submit(log_entry)
+    except (queue.Full, RuntimeError):
+        # Writer is backed up or shut down: write synchronously instead of losing the event
+        try:
+            backend.worksheet(sheet_audit_log_title).append_row(log_entry)
+            invalidate_sheet(sheet_audit_log_title)
+        except Exception as e:
+            st.error(f"Error logging audit event: {e}")
+
+def read_import_file(uploaded_file):
+    """Reads an uploaded CSV / Excel timesheet file with every cell as text."""
+    if uploaded_file.name.lower().endswith(".xlsx"):
+        return pd.read_excel(uploaded_file, dtype=str).fillna("") # Needs openpyxl
+    return pd.read_csv(uploaded_file, dtype=str, keep_default_na=False)
+
+
+def bulk_import_timesheets(df_upload):
+    """
+    Validates timesheet rows for many users at once and appends the accepted ones
+    in chunks of IMPORT_CHUNK_ROWS. Returns a per-row report (file row, Id, Username,
+    Date, Status, Messages). Raises ValueError if required columns are missing.
+    """
+    user_index = load_user_index(SHEET_ID, sheet_data_key(sheet_user_title))
+    usernames = {user_id: record.get("Username", "") for user_id, record in user_index.items()}
+    df_import, schema_errors = normalize_import(df_upload, usernames)
+
+    df_areas = get_areas_frame()
+    valid_areas = df_areas['AreaName'].astype(str).str.strip().tolist() if 'AreaName' in df_areas.columns else None
+    has_valid_date = schema_errors.map(lambda messages: not any(m.startswith("Invalid date") for m in messages))
+    _, existing_keys = get_presensi_key_index(df_import.loc[has_valid_date, "Date"])
+    if SUBMISSION_JOURNAL:
+        existing_keys = [existing_keys, get_submission_journal()[0].pending_keys()]
+    validation_report = validate_timesheet(df_import, existing_keys=existing_keys, valid_areas=valid_areas)
+
+    messages = {idx: schema_errors[idx] + validation_report.at[idx, "Errors"] for idx in df_import.index}
+    status = pd.Series("Accepted", index=df_import.index)
+    status[validation_report["Duplicate"]] = "Duplicate"
+    status[[idx for idx, items in messages.items() if items]] = "Rejected"
+    for idx in status.index[status == "Duplicate"]:
+        messages[idx].append("Timesheet for this Id and Date already exists.")
+
+    accepted = status.index[status == "Accepted"]
+    rows_to_write = build_presensi_rows(df_import.loc[accepted])
+    for start in range(0, len(rows_to_write), IMPORT_CHUNK_ROWS):
+        chunk_index = accepted[start:start + IMPORT_CHUNK_ROWS]
+        try:
+            append_presensi_rows(rows_to_write[start:start + IMPORT_CHUNK_ROWS])
+            status[chunk_index] = "Imported"
+        except Exception as e:
+            # Stop at the first failed chunk; the rest is reported as not written
+            status[accepted[start:]] = "Failed"
+            for idx in accepted[start:]:
+                messages[idx].append(f"Not written: {e}")
+            break
+    written = [row for row, idx in zip(rows_to_write, accepted) if status[idx] == "Imported"]
+    if written:
+        record_presensi_keys([(row[0], row[2]) for row in written])
+        invalidate_sheet(sheet_presensi_title)
+
+    return pd.DataFrame({
+        "Row": df_import.index + 2, # Line 1 of the file is the header
+        "Id": df_import["Id"],
+        "Username": df_import["Username"],
+        "Date": df_import["Date"],
+        "Status": status,
+        "Messages": [" ".join(messages[idx]).replace("**", "") for idx in df_import.index],
+    }).reset_index(drop=True)
+
+
+def get_areas_frame():
+    """
+    The 'areas' sheet. Areas this session just added or deleted are applied on top until the
+    refreshed snapshot has them, since a write only marks the snapshot stale.
+    """
+    df_areas = get_data_from_sheet(SHEET_ID, sheet_areas_title)
+    edits = st.session_state.get("area_edits")
+    if not edits or edits["stamp"] != sheet_data_key(sheet_areas_title)[1] or 'AreaName' not in df_areas.columns:
+        st.session_state.pop("area_edits", None) # A newer snapshot has them
+        return df_areas
+    names = df_areas['AreaName'].astype(str).str.strip()
+    df_areas = df_areas[~names.isin(edits["deleted"])]
+    existing = set(names)
+    added = [name for name in edits["added"] if name not in existing]
+    if added:
+        df_areas = pd.concat([df_areas, pd.DataFrame({'AreaName': added})], ignore_index=True)
+    return df_areas
+
+
+def record_area_edit(area_name, deleted=False):
+    """Remembers an area write of this session for `get_areas_frame`, after `invalidate_sheet`."""
+    if sheet_areas_title not in SNAPSHOT_REFRESH_SECONDS: # Reloaded on the next read anyway
+        return
+    edits = st.session_state.get("area_edits")
+    stamp = sheet_data_key(sheet_areas_title)[1]
+    if not edits or edits["stamp"] != stamp: # The snapshot was refreshed since: start over
+        edits = {"stamp": stamp, "added": [], "deleted": []}
+    area_name = area_name.strip()
+    edits["added"] = [name for name in edits["added"] if name != area_name]
+    edits["deleted"] = [name for name in edits["deleted"] if name != area_name]
+    edits["deleted" if deleted else "added"].append(area_name)
+    st.session_state.area_edits = edits
+
 
 # NEW: Function to add an area
 def add_area_to_sheet(area_name):
     """Adds a new area to the 'areas' Google Sheet."""
     try:
-        sheet_areas_actual = client.open_by_key(SHEET_ID).worksheet(sheet_areas_title)
+        sheet_areas_actual = backend.worksheet(sheet_areas_title)
         
         # Fetch current areas to check for duplicates (case-insensitive)
-        df_areas = get_data_from_sheet(SHEET_ID, sheet_areas_title)
+        df_areas = get_areas_frame()
         if not df_areas.empty and 'AreaName' in df_areas.columns:
             existing_areas_lower = df_areas['AreaName'].astype(str).str.strip().str.lower().tolist()
             if area_name.strip().lower() in existing_areas_lower:
@@ -197,10 +939,11 @@ def add_area_to_sheet(area_name):
                 return False
         
         sheet_areas_actual.append_row([area_name.strip()])
-        get_data_from_sheet.clear() # Clear cache to refetch new data
+        invalidate_sheet(sheet_areas_title) # Clear cache to refetch new data
+        record_area_edit(area_name)
         st.success(f"Area '{area_name.strip()}' berhasil ditambahkan.")
         return True
-    except gspread.exceptions.WorksheetNotFound:
+    except WorksheetNotFound:
         st.error(f"Worksheet '{sheet_areas_title}' tidak ditemukan. Harap buat worksheet bernama '{sheet_areas_title}' dengan header 'AreaName'.")
         return False
     except Exception as e:
@@ -211,8 +954,8 @@ def add_area_to_sheet(area_name):
 def delete_area_from_sheet(area_name):
     """Deletes an area from the 'areas' Google Sheet."""
     try:
-        sheet_areas_actual = client.open_by_key(SHEET_ID).worksheet(sheet_areas_title)
-        df_areas = get_data_from_sheet(SHEET_ID, sheet_areas_title)
+        sheet_areas_actual = backend.worksheet(sheet_areas_title)
+        df_areas = get_areas_frame()
 
         if df_areas.empty or 'AreaName' not in df_areas.columns:
             st.warning("Tidak ada data area untuk dihapus atau kolom 'AreaName' tidak ditemukan.")
@@ -227,13 +970,14 @@ def delete_area_from_sheet(area_name):
         
         if row_to_delete_idx != -1 and row_to_delete_idx > 1: # Ensure not header row
             sheet_areas_actual.delete_rows(row_to_delete_idx)
-            get_data_from_sheet.clear() # Clear cache to refetch new data
+            invalidate_sheet(sheet_areas_title) # Clear cache to refetch new data
+            record_area_edit(area_name, deleted=True)
             st.success(f"Area '{area_name.strip()}' berhasil dihapus.")
             return True
         else:
             st.warning(f"Area '{area_name.strip()}' tidak ditemukan.")
             return False
-    except gspread.exceptions.WorksheetNotFound:
+    except WorksheetNotFound:
         st.error(f"Worksheet '{sheet_areas_title}' tidak ditemukan.")
         return False
     except Exception as e:
@@ -241,6 +985,57 @@ def delete_area_from_sheet(area_name):
         return False
 
 
+# --- NEW: Paginated table rendering ---
+PAGE_SIZE_OPTIONS = [25, 50, 100, 250, 500]
+
+def show_export_buttons(df, key, file_stem):
+    """Download buttons for the filtered rows; a file is only written (in chunks) when its button is clicked."""
+    export_columns = st.columns(len(available_formats()))
+    for export_column, fmt in zip(export_columns, available_formats()):
+        with export_column:
+            st.download_button(
+                f"⬇️ Export {fmt.upper()} ({len(df)} rows)",
+                data=lambda fmt=fmt: export_frame(df, fmt),
+                file_name=f"{file_stem}.{fmt}",
+                mime=EXPORT_FORMATS[fmt],
+                on_click="ignore",
+                key=f"{key}_export_{fmt}",
+                disabled=df.empty,
+            )
+
+
+def show_paginated_dataframe(df, key, default_sort=None):
+    """Shows one page of `df` with sort / page size / page controls and the total number of rows."""
+    total_rows = len(df)
+    if total_rows == 0:
+        st.dataframe(df, hide_index=True, use_container_width=True)
+        st.caption("0 rows match the current filters.")
+        return
+
+    sort_options = list(df.columns)
+    col_sort, col_order, col_size, col_page = st.columns([0.35, 0.2, 0.2, 0.25])
+    with col_sort:
+        sort_by = st.selectbox("Sort by", sort_options,
+                               index=sort_options.index(default_sort) if default_sort in sort_options else 0,
+                               key=f"{key}_sort_by")
+    with col_order:
+        sort_order = st.selectbox("Order", ["Descending", "Ascending"], key=f"{key}_sort_order")
+    with col_size:
+        page_size = st.selectbox("Rows per page", PAGE_SIZE_OPTIONS, key=f"{key}_page_size")
+
+    total_pages = max(1, -(-total_rows // page_size))
+    page_key = f"{key}_page"
+    if st.session_state.get(page_key, 1) > total_pages: # Filters changed and the old page no longer exists
+        st.session_state[page_key] = total_pages
+    with col_page:
+        page = st.number_input(f"Page (of {total_pages})", min_value=1, max_value=total_pages, step=1, key=page_key)
+
+    df_page = paginate_frame(df, sort_by, sort_order == "Ascending", int(page), page_size)
+    st.dataframe(df_page.reset_index(drop=True), hide_index=True, use_container_width=True)
+    first_row = (int(page) - 1) * page_size + 1
+    st.caption(f"Showing rows {first_row}–{first_row + len(df_page) - 1} of {total_rows} matching rows.")
+
+
 # --- NEW: Function to copy text to clipboard ---
 def copy_to_clipboard_button(text_to_copy, button_label="Salin ke Clipboard"):
     """
@@ -277,6 +1072,9 @@ def copy_to_clipboard_button(text_to_copy, button_label="Salin ke Clipboard"):
     """
     components.html(js_code, height=50) # height bisa disesuaikan
 
+# Starts the audit log retention job with the first session of the process
+get_audit_archive()
+
 # --- Session State for Login ---
 if "user" not in st.session_state:
     st.session_state.user = None
@@ -298,7 +1096,15 @@ if st.session_state.user is None:
     user_id = st.text_input("User ID")
     password = st.text_input("Password", type="password")
     if st.button("Login"):
-        user = check_login(user_id, password)
+        try:
+            user = check_login(user_id, password)
+        except LoginThrottled as e:
+            st.error(f"❌ Too many failed attempts for this User ID. Please try again in {int(e.retry_after // 60) + 1} minute(s).")
+            log_audit_event(user_id, "N/A", "Login", "Failed login attempt (throttled after repeated failures).", "Failed")
+            st.stop()
+        except VerifierBusy:
+            st.warning("⏳ Server is busy verifying other logins. Please try again in a few seconds.")
+            st.stop()
         if user is not None:
             st.session_state.user = user
             st.success("Login successful!")
@@ -339,401 +1145,408 @@ if st.sidebar.button("Logout"):
 allowed_roles_for_audit_log_tab = ["Site Admin", "Commissioning Director"]
 show_audit_log_tab = st.session_state.user["Role"] in allowed_roles_for_audit_log_tab
 
+allowed_roles_for_summary_tab = ["Site Admin", "Commissioning Director"]
+show_summary_tab = st.session_state.user["Role"] in allowed_roles_for_summary_tab
+
 allowed_roles_for_master_edit_tab = ["Site Admin"] # Only Site Admin for Master Edit
 show_master_edit_tab = st.session_state.user["Role"] in allowed_roles_for_master_edit_tab
 
 
 all_possible_tabs_names = ["📝 Timesheet Form", "📊 Activity Log"]
+if show_summary_tab:
+    all_possible_tabs_names.append("📈 Summary")
 if show_audit_log_tab:
     all_possible_tabs_names.append("🔍 Audit Log")
 if show_master_edit_tab:
     all_possible_tabs_names.append("🛠️ Master Edit") # New tab for Master Edit
 all_possible_tabs_names.append("⚙️ User Settings")
 
-# Create tabs dynamically
-tabs_objects = st.tabs(all_possible_tabs_names)
+# Create tabs dynamically; in lazy mode switching tabs reruns the script and the selected tab is tracked
+if LAZY_TABS:
+    tabs_objects = st.tabs(all_possible_tabs_names, key="active_tab", on_change="rerun")
+else:
+    tabs_objects = st.tabs(all_possible_tabs_names)
 
 # Map tab names to their actual tab objects for consistent access
 tab_map = {name: obj for name, obj in zip(all_possible_tabs_names, tabs_objects)}
 
 
-# --- Timesheet Tab ---
-with tab_map["📝 Timesheet Form"]:
-    st.header("📝 Online Timesheet Form")
-    today = datetime.today()
+def tab_is_open(tab_name):
+    """In lazy mode only the selected tab loads its data and renders; otherwise every tab runs."""
+    return not LAZY_TABS or tab_map[tab_name].open
 
-    col_start_date, col_end_date = st.columns(2)
 
-    with col_start_date:
-        start_date = st.date_input("Start Date", today - timedelta(days=6))
+# --- Timesheet Tab ---
+if tab_is_open("📝 Timesheet Form"):
+    with tab_map["📝 Timesheet Form"]:
+        st.header("📝 Online Timesheet Form")
+        today = datetime.today()
 
-    with col_end_date:
-        end_date = st.date_input("End Date", today)
+        col_start_date, col_end_date = st.columns(2)
 
-    date_list = get_date_range(start_date, end_date)
-    st.markdown(f"**Date Range:** {start_date.strftime('%d-%b-%Y')} ➜ {end_date.strftime('%d-%b-%Y')}")
+        with col_start_date:
+            start_date = st.date_input("Start Date", today - timedelta(days=6))
 
-    all_shift_opts = ["Day Shift", "Night Shift", "Noon Shift"]
+        with col_end_date:
+            end_date = st.date_input("End Date", today)
 
-    user_preferred_shift = st.session_state.user.get("Preferred Shift", "Day Shift")
-    if user_preferred_shift not in all_shift_opts:
-        user_preferred_shift = "Day Shift"
+        date_list = get_date_range(start_date, end_date)
+        st.markdown(f"**Date Range:** {start_date.strftime('%d-%b-%Y')} ➜ {end_date.strftime('%d-%b-%Y')}")
 
-    shift_opts_ordered = [user_preferred_shift] + [s for s in all_shift_opts if s != user_preferred_shift]
+        all_shift_opts = SHIFT_OPTIONS
 
-    # NEW: Fetch areas from Google Sheet
-    df_areas = get_data_from_sheet(SHEET_ID, sheet_areas_title)
-    if not df_areas.empty and 'AreaName' in df_areas.columns:
-        all_area_opts = df_areas['AreaName'].astype(str).tolist()
-    else:
-        # Fallback to hardcoded if sheet is empty or column missing
-        all_area_opts = ["GCP", "ER", "ET", "SC", "SM", "SAP"]
-        st.warning(f"Tidak dapat memuat daftar area dari sheet '{sheet_areas_title}'. Menggunakan daftar default.")
-
-
-    user_preferred_areas_str = st.session_state.user.get("Preferred Areas", "")
-    if user_preferred_areas_str:
-        preferred_areas_list = [a.strip() for a in user_preferred_areas_str.split(',') if a.strip()]
-        area_opts = [area for area in preferred_areas_list if area in all_area_opts]
-        for area in all_area_opts:
-            if area not in area_opts:
-                area_opts.append(area)
-    else:
-        area_opts = all_area_opts
-
-    initial_data = []
-    for date in date_list:
-        initial_data.append({
-            "Date": date.strftime("%Y-%m-%d"),
-            "Day": get_day_name(date),
-            "Hours": 0.0,
-            "Overtime": 0.0,
-            "Area 1": area_opts[0] if area_opts else "",
-            "Area 2": "",
-            "Area 3": "",
-            "Area 4": "",
-            "Shift": user_preferred_shift,
-            "Remark": ""
-        })
-
-    df_presensi_input = pd.DataFrame(initial_data)
-
-    st.subheader("Enter Timesheet Details")
-
-    # --- START OF CHANGE FOR DYNAMIC AREA COLUMNS ---
-    # Get user's preferred number of area columns, default to 1 if not set or invalid
-    num_area_cols_preference = int(st.session_state.user.get("Number of Areas", 1))
-    if num_area_cols_preference < 1 or num_area_cols_preference > 4:
-        num_area_cols_preference = 1 # Fallback to 1 if outside valid range
-
-    # Define column configurations for data_editor
-    column_configs = {
-        "Date": st.column_config.Column("Date", help="Date of timesheet entry", disabled=True),
-        "Day": st.column_config.Column("Day", help="Day of the week", disabled=True),
-        "Hours": st.column_config.NumberColumn("Working Hours", min_value=0.0, max_value=24.0, step=0.5, format="%.1f", help="Total working hours (0-24 hours)"),
-        "Overtime": st.column_config.NumberColumn("Overtime Hours", min_value=0.0, max_value=24.0, step=0.5, format="%.1f", help="Total overtime hours (0-24 hours)"),
-        "Area 1": st.column_config.SelectboxColumn("Area 1", options=area_opts, required=True, default=area_opts[0] if area_opts else ""),
-        "Area 2": st.column_config.SelectboxColumn("Area 2", options=[""] + area_opts, required=False, default="", help="Additional work area (optional)"),
-        "Area 3": st.column_config.SelectboxColumn("Area 3", options=[""] + area_opts, required=False, default="", help="Additional work area (optional)"),
-        "Area 4": st.column_config.SelectboxColumn("Area 4", options=[""] + area_opts, required=False, default="", help="Additional work area (optional)"),
-        "Shift": st.column_config.SelectboxColumn("Shift", options=shift_opts_ordered, required=True, default=user_preferred_shift),
-        "Remark": st.column_config.TextColumn("Remarks", help="E.g., Day off / Travel"),
-    }
-
-    # Dynamically build column_order based on preference
-    column_order = ["Date", "Day", "Hours", "Overtime", "Area 1"]
-    for i in range(2, num_area_cols_preference + 1):
-        column_order.append(f"Area {i}")
-    column_order.extend(["Shift", "Remark"])
-
-    edited_df = st.data_editor(
-        df_presensi_input,
-        column_config=column_configs,
-        column_order=column_order, # Use the dynamically built order
-        hide_index=True,
-        num_rows="fixed",
-        use_container_width=True
-    )
-    # --- END OF CHANGE FOR DYNAMIC AREA COLUMNS ---
-
-    if st.button("📤 Submit Timesheet"):
-        final_data_to_submit = []
-        duplicate_entries_found = []
-        validation_errors = []
-
-        get_data_from_sheet.clear()
-        df_existing_presensi = get_data_from_sheet(SHEET_ID, sheet_presensi_title)
-
-        # Check if df_existing_presensi is empty or crucial columns are missing before proceeding
-        if df_existing_presensi.empty:
-            st.info("Tidak ada data timesheet yang ada di Google Sheet untuk perbandingan duplikat.")
-        elif 'Id' not in df_existing_presensi.columns:
-            st.error("Error: Kolom 'Id' tidak ditemukan di data presensi yang ada. Pastikan header di Google Sheet 'presensi' sudah benar.")
-            validation_errors.append("Critical Error: Missing 'Id' column in existing timesheet data.")
-        elif 'Date' not in df_existing_presensi.columns:
-            st.error("Error: Kolom 'Date' tidak ditemukan di data presensi yang ada. Pastikan header di Google Sheet 'presensi' sudah benar.")
-            validation_errors.append("Critical Error: Missing 'Date' column in existing timesheet data.")
+        user_preferred_shift = st.session_state.user.get("Preferred Shift", "Day Shift")
+        if user_preferred_shift not in all_shift_opts:
+            user_preferred_shift = "Day Shift"
 
-        current_user_id = st.session_state.user["Id"]
-        current_username = st.session_state.user["Username"]
+        shift_opts_ordered = [user_preferred_shift] + [s for s in all_shift_opts if s != user_preferred_shift]
 
-        if not validation_errors: # Only proceed if no critical column errors
-            for index, row in edited_df.iterrows():
-                entry_date_str = row["Date"]
+        # NEW: Fetch areas from Google Sheet
+        df_areas = get_areas_frame()
+        if not df_areas.empty and 'AreaName' in df_areas.columns:
+            all_area_opts = df_areas['AreaName'].astype(str).tolist()
+        else:
+            # Fallback to hardcoded if sheet is empty or column missing
+            all_area_opts = ["GCP", "ER", "ET", "SC", "SM", "SAP"]
+            st.warning(f"Tidak dapat memuat daftar area dari sheet '{sheet_areas_title}'. Menggunakan daftar default.")
+
+
+        user_preferred_areas_str = st.session_state.user.get("Preferred Areas", "")
+        if user_preferred_areas_str:
+            preferred_areas_list = [a.strip() for a in user_preferred_areas_str.split(',') if a.strip()]
+            area_opts = [area for area in preferred_areas_list if area in all_area_opts]
+            for area in all_area_opts:
+                if area not in area_opts:
+                    area_opts.append(area)
+        else:
+            area_opts = all_area_opts
+
+        initial_data = []
+        for date in date_list:
+            initial_data.append({
+                "Date": date.strftime("%Y-%m-%d"),
+                "Day": get_day_name(date),
+                "Hours": 0.0,
+                "Overtime": 0.0,
+                "Area 1": area_opts[0] if area_opts else "",
+                "Area 2": "",
+                "Area 3": "",
+                "Area 4": "",
+                "Shift": user_preferred_shift,
+                "Remark": ""
+            })
+
+        df_presensi_input = pd.DataFrame(initial_data)
+
+        st.subheader("Enter Timesheet Details")
+
+        # --- START OF CHANGE FOR DYNAMIC AREA COLUMNS ---
+        # Get user's preferred number of area columns, default to 1 if not set or invalid
+        num_area_cols_preference = int(st.session_state.user.get("Number of Areas", 1))
+        if num_area_cols_preference < 1 or num_area_cols_preference > 4:
+            num_area_cols_preference = 1 # Fallback to 1 if outside valid range
+
+        # Define column configurations for data_editor
+        column_configs = {
+            "Date": st.column_config.Column("Date", help="Date of timesheet entry", disabled=True),
+            "Day": st.column_config.Column("Day", help="Day of the week", disabled=True),
+            "Hours": st.column_config.NumberColumn("Working Hours", min_value=0.0, max_value=24.0, step=0.5, format="%.1f", help="Total working hours (0-24 hours)"),
+            "Overtime": st.column_config.NumberColumn("Overtime Hours", min_value=0.0, max_value=24.0, step=0.5, format="%.1f", help="Total overtime hours (0-24 hours)"),
+            "Area 1": st.column_config.SelectboxColumn("Area 1", options=area_opts, required=True, default=area_opts[0] if area_opts else ""),
+            "Area 2": st.column_config.SelectboxColumn("Area 2", options=[""] + area_opts, required=False, default="", help="Additional work area (optional)"),
+            "Area 3": st.column_config.SelectboxColumn("Area 3", options=[""] + area_opts, required=False, default="", help="Additional work area (optional)"),
+            "Area 4": st.column_config.SelectboxColumn("Area 4", options=[""] + area_opts, required=False, default="", help="Additional work area (optional)"),
+            "Shift": st.column_config.SelectboxColumn("Shift", options=shift_opts_ordered, required=True, default=user_preferred_shift),
+            "Remark": st.column_config.TextColumn("Remarks", help="E.g., Day off / Travel"),
+        }
+
+        # Dynamically build column_order based on preference
+        column_order = ["Date", "Day", "Hours", "Overtime", "Area 1"]
+        for i in range(2, num_area_cols_preference + 1):
+            column_order.append(f"Area {i}")
+        column_order.extend(["Shift", "Remark"])
+
+        edited_df = st.data_editor(
+            df_presensi_input,
+            column_config=column_configs,
+            column_order=column_order, # Use the dynamically built order
+            hide_index=True,
+            num_rows="fixed",
+            use_container_width=True
+        )
+        # --- END OF CHANGE FOR DYNAMIC AREA COLUMNS ---
+
+        if st.button("📤 Submit Timesheet"):
+            final_data_to_submit = []
+            duplicate_entries_found = []
+            validation_errors = []
 
-                hours = 0.0
-                overtime = 0.0
+            if SUBMISSION_JOURNAL:
+                # Only keys already in memory: submitting must not wait on (or fail with) the sheet
+                existing_presensi_columns, existing_presensi_keys = get_cached_presensi_keys(edited_df["Date"])
+            else:
                 try:
-                    hours = float(row["Hours"])
-                    overtime = float(row["Overtime"])
-                    if hours < 0 or overtime < 0:
-                        validation_errors.append(f"Hours or Overtime cannot be negative on Date: **{entry_date_str}**.")
-                except ValueError:
-                    validation_errors.append(f"Invalid numeric input for Hours or Overtime on Date: **{entry_date_str}**.")
-
-                if (hours + overtime) > 24.01:
-                    validation_errors.append(f"Total hours (Working Hours + Overtime) on Date: **{entry_date_str}** exceeds 24 hours. Please correct.")
-
-                if not row["Area 1"] or str(row["Area 1"]).strip() == "":
-                    validation_errors.append(f"**Area 1** cannot be empty on Date: **{entry_date_str}**.")
-
-                # Only check for duplicates if df_existing_presensi is not empty and has required columns
-                is_duplicate = False
-                if not df_existing_presensi.empty and 'Id' in df_existing_presensi.columns and 'Date' in df_existing_presensi.columns:
-                    is_duplicate = df_existing_presensi[
-                        (df_existing_presensi['Id'].astype(str) == str(current_user_id)) &
-                        (df_existing_presensi['Date'].astype(str) == entry_date_str)
-                    ].empty is False
-
-                if is_duplicate:
-                    duplicate_entries_found.append(entry_date_str)
-                else:
-                    entry = {
-                        "Id": current_user_id,
-                        "Username": st.session_state.user["Username"],
-                        "Date": entry_date_str,
-                        "Day": row["Day"],
-                        "Hours": hours,
-                        "Overtime": overtime,
-                        "Area 1": row["Area 1"],
-                        "Area 2": row["Area 2"],
-                        "Area 3": row["Area 3"],
-                        "Area 4": row["Area 4"],
-                        "Shift": row["Shift"],
-                        "Remark": row["Remark"],
-                    }
-                    final_data_to_submit.append([
-                        entry["Id"], entry["Username"], entry["Date"], entry["Day"],
-                        entry["Hours"], entry["Overtime"],
-                        entry["Area 1"], entry["Area 2"], entry["Area 3"], entry["Area 4"],
-                        entry["Shift"], entry["Remark"]
-                    ])
-
-        if validation_errors:
-            for error in validation_errors:
-                st.error(f"❗ Input Error: {error}")
-            st.warning("Please correct the errors and resubmit.")
-            log_audit_event(current_user_id, current_username, "Timesheet Submission",
-                            f"Failed to submit timesheet for dates: {', '.join([row['Date'] for _, row in edited_df.iterrows()])} due to validation errors.",
-                            "Failed")
-
-        if duplicate_entries_found:
-            st.error(f"❌ Submission Failed: Timesheet for the following dates already exists for user {current_user_id}: **{', '.join(duplicate_entries_found)}**. Please edit existing entries via Activity Log if needed.")
-            log_audit_event(current_user_id, current_username, "Timesheet Submission",
-                            f"Failed to submit timesheet for dates: {', '.join(duplicate_entries_found)} due to duplicate entries.",
-                            "Failed")
-
-        if not validation_errors and not duplicate_entries_found and final_data_to_submit:
-            try:
-                sheet_presensi_actual = client.open_by_key(SHEET_ID).worksheet(sheet_presensi_title)
-                sheet_presensi_actual.append_rows(final_data_to_submit)
-                get_data_from_sheet.clear()
-                st.success("✅ Timesheet successfully submitted!")
+                    existing_presensi_columns, existing_presensi_keys = get_presensi_key_index(edited_df["Date"])
+                except Exception as e:
+                    existing_presensi_columns, existing_presensi_keys = SHEET_HEADERS["presensi"], set()
+                    validation_errors.append(f"Could not read sheet '{sheet_presensi_title}' to check for duplicates ({e}). Please try again.")
+
+            # Check if the existing presensi data is empty or crucial columns are missing before proceeding
+            if not existing_presensi_columns:
+                st.info("Tidak ada data timesheet yang ada di Google Sheet untuk perbandingan duplikat.")
+            elif 'Id' not in existing_presensi_columns:
+                st.error("Error: Kolom 'Id' tidak ditemukan di data presensi yang ada. Pastikan header di Google Sheet 'presensi' sudah benar.")
+                validation_errors.append("Critical Error: Missing 'Id' column in existing timesheet data.")
+            elif 'Date' not in existing_presensi_columns:
+                st.error("Error: Kolom 'Date' tidak ditemukan di data presensi yang ada. Pastikan header di Google Sheet 'presensi' sudah benar.")
+                validation_errors.append("Critical Error: Missing 'Date' column in existing timesheet data.")
+
+            current_user_id = st.session_state.user["Id"]
+            current_username = st.session_state.user["Username"]
+
+            if not validation_errors: # Only proceed if no critical column errors
+                # All rules run column-wise over the whole edited frame
+                df_to_submit = edited_df.assign(Id=current_user_id, Username=current_username)
+                if SUBMISSION_JOURNAL:
+                    # Entries still waiting in the journal count as existing too
+                    existing_presensi_keys = [existing_presensi_keys, get_submission_journal()[0].pending_keys()]
+                validation_report = validate_timesheet(df_to_submit, existing_keys=existing_presensi_keys)
+                validation_errors.extend(message for messages in validation_report["Errors"] for message in messages)
+                duplicate_entries_found = validation_report.loc[validation_report["Duplicate"], "Date"].tolist()
+                final_data_to_submit = build_presensi_rows(df_to_submit[~validation_report["Duplicate"]])
+
+            if validation_errors:
+                for error in validation_errors:
+                    st.error(f"❗ Input Error: {error}")
+                st.warning("Please correct the errors and resubmit.")
                 log_audit_event(current_user_id, current_username, "Timesheet Submission",
-                                f"Successfully submitted timesheet for dates: {', '.join([entry[2] for entry in final_data_to_submit])}.")
+                                f"Failed to submit timesheet for dates: {', '.join(edited_df['Date'].astype(str))} due to validation errors.",
+                                "Failed")
 
-                # --- NEW: "Klik me and paste to your email" feature ---
-                st.subheader("Bagikan Konfirmasi Timesheet")
-                summary_text = f"Halo,\n\nSaya, {current_username} (ID: {current_user_id}), telah berhasil mengisi timesheet untuk periode {start_date.strftime('%d-%b-%Y')} hingga {end_date.strftime('%d-%b-%Y')}.\n\nTotal entri baru: {len(final_data_to_submit)}.\n\nTerima kasih atas perhatiannya."
+            if duplicate_entries_found:
+                st.error(f"❌ Submission Failed: Timesheet for the following dates already exists for user {current_user_id}: **{', '.join(duplicate_entries_found)}**. Please edit existing entries via Activity Log if needed.")
+                log_audit_event(current_user_id, current_username, "Timesheet Submission",
+                                f"Failed to submit timesheet for dates: {', '.join(duplicate_entries_found)} due to duplicate entries.",
+                                "Failed")
 
-                st.text_area("Konten Konfirmasi untuk Dibagikan:", summary_text, height=150, disabled=True)
+            if not validation_errors and not duplicate_entries_found and final_data_to_submit:
+                try:
+                    if SUBMISSION_JOURNAL:
+                        # Durable local write; the replayer pushes it to the sheet right after
+                        journal, replayer = get_submission_journal()
+                        journal.append(final_data_to_submit)
+                        replayer.wake()
+                    else:
+                        append_presensi_rows(final_data_to_submit)
+                        record_presensi_keys([(entry[0], entry[2]) for entry in final_data_to_submit])
+                        invalidate_sheet(sheet_presensi_title)
+                    st.success("✅ Timesheet successfully submitted!")
+                    log_audit_event(current_user_id, current_username, "Timesheet Submission",
+                                    f"Successfully submitted timesheet for dates: {', '.join([entry[2] for entry in final_data_to_submit])}.")
+
+                    # --- NEW: "Klik me and paste to your email" feature ---
+                    st.subheader("Bagikan Konfirmasi Timesheet")
+                    summary_text = f"Halo,\n\nSaya, {current_username} (ID: {current_user_id}), telah berhasil mengisi timesheet untuk periode {start_date.strftime('%d-%b-%Y')} hingga {end_date.strftime('%d-%b-%Y')}.\n\nTotal entri baru: {len(final_data_to_submit)}.\n\nTerima kasih atas perhatiannya."
+
+                    st.text_area("Konten Konfirmasi untuk Dibagikan:", summary_text, height=150, disabled=True)
                 
-                col_copy, col_email = st.columns([0.3, 0.7])
-                with col_copy:
-                    copy_to_clipboard_button(summary_text, "Salin ke Clipboard")
+                    col_copy, col_email = st.columns([0.3, 0.7])
+                    with col_copy:
+                        copy_to_clipboard_button(summary_text, "Salin ke Clipboard")
                 
-                with col_email:
-                    import urllib.parse
-                    # Ganti dengan email penerima default yang sesuai (misal: supervisor atau HR)
-                    recipient_email = "your.supervisor@example.com"
-                    email_subject = f"Konfirmasi Timesheet {current_username} ({start_date.strftime('%d-%m-%Y')} - {end_date.strftime('%d-%m-%Y')})"
+                    with col_email:
+                        import urllib.parse
+                        # Ganti dengan email penerima default yang sesuai (misal: supervisor atau HR)
+                        recipient_email = "your.supervisor@example.com"
+                        email_subject = f"Konfirmasi Timesheet {current_username} ({start_date.strftime('%d-%m-%Y')} - {end_date.strftime('%d-%m-%Y')})"
                     
-                    encoded_subject = urllib.parse.quote(email_subject)
-                    encoded_body = urllib.parse.quote(summary_text + "\n\n(Dikirim otomatis dari aplikasi timesheet)")
-                    mailto_link = f"mailto:{recipient_email}?subject={encoded_subject}&body={encoded_body}"
+                        encoded_subject = urllib.parse.quote(email_subject)
+                        encoded_body = urllib.parse.quote(summary_text + "\n\n(Dikirim otomatis dari aplikasi timesheet)")
+                        mailto_link = f"mailto:{recipient_email}?subject={encoded_subject}&body={encoded_body}"
                     
-                    st.markdown(f"[Klik untuk Kirim Email Otomatis]({mailto_link})")
-                    st.caption("Ini akan membuka aplikasi email default Anda dengan draf email yang sudah terisi.")
-                # --- END NEW FEATURE ---
+                        st.markdown(f"[Klik untuk Kirim Email Otomatis]({mailto_link})")
+                        st.caption("Ini akan membuka aplikasi email default Anda dengan draf email yang sudah terisi.")
+                    # --- END NEW FEATURE ---
 
-                st.rerun()
-            except Exception as e:
-                st.error(f"Error submitting timesheet: {e}")
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"Error submitting timesheet: {e}")
+                    log_audit_event(current_user_id, current_username, "Timesheet Submission",
+                                    f"Failed to submit timesheet due to system error: {e}", "Failed")
+            elif not final_data_to_submit and not validation_errors and not duplicate_entries_found:
+                st.info("💡 No new timesheet entries to submit (all might be duplicates or zero rows).")
                 log_audit_event(current_user_id, current_username, "Timesheet Submission",
-                                f"Failed to submit timesheet due to system error: {e}", "Failed")
-        elif not final_data_to_submit and not validation_errors and not duplicate_entries_found:
-            st.info("💡 No new timesheet entries to submit (all might be duplicates or zero rows).")
-            log_audit_event(current_user_id, current_username, "Timesheet Submission",
-                            "Attempted submission with no new entries (possibly all duplicates or empty range).", "Info")
+                                "Attempted submission with no new entries (possibly all duplicates or empty range).", "Info")
 
 
 # --- Activity Log Tab (For All Users) ---
-with tab_map["📊 Activity Log"]:
-    st.header("📊 All Users Activity Log")
-
-    col_log_start, col_log_end = st.columns(2)
-
-    with col_log_start:
-        log_start_date = st.date_input("Log Start Date", datetime.today() - timedelta(days=7), key="all_log_start_date")
+if tab_is_open("📊 Activity Log"):
+    with tab_map["📊 Activity Log"]:
+        st.header("📊 All Users Activity Log")
 
-    with col_log_end:
-        log_end_date = st.date_input("Log End Date", datetime.today(), key="all_log_end_date")
+        col_log_start, col_log_end = st.columns(2)
 
-    df_log_all = get_data_from_sheet(SHEET_ID, sheet_presensi_title)
+        with col_log_start:
+            log_start_date = st.date_input("Log Start Date", datetime.today() - timedelta(days=7), key="all_log_start_date")
 
-    df_filtered_all_log = pd.DataFrame() # Initialize empty DataFrame
+        with col_log_end:
+            log_end_date = st.date_input("Log End Date", datetime.today(), key="all_log_end_date")
 
-    if 'Date' in df_log_all.columns:
-        df_log_all['Date'] = pd.to_datetime(df_log_all['Date'], errors='coerce')
-        df_filtered_all_log = df_log_all[(df_log_all['Date'] >= pd.to_datetime(log_start_date)) &
-                                         (df_log_all['Date'] <= pd.to_datetime(log_end_date))]
-    else:
-        st.warning("Kolom 'Date' tidak ditemukan di sheet 'presensi' untuk filtering. Menampilkan semua data log yang tersedia.")
-        df_filtered_all_log = df_log_all.copy()
+        df_log_all, presensi_indexes = get_presensi_snapshot(log_start_date, log_end_date)
+        if sheet_presensi_title in SNAPSHOT_REFRESH_SECONDS and not PRESENSI_PARTITIONED:
+            show_snapshot_age(sheet_presensi_title)
 
-    st.subheader("Filter Activity Log")
-    col_filter_user, col_filter_shift, col_filter_area = st.columns(3)
+        st.subheader("Filter Activity Log")
+        col_filter_user, col_filter_shift, col_filter_area = st.columns(3)
 
-    with col_filter_user:
-        allowed_roles_for_all_users = ["Site Admin", "Commissioning Director"]
-        is_admin_or_director = st.session_state.user["Role"] in allowed_roles_for_all_users
+        with col_filter_user:
+            allowed_roles_for_all_users = ["Site Admin", "Commissioning Director"]
+            is_admin_or_director = st.session_state.user["Role"] in allowed_roles_for_all_users
 
-        if 'Username' in df_filtered_all_log.columns:
-            all_usernames_options = sorted(df_filtered_all_log['Username'].unique().tolist())
-        else:
-            all_usernames_options = []
-            st.warning("Kolom 'Username' tidak ditemukan di log aktivitas.")
-
-        if is_admin_or_director:
-            # Admins/Directors can see all users
-            select_options = ["All"] + all_usernames_options
-            default_index = 0 # Default to "All"
-            selected_username = st.selectbox(
-                "Filter by User",
-                options=select_options,
-                index=default_index,
-                key="filter_user_admin" # Unique key
-            )
-        else:
-            # Other users only see their own data
-            current_user_username = st.session_state.user["Username"]
-            select_options = [current_user_username]
-            default_index = 0 # Only option is their own username
-            selected_username = st.selectbox(
-                "Filter by User",
-                options=select_options,
-                index=default_index,
-                disabled=True, # Disable the selectbox
-                key="filter_user_restricted" # Unique key
-            )
-            # The filtering logic below will automatically pick up current_user_username
-            # because selected_username is set to it.
+            if 'Username' in df_log_all.columns:
+                # Options come straight from the index keys, no unique() over the frame
+                all_usernames_options = presensi_indexes["Username"].keys()
+            else:
+                all_usernames_options = []
+                st.warning("Kolom 'Username' tidak ditemukan di log aktivitas.")
+
+            if is_admin_or_director:
+                # Admins/Directors can see all users
+                select_options = ["All"] + all_usernames_options
+                default_index = 0 # Default to "All"
+                selected_username = st.selectbox(
+                    "Filter by User",
+                    options=select_options,
+                    index=default_index,
+                    key="filter_user_admin" # Unique key
+                )
+            else:
+                # Other users only see their own data
+                current_user_username = st.session_state.user["Username"]
+                select_options = [current_user_username]
+                default_index = 0 # Only option is their own username
+                selected_username = st.selectbox(
+                    "Filter by User",
+                    options=select_options,
+                    index=default_index,
+                    disabled=True, # Disable the selectbox
+                    key="filter_user_restricted" # Unique key
+                )
+                # The filtering logic below will automatically pick up current_user_username
+                # because selected_username is set to it.
 
-    with col_filter_shift:
-        if 'Shift' in df_filtered_all_log.columns:
-            all_shifts = ["All"] + sorted(df_filtered_all_log['Shift'].unique().tolist())
+        with col_filter_shift:
+            if 'Shift' in df_log_all.columns:
+                all_shifts = ["All"] + presensi_indexes["Shift"].keys()
+            else:
+                all_shifts = ["All"]
+                st.warning("Kolom 'Shift' tidak ditemukan di log aktivitas.")
+            selected_shift = st.selectbox("Filter by Shift", all_shifts)
+
+        with col_filter_area:
+            # The 'Area' index covers Area 1..Area 4
+            all_areas_in_log = ["All"] + presensi_indexes["Area"].keys()
+            selected_area = st.selectbox("Filter by Area", all_areas_in_log)
+
+        # --- Filtering logic: intersect the row positions of the selected index entries ---
+        # For non-admins selected_username is always their own username
+        selections = {index_name: selected_value for index_name, selected_value
+                      in [("Username", selected_username), ("Shift", selected_shift), ("Area", selected_area)]
+                      if selected_value != "All"}
+        selected_positions = select_positions(presensi_indexes, selections) # None means no index filter, i.e. all rows
+
+        df_filtered_all_log = df_log_all if selected_positions is None else df_log_all.iloc[selected_positions]
+
+        if 'Date' in df_filtered_all_log.columns:
+            # 'Date' is already datetime64, parsed once when presensi was loaded
+            df_filtered_all_log = df_filtered_all_log[(df_filtered_all_log['Date'] >= pd.to_datetime(log_start_date)) &
+                                                      (df_filtered_all_log['Date'] <= pd.to_datetime(log_end_date))]
         else:
-            all_shifts = ["All"]
-            st.warning("Kolom 'Shift' tidak ditemukan di log aktivitas.")
-        selected_shift = st.selectbox("Filter by Shift", all_shifts)
-
-    with col_filter_area:
-        all_areas_in_log = []
-        for col_name in ["Area 1", "Area 2", "Area 3", "Area 4"]:
-            if col_name in df_filtered_all_log.columns:
-                all_areas_in_log.extend(df_filtered_all_log[col_name].dropna().unique().tolist())
-        all_areas_in_log = ["All"] + sorted(list(set(all_areas_in_log)))
-        selected_area = st.selectbox("Filter by Area", all_areas_in_log)
-
-    # --- Filtering logic, now robust due to dynamic selected_username ---
-    if selected_username != "All": # This will correctly filter for admins (when "All" is not selected)
-                                  # and for non-admins (where selected_username is always their own username)
-        df_filtered_all_log = df_filtered_all_log[df_filtered_all_log['Username'] == selected_username]
-
-    if selected_shift != "All":
-        df_filtered_all_log = df_filtered_all_log[df_filtered_all_log['Shift'] == selected_shift]
-
-    if selected_area != "All":
-        df_filtered_all_log = df_filtered_all_log[
-            (df_filtered_all_log.get('Area 1', pd.Series()) == selected_area) | # Using .get() for robustness
-            (df_filtered_all_log.get('Area 2', pd.Series()) == selected_area) |
-            (df_filtered_all_log.get('Area 3', pd.Series()) == selected_area) |
-            (df_filtered_all_log.get('Area 4', pd.Series()) == selected_area)
+            st.warning("Kolom 'Date' tidak ditemukan di sheet 'presensi' untuk filtering. Menampilkan semua data log yang tersedia.")
+
+        # Submissions not in the loaded data yet are shown from the journal; there are only a few, so plain masks are enough
+        df_pending_log = get_pending_presensi_frame()
+        if not df_pending_log.empty:
+            pending_mask = ((df_pending_log['Date'] >= pd.to_datetime(log_start_date)) &
+                            (df_pending_log['Date'] <= pd.to_datetime(log_end_date)))
+            if selected_username != "All":
+                pending_mask &= df_pending_log['Username'] == selected_username
+            if selected_shift != "All":
+                pending_mask &= df_pending_log['Shift'] == selected_shift
+            if selected_area != "All":
+                pending_mask &= (df_pending_log[["Area 1", "Area 2", "Area 3", "Area 4"]] == selected_area).any(axis=1)
+            df_pending_log = df_pending_log[pending_mask]
+            if not df_pending_log.empty:
+                # Entries the loaded data already has (e.g. committed while it was downloading) are not shown twice
+                shown_keys = key_index(df_filtered_all_log, PRESENSI_KEY_COLUMNS)
+                pending_keys = zip(df_pending_log["Id"].astype(str), df_pending_log["Date"].dt.strftime("%Y-%m-%d"))
+                df_pending_log = df_pending_log[[key not in shown_keys for key in pending_keys]]
+            if not df_pending_log.empty:
+                df_filtered_all_log = concat_typed(df_filtered_all_log, df_pending_log, PRESENSI_SCHEMA)
+                st.caption(f"⏳ {len(df_pending_log)} entri baru belum ada di data yang dimuat dari Google Sheet, ditampilkan dari antrean lokal.")
+
+        columns_to_display_all = [
+            "Username",
+            "Date",
+            "Day", "Hours", "Overtime",
+            "Area 1", "Area 2", "Area 3", "Area 4",
+            "Shift", "Remark"
         ]
 
-    columns_to_display_all = [
-        "Username",
-        "Date",
-        "Day", "Hours", "Overtime",
-        "Area 1", "Area 2", "Area 3", "Area 4",
-        "Shift", "Remark"
-    ]
-
-    existing_columns_all = [col for col in columns_to_display_all if col in df_filtered_all_log.columns]
-
-    # --- FIX: Conditionally sort only if 'Date' column exists ---
-    if 'Date' in df_filtered_all_log.columns:
-        st.dataframe(
-            df_filtered_all_log[existing_columns_all]
-            .sort_values(by="Date", ascending=False, na_position='last')
-            .reset_index(drop=True),
-            hide_index=True,
-            use_container_width=True
-        )
-    else:
-        st.dataframe(
-            df_filtered_all_log[existing_columns_all]
-            .reset_index(drop=True), # Display without sorting if 'Date' is missing
-            hide_index=True,
-            use_container_width=True
-        )
-        st.warning("Data log tidak dapat diurutkan berdasarkan 'Date' karena kolom tersebut tidak ditemukan.")
+        existing_columns_all = [col for col in columns_to_display_all if col in df_filtered_all_log.columns]
+
+        # Only the requested page is sorted, sliced and sent to the browser
+        show_paginated_dataframe(df_filtered_all_log[existing_columns_all], key="activity_log", default_sort="Date")
+        show_export_buttons(df_filtered_all_log[existing_columns_all], key="activity_log",
+                            file_stem=f"activity_log_{log_start_date:%Y%m%d}_{log_end_date:%Y%m%d}")
+
+
+# --- Summary Tab (Supervisors) ---
+if show_summary_tab and tab_is_open("📈 Summary"):
+    with tab_map["📈 Summary"]:
+        st.header("📈 Hours Summary")
+        st.markdown("Total Hours and Overtime from the timesheet, kept up to date as entries are submitted.")
+
+        summary_dimension = st.selectbox("Group by", options=list(DIMENSIONS),
+                                         format_func=lambda dimension: DIMENSIONS[dimension][0], key="summary_dimension")
+        if summary_dimension == "area":
+            st.caption("Jika satu entri punya beberapa area, Hours dan Overtime dibagi rata ke setiap area (Area 1..Area 4).")
+
+        df_summary = get_presensi_rollup().frame(summary_dimension)
+        if df_summary.empty:
+            st.info("Belum ada data timesheet untuk diringkas.")
+        else:
+            show_paginated_dataframe(df_summary, key="summary", default_sort="Hours")
 
 
 # --- Audit Log Tab ---
-if show_audit_log_tab: # This block is now conditional
+if show_audit_log_tab and tab_is_open("🔍 Audit Log"): # This block is now conditional
     with tab_map["🔍 Audit Log"]:
         st.header("🔍 System Audit Log")
         st.markdown("This log records significant actions performed within the application.")
+        pending_audit_events = get_audit_log_writer().pending
+        if pending_audit_events:
+            st.caption(f"⏳ {pending_audit_events} audit event(s) pending write.")
+        request_counters = backend.scheduler.counters
+        st.caption(f"Sheets API requests: {request_counters['calls']} sent, {request_counters['throttled']} throttled, "
+                   f"{request_counters['retried']} retried, {request_counters['coalesced']} coalesced, {request_counters['failed']} failed.")
+        cache_fill = get_cache_fill()
+        st.caption(f"Cache fills: {cache_fill.loads} loads, {cache_fill.saved} duplicate loads saved.")
+        if backend.timings:
+            st.caption("Startup: " + ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in backend.timings.items()) + ".")
 
         df_audit_log = get_data_from_sheet(SHEET_ID, sheet_audit_log_title)
+        if sheet_audit_log_title in SNAPSHOT_REFRESH_SECONDS:
+            show_snapshot_age(sheet_audit_log_title)
 
         if not df_audit_log.empty:
-            expected_audit_cols = ["Timestamp", "User ID", "Username", "Action", "Description", "Status"]
-            # Filter df_audit_log to only include columns that are in expected_audit_cols AND exist in the DataFrame
-            df_audit_log_display = df_audit_log[[col for col in expected_audit_cols if col in df_audit_log.columns]]
-            
             # Check if any expected columns are missing
-            for col in expected_audit_cols:
+            for col in AUDIT_COLUMNS:
                 if col not in df_audit_log.columns:
                     st.warning(f"Audit log column '{col}' not found. Please ensure your 'audit_log' Google Sheet has the correct headers.")
-                    
-            if 'Timestamp' in df_audit_log_display.columns:
-                df_audit_log_display['Timestamp'] = pd.to_datetime(df_audit_log_display['Timestamp'], errors='coerce')
-                df_audit_log_display.dropna(subset=['Timestamp'], inplace=True)
-            else:
+            if 'Timestamp' not in df_audit_log.columns:
                 st.warning("Kolom 'Timestamp' tidak ditemukan di audit log.")
-                
+
             st.subheader("Filter Audit Log")
             col_audit_start, col_audit_end = st.columns(2)
             with col_audit_start:
@@ -741,63 +1554,37 @@ if show_audit_log_tab: # This block is now conditional
             with col_audit_end:
                 audit_end_date = st.date_input("Audit Log End Date", datetime.today(), key="audit_log_end_date")
 
-            if 'Timestamp' in df_audit_log_display.columns:
-                df_filtered_audit_log = df_audit_log_display[
-                    (df_audit_log_display['Timestamp'].dt.date >= audit_start_date) &
-                    (df_audit_log_display['Timestamp'].dt.date <= audit_end_date)
-                ].copy()
-            else:
-                df_filtered_audit_log = df_audit_log_display.copy() # No date filtering possible
+            # Built once per loaded audit log: sorted by Timestamp, categorical filter columns.
+            # Entries older than the retention cutoff come from the monthly archives, only when the range reaches back.
+            audit_index, archived_audit_rows = get_audit_log_index(audit_start_date)
+            if archived_audit_rows:
+                st.caption(f"📦 {archived_audit_rows} entri diambil dari arsip audit log (lebih lama dari {AUDIT_LOG_RETENTION_DAYS} hari).")
 
+            # Dropdown options come from the precomputed value sets
             col_audit_user, col_audit_action, col_audit_status = st.columns(3)
             with col_audit_user:
-                if 'Username' in df_filtered_audit_log.columns:
-                    all_audit_users = ["All"] + sorted(df_filtered_audit_log['Username'].unique().tolist())
-                else:
-                    all_audit_users = ["All"]
-                selected_audit_user = st.selectbox("Filter by User", all_audit_users, key="selected_audit_user")
+                selected_audit_user = st.selectbox("Filter by User", ["All"] + audit_index.values("Username"), key="selected_audit_user")
             with col_audit_action:
-                if 'Action' in df_filtered_audit_log.columns:
-                    all_audit_actions = ["All"] + sorted(df_filtered_audit_log['Action'].unique().tolist())
-                else:
-                    all_audit_actions = ["All"]
-                selected_audit_action = st.selectbox("Filter by Action", all_audit_actions, key="selected_audit_action")
+                selected_audit_action = st.selectbox("Filter by Action", ["All"] + audit_index.values("Action"), key="selected_audit_action")
             with col_audit_status:
-                if 'Status' in df_filtered_audit_log.columns:
-                    all_audit_statuses = ["All"] + sorted(df_filtered_audit_log['Status'].unique().tolist())
-                else:
-                    all_audit_statuses = ["All"]
-                selected_audit_status = st.selectbox("Filter by Status", all_audit_statuses, key="selected_audit_status")
-
-            if selected_audit_user != "All":
-                df_filtered_audit_log = df_filtered_audit_log[df_filtered_audit_log['Username'] == selected_audit_user]
-            if selected_audit_action != "All":
-                df_filtered_audit_log = df_filtered_audit_log[df_filtered_audit_log['Action'] == selected_audit_action]
-            if selected_audit_status != "All":
-                df_filtered_audit_log = df_filtered_audit_log[df_filtered_audit_log['Status'] == selected_audit_status]
-
-            # --- FIX: Conditionally sort audit log only if 'Timestamp' column exists ---
-            if 'Timestamp' in df_filtered_audit_log.columns:
-                st.dataframe(
-                    df_filtered_audit_log
-                    .sort_values(by="Timestamp", ascending=False, na_position='last')
-                    .reset_index(drop=True),
-                    hide_index=True,
-                    use_container_width=True
-                )
-            else:
-                st.dataframe(
-                    df_filtered_audit_log
-                    .reset_index(drop=True), # Display without sorting if 'Timestamp' is missing
-                    hide_index=True,
-                    use_container_width=True
-                )
-                st.warning("Audit log tidak dapat diurutkan berdasarkan 'Timestamp' karena kolom tersebut tidak ditemukan.")
+                selected_audit_status = st.selectbox("Filter by Status", ["All"] + audit_index.values("Status"), key="selected_audit_status")
+
+            # Date range = binary search on the sorted timestamps, other filters compare category codes
+            df_filtered_audit_log = audit_index.query(
+                start=audit_start_date, end=audit_end_date + timedelta(days=1),
+                Username=None if selected_audit_user == "All" else selected_audit_user,
+                Action=None if selected_audit_action == "All" else selected_audit_action,
+                Status=None if selected_audit_status == "All" else selected_audit_status,
+            )
+
+            show_paginated_dataframe(df_filtered_audit_log, key="audit_log", default_sort="Timestamp")
+            show_export_buttons(df_filtered_audit_log, key="audit_log",
+                                file_stem=f"audit_log_{audit_start_date:%Y%m%d}_{audit_end_date:%Y%m%d}")
         else:
             st.info("No audit log entries found.")
 
 # --- NEW: Master Edit Tab (Site Admin only) ---
-if show_master_edit_tab:
+if show_master_edit_tab and tab_is_open("🛠️ Master Edit"):
     with tab_map["🛠️ Master Edit"]:
         st.header("🛠️ Master Edit (Site Admin Only)")
         st.markdown("Manage system-wide configurations and user accounts.")
@@ -805,10 +1592,28 @@ if show_master_edit_tab:
         current_user_id = st.session_state.user["Id"]
         current_username = st.session_state.user["Username"]
 
+        if PRESENSI_PARTITIONED and not get_presensi_partitions().is_migrated(backend):
+            st.subheader("Migrate Timesheets to Monthly Sheets")
+            st.warning(f"Mode partisi aktif, tetapi data lama di sheet '{sheet_presensi_title}' belum dipindahkan "
+                       f"ke sheet bulanan ({sheet_presensi_title}_YYYY_MM). Jalankan migrasi ini sekali.")
+            if st.button("Run Migration", key="migrate_presensi"):
+                with st.spinner("Memindahkan data ke sheet bulanan..."):
+                    try:
+                        copied = migrate_presensi_to_partitions()
+                    except Exception as e:
+                        st.error(f"Migrasi gagal: {e}. Jalankan lagi untuk melanjutkan; baris yang sudah dipindahkan tidak akan diduplikasi.")
+                    else:
+                        if copied is None:
+                            st.warning("Migrasi sedang berjalan di proses lain. Coba lagi nanti.")
+                        else:
+                            log_audit_event(current_user_id, current_username, "Master Edit - Migrate Timesheets",
+                                            f"Copied {copied} rows from '{sheet_presensi_title}' to monthly sheets.")
+                            st.success(f"Migrasi selesai: {copied} baris dipindahkan.")
+
         st.subheader("Manage Areas")
         
         # Display current areas
-        df_areas_current = get_data_from_sheet(SHEET_ID, sheet_areas_title)
+        df_areas_current = get_areas_frame()
         if not df_areas_current.empty and 'AreaName' in df_areas_current.columns:
             st.write("Current Areas:")
             st.dataframe(df_areas_current[['AreaName']].rename(columns={'AreaName': 'Available Areas'}), hide_index=True, use_container_width=True)
@@ -853,7 +1658,8 @@ if show_master_edit_tab:
         df_all_users = get_data_from_sheet(SHEET_ID, sheet_user_title)
 
         if not df_all_users.empty and 'Id' in df_all_users.columns and 'Username' in df_all_users.columns:
-            user_options = {f"{row['Username']} (ID: {row['Id']})": row['Id'] for idx, row in df_all_users.iterrows()}
+            user_options = {f"{username} (ID: {user_id})": user_id
+                            for username, user_id in zip(df_all_users['Username'], df_all_users['Id'])}
             selected_user_display = st.selectbox(
                 "Select User to Manage",
                 options=[""] + list(user_options.keys()),
@@ -892,175 +1698,218 @@ if show_master_edit_tab:
         st.info("Catatan: Untuk menjaga integritas data historis, ID pengguna tidak dapat diubah melalui aplikasi ini.")
 
 
+        st.subheader("Bulk Timesheet Import")
+        st.markdown("Upload file CSV / Excel (.xlsx) dengan kolom **Id, Date, Hours, Overtime, Area 1, Shift** "
+                    "(opsional: Area 2, Area 3, Area 4, Remark). Satu baris per user per tanggal. "
+                    "Format tanggal: **YYYY-MM-DD** atau **DD/MM/YYYY**. "
+                    f"Shift: {', '.join(SHIFT_OPTIONS)}.")
+        import_file = st.file_uploader("Timesheet file", type=["csv", "xlsx"], key="bulk_import_file")
+        if import_file is not None and st.button("📥 Validate & Import", key="bulk_import_button"):
+            try:
+                with st.spinner("Validating and importing..."):
+                    st.session_state.bulk_import_report = bulk_import_timesheets(read_import_file(import_file))
+                import_counts = st.session_state.bulk_import_report["Status"].value_counts()
+                log_audit_event(current_user_id, current_username, "Master Edit - Bulk Import",
+                                f"Imported {import_counts.get('Imported', 0)} timesheet rows from '{import_file.name}' "
+                                f"({import_counts.get('Rejected', 0)} rejected, {import_counts.get('Duplicate', 0)} duplicates, "
+                                f"{import_counts.get('Failed', 0)} failed).")
+            except ImportError:
+                st.error("Import file Excel membutuhkan paket 'openpyxl'. Silakan upload file CSV.")
+            except ValueError as e:
+                st.error(f"❗ File tidak valid: {e}")
+            except Exception as e:
+                st.error(f"Error importing timesheet file: {e}")
+
+        import_report = st.session_state.get("bulk_import_report")
+        if import_report is not None:
+            import_counts = import_report["Status"].value_counts()
+            st.info(f"{import_counts.get('Imported', 0)} imported, {import_counts.get('Rejected', 0)} rejected, "
+                    f"{import_counts.get('Duplicate', 0)} duplicate, {import_counts.get('Failed', 0)} failed "
+                    f"(of {len(import_report)} rows).")
+            show_paginated_dataframe(import_report, key="bulk_import_report", default_sort="Row")
+            st.download_button("⬇️ Download import report (CSV)", import_report.to_csv(index=False),
+                               file_name="timesheet_import_report.csv", mime="text/csv", key="bulk_import_report_download")
+
+
 # --- User Settings Tab
-with tab_map["⚙️ User Settings"]:
-    st.header("⚙️ User Settings")
-    st.markdown("Here you can manage your account preferences.")
-
-    current_user_id = st.session_state.user["Id"]
-    current_username = st.session_state.user["Username"]
-
-    st.subheader("Change Password")
-    with st.form("change_password_form", clear_on_submit=True):
-        old_password = st.text_input("Current Password", type="password")
-        new_password = st.text_input("New Password", type="password", key="new_pass")
-        confirm_new_password = st.text_input("Confirm New Password", type="password", key="confirm_new_pass")
-        submit_password_change = st.form_submit_button("Update Password")
-
-        if submit_password_change:
-            df_users_latest = get_data_from_sheet(SHEET_ID, sheet_user_title)
-            user_row_latest = df_users_latest[df_users_latest['Id'].astype(str) == str(current_user_id)]
-
-            if user_row_latest.empty:
-                st.error("User not found for password change. Please try logging in again.")
-                log_audit_event(current_user_id, current_username, "Password Change", "Failed: User not found.")
-            else:
-                stored_password_value = str(user_row_latest.iloc[0]['Password']).strip()
-                stored_hash_bytes = stored_password_value.encode('utf-8')
+if tab_is_open("⚙️ User Settings"):
+    with tab_map["⚙️ User Settings"]:
+        st.header("⚙️ User Settings")
+        st.markdown("Here you can manage your account preferences.")
+
+        current_user_id = st.session_state.user["Id"]
+        current_username = st.session_state.user["Username"]
 
-                password_match = False
-                if stored_hash_bytes.startswith(b'$2a$') or stored_hash_bytes.startswith(b'$2b$') or stored_hash_bytes.startswith(b'$2y$'):
+        st.subheader("Change Password")
+        with st.form("change_password_form", clear_on_submit=True):
+            old_password = st.text_input("Current Password", type="password")
+            new_password = st.text_input("New Password", type="password", key="new_pass")
+            confirm_new_password = st.text_input("Confirm New Password", type="password", key="confirm_new_pass")
+            submit_password_change = st.form_submit_button("Update Password")
+
+            if submit_password_change:
+                user_record_latest = get_user_record(current_user_id)
+
+                if user_record_latest is None:
+                    st.error("User not found for password change. Please try logging in again.")
+                    log_audit_event(current_user_id, current_username, "Password Change", "Failed: User not found.")
+                else:
+                    stored_password_value = str(user_record_latest['Password']).strip()
+
+                    verifier = get_password_verifier()
+                    throttle_key = str(current_user_id).strip() # Shares the login form's failure count for this Id
+                    password_match = False
                     try:
-                        password_match = bcrypt.checkpw(old_password.encode('utf-8'), stored_hash_bytes)
+                        verifier.check_throttle(throttle_key)
+                        password_match = verifier.verify(old_password, stored_password_value)
+                        if password_match:
+                            verifier.record_success(throttle_key)
+                        else:
+                            verifier.record_failure(throttle_key)
+                    except LoginThrottled as e:
+                        st.error(f"❌ Too many failed attempts. Please try again in {int(e.retry_after // 60) + 1} minute(s).")
+                        log_audit_event(current_user_id, current_username, "Password Change", "Failed: Throttled after repeated failures.")
+                        st.stop()
                     except ValueError:
                         st.error("Error verifying current password. It might be corrupted.")
                         password_match = False
                         log_audit_event(current_user_id, current_username, "Password Change", "Failed: Error verifying current password due to corrupted hash.")
-                else:
-                    password_match = (old_password == stored_password_value)
-
-                if not password_match:
-                    st.error("❌ Current password incorrect.")
-                    log_audit_event(current_user_id, current_username, "Password Change", "Failed: Incorrect current password.")
-                elif new_password != confirm_new_password:
-                    st.error("❌ New passwords do not match.")
-                    log_audit_event(current_user_id, current_username, "Password Change", "Failed: New passwords do not match.")
-                elif not new_password:
-                    st.warning("⚠️ New password cannot be empty.")
-                    log_audit_event(current_user_id, current_username, "Password Change", "Failed: New password cannot be empty.")
-                else:
-                    if update_user_data_in_sheet(current_user_id, "Password", new_password):
-                        st.session_state.user = None
-                        st.session_state.logged_out_after_password_change = True
-                        st.success("✅ Password updated successfully! Please re-login with your new password.")
-                        log_audit_event(current_user_id, current_username, "Password Change", "Successfully updated password.")
+                    except VerifierBusy:
+                        st.warning("⏳ Server is busy. Please try again in a few seconds.")
+                        st.stop()
+
+                    if not password_match:
+                        st.error("❌ Current password incorrect.")
+                        log_audit_event(current_user_id, current_username, "Password Change", "Failed: Incorrect current password.")
+                    elif new_password != confirm_new_password:
+                        st.error("❌ New passwords do not match.")
+                        log_audit_event(current_user_id, current_username, "Password Change", "Failed: New passwords do not match.")
+                    elif not new_password:
+                        st.warning("⚠️ New password cannot be empty.")
+                        log_audit_event(current_user_id, current_username, "Password Change", "Failed: New password cannot be empty.")
+                    else:
+                        if update_user_data_in_sheet(current_user_id, "Password", new_password):
+                            st.session_state.user = None
+                            st.session_state.logged_out_after_password_change = True
+                            st.success("✅ Password updated successfully! Please re-login with your new password.")
+                            log_audit_event(current_user_id, current_username, "Password Change", "Successfully updated password.")
+                            st.rerun()
+                        else:
+                            st.error("Something went wrong during password update. Please try again.")
+                            log_audit_event(current_user_id, current_username, "Password Change", "Failed: General update error.")
+
+        st.subheader("Change Username")
+        with st.form("change_username_form", clear_on_submit=True):
+            new_username = st.text_input("New Username", value=current_username)
+            submit_username_change = st.form_submit_button("Update Username")
+
+            if submit_username_change:
+                if new_username and new_username != current_username:
+                    if update_user_data_in_sheet(current_user_id, "Username", new_username):
+                        st.session_state.user["Username"] = new_username
+                        st.success(f"✅ Username updated to '{new_username}' successfully!")
+                        log_audit_event(current_user_id, current_username, "Username Change", f"Successfully updated username to '{new_username}'.")
                         st.rerun()
                     else:
-                        st.error("Something went wrong during password update. Please try again.")
-                        log_audit_event(current_user_id, current_username, "Password Change", "Failed: General update error.")
-
-    st.subheader("Change Username")
-    with st.form("change_username_form", clear_on_submit=True):
-        new_username = st.text_input("New Username", value=current_username)
-        submit_username_change = st.form_submit_button("Update Username")
-
-        if submit_username_change:
-            if new_username and new_username != current_username:
-                if update_user_data_in_sheet(current_user_id, "Username", new_username):
-                    st.session_state.user["Username"] = new_username
-                    st.success(f"✅ Username updated to '{new_username}' successfully!")
-                    log_audit_event(current_user_id, current_username, "Username Change", f"Successfully updated username to '{new_username}'.")
-                    st.rerun()
+                        st.error("Something went wrong during username update. Please try again.")
+                        log_audit_event(current_user_id, current_username, "Username Change", "Failed: General update error.")
+                elif new_username == current_username:
+                    st.info("💡 Username is already the same. No change needed.")
+                    log_audit_event(current_user_id, current_username, "Username Change", "No change needed, username is already the same.", "Info")
                 else:
-                    st.error("Something went wrong during username update. Please try again.")
-                    log_audit_event(current_user_id, current_username, "Username Change", "Failed: General update error.")
-            elif new_username == current_username:
-                st.info("💡 Username is already the same. No change needed.")
-                log_audit_event(current_user_id, current_username, "Username Change", "No change needed, username is already the same.", "Info")
-            else:
-                st.warning("⚠️ Username cannot be empty.")
-                log_audit_event(current_user_id, current_username, "Username Change", "Failed: Username cannot be empty.")
-
-    st.subheader("Set Priority Areas")
-    # NEW: Use all_area_opts from dynamic list
-    df_areas_select = get_data_from_sheet(SHEET_ID, sheet_areas_title)
-    if not df_areas_select.empty and 'AreaName' in df_areas_select.columns:
-        all_area_opts_for_select = df_areas_select['AreaName'].astype(str).tolist()
-    else:
-        all_area_opts_for_select = ["GCP", "ER", "ET", "SC", "SM", "SAP"]
-        st.warning("Could not load area list for 'Set Priority Areas'. Using default.")
+                    st.warning("⚠️ Username cannot be empty.")
+                    log_audit_event(current_user_id, current_username, "Username Change", "Failed: Username cannot be empty.")
+
+        st.subheader("Set Priority Areas")
+        # NEW: Use all_area_opts from dynamic list
+        df_areas_select = get_areas_frame()
+        if not df_areas_select.empty and 'AreaName' in df_areas_select.columns:
+            all_area_opts_for_select = df_areas_select['AreaName'].astype(str).tolist()
+        else:
+            all_area_opts_for_select = ["GCP", "ER", "ET", "SC", "SM", "SAP"]
+            st.warning("Could not load area list for 'Set Priority Areas'. Using default.")
 
 
-    current_preferred_areas_str = st.session_state.user.get("Preferred Areas", "")
-    current_preferred_areas_list = [a.strip() for a in current_preferred_areas_str.split(',') if a.strip()]
+        current_preferred_areas_str = st.session_state.user.get("Preferred Areas", "")
+        current_preferred_areas_list = [a.strip() for a in current_preferred_areas_str.split(',') if a.strip()]
 
-    current_preferred_areas_list = [area for area in current_preferred_areas_list if area in all_area_opts_for_select]
+        current_preferred_areas_list = [area for area in current_preferred_areas_list if area in all_area_opts_for_select]
 
-    with st.form("set_priority_areas_form", clear_on_submit=False):
-        selected_areas = st.multiselect(
-            "Select and order your frequently used areas (drag to reorder):",
-            options=all_area_opts_for_select,
-            default=current_preferred_areas_list,
-            help="The order you select here will determine the default order in the Timesheet form's 'Area 1' dropdown."
-        )
-        submit_priority_areas = st.form_submit_button("Save Priority Areas")
-
-        if submit_priority_areas:
-            new_preferred_areas_str = ", ".join(selected_areas)
-            if update_user_data_in_sheet(current_user_id, "Preferred Areas", new_preferred_areas_str):
-                st.session_state.user["Preferred Areas"] = new_preferred_areas_str
-                st.success("✅ Priority Areas saved successfully!")
-                log_audit_event(current_user_id, current_username, "Update User Preference", f"Successfully updated preferred areas to: {new_preferred_areas_str}.")
-                st.rerun()
-            else:
-                st.error("Something went wrong during saving priority areas. Please try again.")
-                log_audit_event(current_user_id, current_username, "Update User Preference", f"Failed to update preferred areas to: {new_preferred_areas_str}.")
-
-    st.subheader("Set Preferred Shift")
-    all_shift_opts = ["Day Shift", "Night Shift", "Noon Shift"]
-    current_preferred_shift = st.session_state.user.get("Preferred Shift", "Day Shift")
-
-    with st.form("set_preferred_shift_form", clear_on_submit=False):
-        selected_shift = st.selectbox(
-            "Select your most frequently used shift:",
-            options=all_shift_opts,
-            index=all_shift_opts.index(current_preferred_shift) if current_preferred_shift in all_shift_opts else 0,
-            help="This will set the default shift in the Timesheet form."
-        )
-        submit_preferred_shift = st.form_submit_button("Save Preferred Shift")
-
-        if submit_preferred_shift:
-            if update_user_data_in_sheet(current_user_id, "Preferred Shift", selected_shift):
-                st.session_state.user["Preferred Shift"] = selected_shift
-                st.success("✅ Preferred Shift saved successfully!")
-                log_audit_event(current_user_id, current_username, "Update User Preference", f"Successfully updated preferred shift to: {selected_shift}.")
-                st.rerun()
-            else:
-                st.error("Something went wrong during saving preferred shift. Please try again.")
-                log_audit_event(current_user_id, current_username, "Update User Preference", f"Failed to update preferred shift to: {selected_shift}.")
-
-    # --- START OF NEW FEATURE: Set Number of Area Columns ---
-    st.subheader("Set Number of Area Columns")
-    current_num_areas = st.session_state.user.get("Number of Areas", 1) # Default to 1 if not set
-    # Ensure current_num_areas is an integer for display
-    if not isinstance(current_num_areas, int):
-        try:
-            current_num_areas = int(current_num_areas)
-        except (ValueError, TypeError):
-            current_num_areas = 1 # Fallback if conversion fails
-
-    area_column_options = [1, 2, 3, 4]
-
-    with st.form("set_num_area_cols_form", clear_on_submit=False):
-        selected_num_areas = st.selectbox(
-            "How many 'Area' columns do you usually need in the Timesheet form?",
-            options=area_column_options,
-            index=area_column_options.index(current_num_areas) if current_num_areas in area_column_options else 0,
-            help="This will hide/show Area 2, Area 3, and Area 4 columns in the Timesheet form."
-        )
-        submit_num_areas = st.form_submit_button("Save Area Column Preference")
-
-        if submit_num_areas:
-            if update_user_data_in_sheet(current_user_id, "Number of Areas", selected_num_areas):
-                # Update session state for immediate effect
-                st.session_state.user["Number of Areas"] = selected_num_areas
-                st.success(f"✅ Area column preference saved successfully! Displaying {selected_num_areas} Area column(s).")
-                log_audit_event(current_user_id, current_username, "Update User Preference", f"Set number of Area columns to: {selected_num_areas}.")
-                st.rerun() # Rerun to apply changes to the Timesheet form
-            else:
-                st.error("Something went wrong during saving area column preference. Please try again.")
-                log_audit_event(current_user_id, current_username, "Update User Preference", f"Failed to set number of Area columns to: {selected_num_areas}.", "Failed")
-    # --- END OF NEW FEATURE: Set Number of Area Columns ---
+        with st.form("set_priority_areas_form", clear_on_submit=False):
+            selected_areas = st.multiselect(
+                "Select and order your frequently used areas (drag to reorder):",
+                options=all_area_opts_for_select,
+                default=current_preferred_areas_list,
+                help="The order you select here will determine the default order in the Timesheet form's 'Area 1' dropdown."
+            )
+            submit_priority_areas = st.form_submit_button("Save Priority Areas")
+
+            if submit_priority_areas:
+                new_preferred_areas_str = ", ".join(selected_areas)
+                if update_user_data_in_sheet(current_user_id, "Preferred Areas", new_preferred_areas_str):
+                    st.session_state.user["Preferred Areas"] = new_preferred_areas_str
+                    st.success("✅ Priority Areas saved successfully!")
+                    log_audit_event(current_user_id, current_username, "Update User Preference", f"Successfully updated preferred areas to: {new_preferred_areas_str}.")
+                    st.rerun()
+                else:
+                    st.error("Something went wrong during saving priority areas. Please try again.")
+                    log_audit_event(current_user_id, current_username, "Update User Preference", f"Failed to update preferred areas to: {new_preferred_areas_str}.")
+
+        st.subheader("Set Preferred Shift")
+        all_shift_opts = SHIFT_OPTIONS
+        current_preferred_shift = st.session_state.user.get("Preferred Shift", "Day Shift")
+
+        with st.form("set_preferred_shift_form", clear_on_submit=False):
+            selected_shift = st.selectbox(
+                "Select your most frequently used shift:",
+                options=all_shift_opts,
+                index=all_shift_opts.index(current_preferred_shift) if current_preferred_shift in all_shift_opts else 0,
+                help="This will set the default shift in the Timesheet form."
+            )
+            submit_preferred_shift = st.form_submit_button("Save Preferred Shift")
+
+            if submit_preferred_shift:
+                if update_user_data_in_sheet(current_user_id, "Preferred Shift", selected_shift):
+                    st.session_state.user["Preferred Shift"] = selected_shift
+                    st.success("✅ Preferred Shift saved successfully!")
+                    log_audit_event(current_user_id, current_username, "Update User Preference", f"Successfully updated preferred shift to: {selected_shift}.")
+                    st.rerun()
+                else:
+                    st.error("Something went wrong during saving preferred shift. Please try again.")
+                    log_audit_event(current_user_id, current_username, "Update User Preference", f"Failed to update preferred shift to: {selected_shift}.")
+
+        # --- START OF NEW FEATURE: Set Number of Area Columns ---
+        st.subheader("Set Number of Area Columns")
+        current_num_areas = st.session_state.user.get("Number of Areas", 1) # Default to 1 if not set
+        # Ensure current_num_areas is an integer for display
+        if not isinstance(current_num_areas, int):
+            try:
+                current_num_areas = int(current_num_areas)
+            except (ValueError, TypeError):
+                current_num_areas = 1 # Fallback if conversion fails
+
+        area_column_options = [1, 2, 3, 4]
+
+        with st.form("set_num_area_cols_form", clear_on_submit=False):
+            selected_num_areas = st.selectbox(
+                "How many 'Area' columns do you usually need in the Timesheet form?",
+                options=area_column_options,
+                index=area_column_options.index(current_num_areas) if current_num_areas in area_column_options else 0,
+                help="This will hide/show Area 2, Area 3, and Area 4 columns in the Timesheet form."
+            )
+            submit_num_areas = st.form_submit_button("Save Area Column Preference")
+
+            if submit_num_areas:
+                if update_user_data_in_sheet(current_user_id, "Number of Areas", selected_num_areas):
+                    # Update session state for immediate effect
+                    st.session_state.user["Number of Areas"] = selected_num_areas
+                    st.success(f"✅ Area column preference saved successfully! Displaying {selected_num_areas} Area column(s).")
+                    log_audit_event(current_user_id, current_username, "Update User Preference", f"Set number of Area columns to: {selected_num_areas}.")
+                    st.rerun() # Rerun to apply changes to the Timesheet form
+                else:
+                    st.error("Something went wrong during saving area column preference. Please try again.")
+                    log_audit_event(current_user_id, current_username, "Update User Preference", f"Failed to set number of Area columns to: {selected_num_areas}.", "Failed")
+        # --- END OF NEW FEATURE: Set Number of Area Columns ---
 
 
 # --- Developer Credits ---
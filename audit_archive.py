@@ -0,0 +1,188 @@
+"""
+Retention for the 'audit_log' worksheet.
+
+`AuditLogArchive.archive_old_entries` moves entries older than a cutoff from
+the live worksheet into gzip-compressed CSV files, one per month
+(audit_log_YYYY_MM.csv.gz), so the worksheet stays small. Archives are only
+read when a view asks for dates before the cutoff.
+
+Entries are written to the archive before they are deleted from the sheet and
+rows already in an archive file are not added twice, so a run interrupted between
+the two steps is simply repeated by the next one.
+
+Archived entries exist only in these files once they are deleted from the
+sheet, so the directory must be on persistent storage (not the ephemeral
+filesystem of a container that is replaced on redeploy).
+"""
+import csv
+import gzip
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+import pandas as pd
+
+from storage import records_frame
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_COLUMN = "Timestamp"
+LOCK_STALE_SECONDS = 3600
+
+
+class AuditLogArchive:
+    """Monthly compressed archive files of audit log rows in `directory`."""
+
+    FILE_PATTERN = re.compile(r"^audit_log_(\d{4})_(\d{2})\.csv\.gz$")
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, month):
+        return os.path.join(self.directory, f"audit_log_{month.replace('-', '_')}.csv.gz")
+
+    def months(self):
+        """Archived months ('YYYY-MM'), oldest first."""
+        found = (self.FILE_PATTERN.match(name) for name in os.listdir(self.directory))
+        return sorted(f"{m.group(1)}-{m.group(2)}" for m in found if m)
+
+    def stamp(self):
+        """Changes whenever an archive file is written; usable as a cache key."""
+        return tuple((month, os.path.getmtime(self.path(month))) for month in self.months())
+
+    def _read_rows(self, month):
+        path = self.path(month)
+        if not os.path.exists(path):
+            return None, []
+        with gzip.open(path, "rt", newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            return header, list(reader)
+
+    def _write_month(self, month, header, rows):
+        existing_header, existing_rows = self._read_rows(month)
+        if existing_header is not None and existing_header != header:
+            raise ValueError(f"Archive {self.path(month)} has a different header")
+        # Rows already in the file (from an interrupted earlier run) are not added again; identical entries
+        # logged in the same second are kept, as the counts are compared rather than the rows
+        already_archived = Counter(tuple(row) for row in existing_rows)
+        merged = [tuple(row) for row in existing_rows]
+        for row in map(tuple, rows):
+            if already_archived[row]:
+                already_archived[row] -= 1
+            else:
+                merged.append(row)
+        path = self.path(month)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, "wt", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(merged)
+        os.replace(tmp_path, path)
+
+    def load_range(self, start_date, end_date):
+        """Archived rows with a timestamp between the two dates (inclusive), as get_all_records() would return them."""
+        start_month, end_month = f"{start_date:%Y-%m}", f"{end_date:%Y-%m}"
+        frames = []
+        for month in self.months():
+            if start_month <= month <= end_month:
+                header, rows = self._read_rows(month)
+                if header:
+                    frames.append(records_frame(header, rows))
+        if not frames:
+            return pd.DataFrame()
+        df = pd.concat(frames, ignore_index=True)
+        dates = pd.to_datetime(df[TIMESTAMP_COLUMN], errors="coerce").dt.date
+        return df[(dates >= start_date) & (dates <= end_date)].reset_index(drop=True)
+
+    def archive_old_entries(self, backend, title, cutoff):
+        """
+        Moves rows of `title` with a timestamp before `cutoff` (a datetime) to the
+        archive. Only the leading run of old rows is moved (the sheet is
+        append-only, so that is normally all of them) and it is removed with a
+        single delete_rows call. Returns the number of rows moved.
+        """
+        lock_path = os.path.join(self.directory, ".retention.lock")
+        if not self._acquire_lock(lock_path):
+            logger.info("Audit log retention already running elsewhere, skipped")
+            return 0
+        try:
+            header, rows = backend.read_tail(title, 2)
+            if TIMESTAMP_COLUMN not in header or not rows:
+                return 0
+            ts_idx = header.index(TIMESTAMP_COLUMN)
+            timestamps = pd.to_datetime(pd.Series([row[ts_idx] if len(row) > ts_idx else "" for row in rows]),
+                                        errors="coerce")
+            is_old = (timestamps < pd.Timestamp(cutoff)).tolist()
+            old_count = is_old.index(False) if False in is_old else len(is_old)
+            if not old_count:
+                return 0
+
+            old_rows = [(list(row) + [""] * len(header))[:len(header)] for row in rows[:old_count]]
+            by_month = {}
+            for row, ts in zip(old_rows, timestamps[:old_count]):
+                by_month.setdefault(f"{ts:%Y-%m}", []).append(row)
+            with self.lock:
+                for month, month_rows in by_month.items():
+                    self._write_month(month, header, month_rows)
+
+            # The rows to delete must still be the ones we archived
+            _, check_rows = backend.read_tail(title, 2)
+            if [(list(r) + [""] * len(header))[:len(header)] for r in check_rows[:old_count]] != old_rows:
+                logger.warning("Audit log changed during retention, rows archived but not deleted; retrying next run")
+                return 0
+            backend.worksheet(title).delete_rows(2, old_count + 1)
+            logger.info("Archived %d audit log rows older than %s", old_count, cutoff)
+            return old_count
+        finally:
+            os.remove(lock_path)
+
+    @staticmethod
+    def _acquire_lock(lock_path):
+        """Cross-process lock file; a lock older than LOCK_STALE_SECONDS is taken over."""
+        try:
+            if time.time() - os.path.getmtime(lock_path) > LOCK_STALE_SECONDS:
+                os.remove(lock_path)
+        except OSError:
+            pass
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            return False
+
+
+class RetentionJob:
+    """Calls `run()` on a daemon thread `initial_delay` seconds after start and then every `interval` seconds."""
+
+    def __init__(self, run, interval=24 * 3600, initial_delay=60.0):
+        self.run = run
+        self.interval = interval
+        self.initial_delay = initial_delay
+        self.last_run = None
+        self.last_moved = 0
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="audit-retention", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(5.0)
+
+    def _run(self):
+        delay = self.initial_delay
+        while not self._stop.wait(delay):
+            try:
+                self.last_moved = self.run()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
+                logger.warning("Audit log retention failed: %s", e)
+            self.last_run = time.time()
+            delay = self.interval
@@ -0,0 +1,75 @@
+"""
+Time-indexed view of the audit log.
+
+`AuditLogIndex` is built once per loaded audit log: rows are sorted by a
+datetime64 Timestamp, so a date range is two binary searches, and
+Username / Action / Status are categoricals whose codes are compared directly.
+Queries return row positions; only the rows finally shown are taken from the
+frame.
+"""
+import numpy as np
+import pandas as pd
+
+AUDIT_COLUMNS = ["Timestamp", "User ID", "Username", "Action", "Description", "Status"]
+CATEGORY_COLUMNS = ["Username", "Action", "Status"]
+
+
+class AuditLogIndex:
+    """Audit log frame sorted by Timestamp with categorical filter columns and their value sets."""
+
+    def __init__(self, df):
+        df = df[[col for col in AUDIT_COLUMNS if col in df.columns]]
+        self.has_timestamp = "Timestamp" in df.columns
+        if self.has_timestamp:
+            timestamps = pd.to_datetime(df["Timestamp"], errors="coerce")
+            keep = timestamps.notna().to_numpy()
+            order = np.argsort(timestamps.to_numpy()[keep], kind="stable")
+            df = df.assign(Timestamp=timestamps)[keep].iloc[order]
+        # Mixed numeric / text cells (gspread numericises) become text so every value set is sortable
+        df = df.assign(**{col: df[col].astype(object).where(df[col].notna(), "").astype(str).astype("category")
+                          for col in CATEGORY_COLUMNS if col in df.columns})
+        self.df = df.reset_index(drop=True)
+        self.timestamps = self.df["Timestamp"].to_numpy() if self.has_timestamp else None
+        self.codes = {col: self.df[col].cat.codes.to_numpy() for col in CATEGORY_COLUMNS if col in self.df.columns}
+        self.categories = {col: self.df[col].cat.categories for col in self.codes}
+
+    def __len__(self):
+        return len(self.df)
+
+    def values(self, column):
+        """Sorted distinct values of a categorical column ([] if the column is missing)."""
+        return list(self.categories[column]) if column in self.categories else []
+
+    def _bound(self, value, side):
+        value = pd.Timestamp(value).to_datetime64().astype(self.timestamps.dtype)
+        return int(np.searchsorted(self.timestamps, value, side=side))
+
+    def positions(self, start=None, end=None, **filters):
+        """
+        Row positions with start <= Timestamp < end and each filtered column
+        (e.g. Username="budi") equal to its value; None skips a bound or filter.
+        """
+        lo, hi = 0, len(self.df)
+        if self.has_timestamp:
+            if start is not None:
+                lo = self._bound(start, "left")
+            if end is not None:
+                hi = self._bound(end, "left")
+        mask = None
+        for column, value in filters.items():
+            if value is None:
+                continue
+            if column not in self.codes or value not in self.categories[column]:
+                return np.arange(0)
+            column_mask = self.codes[column][lo:hi] == self.categories[column].get_loc(value)
+            mask = column_mask if mask is None else mask & column_mask
+        if hi <= lo:
+            return np.arange(0)
+        return np.arange(lo, hi) if mask is None else lo + np.flatnonzero(mask)
+
+    def query(self, start=None, end=None, **filters):
+        """The matching rows, in Timestamp order."""
+        positions = self.positions(start, end, **filters)
+        if len(positions) and positions[-1] - positions[0] + 1 == len(positions):
+            return self.df.iloc[positions[0]:positions[-1] + 1] # Contiguous range: a slice, no gather
+        return self.df.iloc[positions]
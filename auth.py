@@ -0,0 +1,106 @@
+"""
+Password verification for the Timesheet app.
+
+bcrypt checks run on a small shared thread pool so a burst of logins (e.g. at
+shift change) can't take every core, and repeated failures for the same Id are
+throttled before any bcrypt work is done.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import bcrypt
+
+BCRYPT_PREFIXES = (b'$2a$', b'$2b$', b'$2y$')
+
+
+class LoginThrottled(Exception):
+    """Too many failed attempts for this Id; `retry_after` is in seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Too many failed attempts, retry in {int(retry_after)}s.")
+        self.retry_after = retry_after
+
+
+class VerifierBusy(Exception):
+    """All verification slots are taken; the caller should try again shortly."""
+
+
+def is_bcrypt_hash(stored_value):
+    return stored_value.encode('utf-8').startswith(BCRYPT_PREFIXES)
+
+
+class PasswordVerifier:
+    """
+    Runs bcrypt on a bounded pool (`max_workers` threads, at most `max_pending`
+    checks queued or running) and keeps per-Id failed-attempt counters: after
+    `max_failures` failures within `failure_window` seconds the Id is locked for
+    `lockout` seconds.
+    """
+
+    def __init__(self, max_workers=2, max_pending=16, max_failures=5, failure_window=900, lockout=900):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.max_failures = max_failures
+        self.failure_window = failure_window
+        self.lockout = lockout
+        self.lock = threading.Lock()
+        self.failures = {}
+        self.locked_until = {}
+
+    def verify(self, password, stored_value, timeout=10.0):
+        """
+        Checks `password` against a stored bcrypt hash (or a legacy plain-text value).
+        Raises ValueError for a malformed hash, like bcrypt.checkpw, and
+        VerifierBusy if no slot is free or the check doesn't finish within `timeout`.
+        """
+        if not is_bcrypt_hash(stored_value):
+            return password == stored_value
+        if not self.slots.acquire(blocking=False):
+            raise VerifierBusy()
+        try:
+            future = self.pool.submit(bcrypt.checkpw, password.encode('utf-8'), stored_value.encode('utf-8'))
+        except BaseException:
+            self.slots.release()
+            raise
+        # The slot is freed when the check has actually run, not when we stop waiting for it
+        future.add_done_callback(lambda _: self.slots.release())
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            raise VerifierBusy() from None
+
+    def check_throttle(self, key):
+        """Raises LoginThrottled if `key` is locked out."""
+        with self.lock:
+            until = self.locked_until.get(key, 0)
+            now = time.monotonic()
+            if until > now:
+                raise LoginThrottled(until - now)
+
+    def record_failure(self, key):
+        with self.lock:
+            now = time.monotonic()
+            self._prune(now)
+            attempts = self.failures.setdefault(key, deque())
+            attempts.append(now)
+            if len(attempts) >= self.max_failures:
+                self.locked_until[key] = now + self.lockout
+                del self.failures[key]
+
+    def _prune(self, now):
+        # Any typed Id gets an entry, so expired ones are dropped to keep both dicts bounded
+        for key in list(self.failures):
+            attempts = self.failures[key]
+            while attempts and attempts[0] < now - self.failure_window:
+                attempts.popleft()
+            if not attempts:
+                del self.failures[key]
+        for key in [key for key, until in self.locked_until.items() if until <= now]:
+            del self.locked_until[key]
+
+    def record_success(self, key):
+        with self.lock:
+            self.failures.pop(key, None)
+            self.locked_until.pop(key, None)
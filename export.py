@@ -0,0 +1,81 @@
+"""
+Chunked CSV / Parquet export of (filtered) log frames.
+
+Rows are converted and written `chunk_rows` at a time into an in-memory
+buffer, so the conversion never holds more than one chunk in a second
+representation. The buffer is an io.BytesIO, which st.download_button accepts
+as (deferred) data.
+"""
+import io
+
+import pandas as pd
+
+from sheet_cache import arrow_safe_frame
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError: # Parquet export is optional
+    pa = pq = None
+
+EXPORT_CHUNK_ROWS = 50_000
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def available_formats():
+    return [fmt for fmt in EXPORT_FORMATS if fmt != "parquet" or pq is not None]
+
+
+def _chunks(df, chunk_rows):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def write_csv(df, sink, chunk_rows=EXPORT_CHUNK_ROWS):
+    text = io.TextIOWrapper(sink, encoding="utf-8", newline="", write_through=True)
+    if df.empty:
+        df.to_csv(text, index=False) # Header only
+    for i, chunk in enumerate(_chunks(df, chunk_rows)):
+        chunk.to_csv(text, header=i == 0, index=False)
+    text.detach() # Leaves `sink` open
+
+
+def _parquet_schema(df):
+    """Schema of the exported file: columns `arrow_safe_frame` turns into text are strings (categories: dictionaries)."""
+    schema = pa.Schema.from_pandas(arrow_safe_frame(df.head(0)), preserve_index=False)
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype) and df[col].cat.categories.dtype == object:
+            kind = pa.dictionary(pa.int32(), pa.string())
+        elif df[col].dtype == object:
+            kind = pa.string()
+        else:
+            continue
+        index = schema.get_field_index(str(col))
+        schema = schema.set(index, schema.field(index).with_type(kind))
+    return schema
+
+
+def write_parquet(df, sink, chunk_rows=EXPORT_CHUNK_ROWS):
+    # Text columns and categories can mix numbers and strings (gspread numericises cells); export them as strings
+    schema = _parquet_schema(df)
+    with pq.ParquetWriter(sink, schema, compression="snappy") as writer:
+        for chunk in _chunks(df, chunk_rows):
+            writer.write_table(pa.Table.from_pandas(arrow_safe_frame(chunk), schema=schema, preserve_index=False))
+
+
+def export_frame(df, fmt, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Writes `df` as "csv" or "parquet" and returns the io.BytesIO, rewound for reading."""
+    sink = io.BytesIO()
+    if fmt == "csv":
+        write_csv(df, sink, chunk_rows)
+    elif fmt == "parquet":
+        if pq is None:
+            raise RuntimeError("Parquet export needs pyarrow.")
+        write_parquet(df, sink, chunk_rows)
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+    sink.seek(0)
+    return sink
@@ -0,0 +1,205 @@
+"""
+Local write-ahead journal for timesheet submissions.
+
+A submission is committed to a local SQLite journal first and the user gets
+an answer right away. `JournalReplayer` then pushes pending entries to the
+backend in the background. Replays are idempotent on the (Id, Date) key:
+entries whose key is already in the sheet are only marked committed, so a
+crash between the append and the commit mark doesn't create duplicates.
+
+Several processes may share one journal file (replicas in the same working
+directory). A replayer first claims the pending entries in one write
+transaction, so each entry is appended by one replayer only; claims left
+behind by a crashed process are taken over after CLAIM_STALE_SECONDS.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+CLAIM_STALE_SECONDS = 300
+
+
+class SubmissionJournal:
+    """Append-only journal of presensi rows with a pending/replaying/committed status per entry."""
+
+    def __init__(self, path, header, key_columns=("Id", "Date")):
+        self.path = path
+        self.header = list(header)
+        self.key_positions = [self.header.index(col) for col in key_columns]
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=FULL") # An acknowledged submission survives a crash
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS journal ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, entry_key TEXT NOT NULL, data TEXT NOT NULL, "
+                "status TEXT NOT NULL DEFAULT 'pending', created_at REAL NOT NULL, committed_at REAL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS journal_status ON journal (status)")
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(journal)")}
+            for column, kind in (("claimed_by", "TEXT"), ("claimed_at", "REAL")): # Journals created before claims
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE journal ADD COLUMN {column} {kind}")
+
+    def key_of(self, row):
+        return tuple(str(row[i]) for i in self.key_positions)
+
+    def append(self, rows):
+        """Durably records rows as pending."""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO journal (entry_key, data, created_at) VALUES (?, ?, ?)",
+                [(json.dumps(self.key_of(row)), json.dumps(list(row), default=str), now) for row in rows]
+            )
+
+    def pending(self):
+        """[(seq, row), ...] of the entries not yet written to the backend (claimed or not), oldest first."""
+        with self.lock:
+            cur = self.conn.execute("SELECT seq, data FROM journal WHERE status != 'committed' ORDER BY seq")
+            return [(seq, json.loads(data)) for seq, data in cur.fetchall()]
+
+    def claim(self, owner, stale_after=CLAIM_STALE_SECONDS):
+        """
+        Marks the pending entries (and claims older than `stale_after` seconds) as
+        being replayed by `owner` in one write transaction and returns them as
+        [(seq, row), ...]. Entries claimed by another replayer are not returned.
+        """
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute(
+                "UPDATE journal SET status = 'replaying', claimed_by = ?, claimed_at = ? "
+                "WHERE status = 'pending' OR (status = 'replaying' AND claimed_at < ?)",
+                (owner, now, now - stale_after)
+            )
+            cur = self.conn.execute("SELECT seq, data FROM journal WHERE status = 'replaying' AND claimed_by = ? "
+                                    "ORDER BY seq", (owner,))
+            return [(seq, json.loads(data)) for seq, data in cur.fetchall()]
+
+    def pending_rows(self, committed_since=None):
+        """
+        Rows of the entries not yet written to the backend, plus those committed
+        at or after `committed_since` (a time.time() value) if it is given.
+        """
+        if committed_since is None:
+            return [row for _, row in self.pending()]
+        with self.lock:
+            cur = self.conn.execute("SELECT data FROM journal WHERE status != 'committed' OR committed_at >= ? "
+                                    "ORDER BY seq", (committed_since,))
+            return [json.loads(data) for (data,) in cur.fetchall()]
+
+    def pending_keys(self):
+        with self.lock:
+            cur = self.conn.execute("SELECT entry_key FROM journal WHERE status != 'committed'")
+            return {tuple(json.loads(key)) for (key,) in cur.fetchall()}
+
+    def mark_committed(self, seqs):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE journal SET status = 'committed', committed_at = ? WHERE seq = ?",
+                [(time.time(), seq) for seq in seqs]
+            )
+
+    def record_failure(self, seqs, error):
+        """Releases claimed entries back to pending after a failed replay."""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE journal SET status = 'pending', claimed_by = NULL, attempts = attempts + 1, last_error = ? "
+                "WHERE seq = ? AND status != 'committed'",
+                [(str(error), seq) for seq in seqs]
+            )
+
+    def prune(self, older_than_seconds=7 * 24 * 3600):
+        """Drops committed entries older than the given age."""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM journal WHERE status = 'committed' AND committed_at < ?",
+                              (time.time() - older_than_seconds,))
+
+
+class JournalReplayer:
+    """
+    Background thread pushing pending journal entries to the backend.
+
+    `key_lookup(dates)` returns the keys already in the backend for those dates,
+    `append_rows(rows)` writes rows and `on_commit(rows)` runs after they are
+    committed (e.g. to invalidate caches). Failed replays back off up to
+    `max_interval` seconds.
+    """
+
+    def __init__(self, journal, key_lookup, append_rows, on_commit=None, interval=2.0, max_interval=60.0):
+        self.journal = journal
+        self.key_lookup = key_lookup
+        self.append_rows = append_rows
+        self.on_commit = on_commit
+        self.interval = interval
+        self.max_interval = max_interval
+        self.owner = uuid.uuid4().hex
+        self.replayed = 0
+        self.skipped = 0
+        self.last_error = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="journal-replayer", daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """Replays right away instead of at the next interval."""
+        self._wake.set()
+
+    def replay_once(self):
+        claimed = self.journal.claim(self.owner)
+        if not claimed:
+            return 0
+        already_written, to_write, seen = [], [], set()
+        try:
+            date_idx = self.journal.key_positions[-1]
+            existing_keys = self.key_lookup([row[date_idx] for _, row in claimed])
+            for seq, row in claimed:
+                key = self.journal.key_of(row)
+                if key in existing_keys or key in seen:
+                    already_written.append(seq)
+                else:
+                    seen.add(key)
+                    to_write.append((seq, row))
+            if to_write:
+                self.append_rows([row for _, row in to_write])
+        except Exception as e:
+            self.journal.record_failure([seq for seq, _ in claimed], e)
+            raise
+        self.journal.mark_committed(already_written + [seq for seq, _ in to_write])
+        self.replayed += len(to_write)
+        self.skipped += len(already_written)
+        if to_write and self.on_commit:
+            self.on_commit([row for _, row in to_write])
+        return len(to_write)
+
+    def close(self, timeout=30.0):
+        """Stops the thread after one last replay attempt."""
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        wait = self.interval
+        while True:
+            self._wake.wait(wait)
+            self._wake.clear()
+            try:
+                self.replay_once()
+                self.journal.prune()
+                wait = self.interval
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
+                wait = min(self.max_interval, wait * 2)
+                logger.warning("Journal replay failed, retrying in %.0fs: %s", wait, e)
+            if self._stop.is_set():
+                return
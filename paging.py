@@ -0,0 +1,25 @@
+"""
+Paging of large frames for display: only the rows of the requested page are
+sorted and sliced, so a table view never sends the whole sheet to the browser.
+"""
+import pandas as pd
+
+
+def paginate_frame(df, sort_by, ascending, page, page_size):
+    """
+    Returns the rows of one page of `df` sorted by `sort_by`.
+    Numeric and date keys are only partially sorted (nsmallest/nlargest up to the end of the page).
+    """
+    end = page * page_size
+    start = end - page_size
+    sort_key = df[sort_by]
+    if (pd.api.types.is_numeric_dtype(sort_key) or pd.api.types.is_datetime64_any_dtype(sort_key)) and not pd.api.types.is_bool_dtype(sort_key):
+        non_null = df[sort_key.notna()]
+        if end <= len(non_null):
+            top = non_null.nsmallest(end, sort_by) if ascending else non_null.nlargest(end, sort_by)
+            return top.iloc[start:end]
+    # Text/categorical keys (or pages reaching the empty values) need a full sort
+    return df.sort_values(
+        by=sort_by, ascending=ascending, na_position='last',
+        key=lambda col: col.astype(str) if isinstance(col.dtype, pd.CategoricalDtype) or col.dtype == object else col
+    ).iloc[start:end]
@@ -0,0 +1,135 @@
+"""
+Materialized Hours / Overtime totals over 'presensi'.
+
+`HoursRollup` keeps running totals per (user, ISO week), (user, month), area
+and shift. Appended rows are folded in batch by batch, so the summary view
+reads a handful of totals instead of aggregating the whole sheet.
+
+Area split rule: a row's Hours and Overtime are divided evenly between the
+distinct non-empty areas in Area 1..Area 4 (8 hours over two areas count as
+4 hours for each). Rows without an area are totalled under NO_AREA.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from validation import AREA_COLUMNS
+
+NO_AREA = "(no area)"
+
+# Dimension -> (label, key column names)
+DIMENSIONS = {
+    "user_week": ("Per user per ISO week", ["Username", "Week"]),
+    "user_month": ("Per user per month", ["Username", "Month"]),
+    "area": ("Per area", ["Area"]),
+    "shift": ("Per shift", ["Shift"]),
+}
+TOTAL_COLUMNS = ["Hours", "Overtime", "Entries"]
+
+
+def _text(series):
+    """Strips values to text; missing values (also in categorical columns) become ""."""
+    return series.astype(object).where(series.notna(), "").astype(str).str.strip()
+
+
+def _grouped(keys, hours, overtime, entries):
+    """{key tuple: [hours, overtime, entries]} summed over the rows of one batch."""
+    frame = pd.DataFrame(keys)
+    frame["Hours"] = hours
+    frame["Overtime"] = overtime
+    frame["Entries"] = entries
+    sums = frame.groupby(list(keys), sort=False)[TOTAL_COLUMNS].sum()
+    return {(key if isinstance(key, tuple) else (key,)): values for key, values in zip(sums.index, sums.values.tolist())}
+
+
+class HoursRollup:
+    """Running Hours / Overtime / entry-count totals per dimension in DIMENSIONS."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {dimension: {} for dimension in DIMENSIONS}
+        self.rows = 0
+
+    @classmethod
+    def build(cls, df):
+        rollup = cls()
+        rollup.add(df)
+        return rollup
+
+    @classmethod
+    def merged(cls, rollups):
+        """One rollup with the summed totals of several, e.g. one per month partition."""
+        result = cls()
+        for rollup in rollups:
+            with rollup.lock:
+                totals = {dimension: dict(groups) for dimension, groups in rollup.totals.items()}
+                rows = rollup.rows
+            result._fold(totals, rows)
+        return result
+
+    def rebuild(self, df):
+        """Starts over from a fully reloaded frame; readers see the old totals until the new ones are ready."""
+        fresh = HoursRollup.build(df)
+        with self.lock:
+            self.totals = fresh.totals
+            self.rows = fresh.rows
+
+    def add(self, df):
+        """Folds a batch of appended presensi rows into the totals."""
+        if df.empty or "Hours" not in df.columns or "Overtime" not in df.columns:
+            return
+        self._fold(self._aggregate(df.reset_index(drop=True)), len(df))
+
+    def _fold(self, batch, rows):
+        with self.lock:
+            for dimension, groups in batch.items():
+                totals = self.totals[dimension]
+                for key, values in groups.items():
+                    current = totals.get(key)
+                    totals[key] = values if current is None else [a + b for a, b in zip(current, values)]
+            self.rows += rows
+
+    def frame(self, dimension):
+        """Totals of one dimension as a DataFrame, largest Hours first."""
+        columns = DIMENSIONS[dimension][1]
+        with self.lock:
+            items = list(self.totals[dimension].items())
+        result = pd.DataFrame([list(key) + values for key, values in items], columns=columns + TOTAL_COLUMNS)
+        result["Entries"] = result["Entries"].round().astype(int)
+        return result.sort_values(["Hours"] + columns, ascending=[False] + [True] * len(columns), ignore_index=True)
+
+    def _aggregate(self, df):
+        hours = pd.to_numeric(df["Hours"], errors="coerce").fillna(0).astype(float).to_numpy()
+        overtime = pd.to_numeric(df["Overtime"], errors="coerce").fillna(0).astype(float).to_numpy()
+        entries = np.ones(len(df))
+        users = _text(df["Username"]) if "Username" in df.columns else pd.Series("", index=df.index)
+        batch = {}
+
+        dates = pd.to_datetime(df["Date"], errors="coerce") if "Date" in df.columns else pd.Series(pd.NaT, index=df.index)
+        dated = dates.notna().to_numpy()
+        if dated.any():
+            iso = dates[dated].dt.isocalendar()
+            weeks = iso["year"].astype(str) + "-W" + iso["week"].astype(str).str.zfill(2)
+            months = dates[dated].dt.strftime("%Y-%m")
+            batch["user_week"] = _grouped({"Username": users[dated].to_numpy(), "Week": weeks.to_numpy()},
+                                          hours[dated], overtime[dated], entries[dated])
+            batch["user_month"] = _grouped({"Username": users[dated].to_numpy(), "Month": months.to_numpy()},
+                                           hours[dated], overtime[dated], entries[dated])
+
+        if "Shift" in df.columns:
+            batch["shift"] = _grouped({"Shift": _text(df["Shift"]).to_numpy()}, hours, overtime, entries)
+
+        # One (row, area) pair per distinct area of a row; each pair gets 1/n of the row's hours
+        area_columns = [col for col in AREA_COLUMNS if col in df.columns]
+        if area_columns:
+            areas = pd.DataFrame({col: _text(df[col]) for col in area_columns}).replace("", np.nan).stack().dropna()
+            pairs = pd.DataFrame({"row": areas.index.get_level_values(0), "Area": areas.to_numpy()}).drop_duplicates()
+            rows = pairs["row"].to_numpy()
+            share = 1.0 / pairs.groupby("row")["row"].transform("size").to_numpy()
+            without_area = np.setdiff1d(np.arange(len(df)), rows)
+            area_keys = np.concatenate([pairs["Area"].to_numpy(dtype=object), np.full(len(without_area), NO_AREA, dtype=object)])
+            rows = np.concatenate([rows, without_area])
+            share = np.concatenate([share, np.ones(len(without_area))])
+            batch["area"] = _grouped({"Area": area_keys}, hours[rows] * share, overtime[rows] * share, entries[rows])
+        return batch
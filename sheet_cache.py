@@ -0,0 +1,361 @@
+"""
+Caching helpers for worksheet data shared by all Streamlit sessions.
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError: # On-disk snapshots are optional
+    pa = None
+
+try:
+    import fcntl
+except ImportError: # Windows: no cross-process locking of shared snapshots
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class SheetVersions:
+    """
+    Version counter per worksheet. The version is part of the data cache key,
+    so bumping it after a write invalidates only that worksheet's cached data.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.versions = {}
+
+    def get(self, title):
+        with self.lock:
+            return self.versions.get(title, 0)
+
+    def bump(self, title):
+        with self.lock:
+            self.versions[title] = self.versions.get(title, 0) + 1
+            return self.versions[title]
+
+
+class SharedSheetVersions:
+    """
+    Same interface as SheetVersions, but the counters live in a SQLite file
+    so every process on the host (e.g. several Streamlit replicas) sees a bump
+    made by any of them.
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False, isolation_level=None)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS versions (title TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+
+    def get(self, title):
+        with self.lock:
+            row = self.conn.execute("SELECT version FROM versions WHERE title = ?", (title,)).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, title):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("INSERT INTO versions (title, version) VALUES (?, 1) "
+                                  "ON CONFLICT (title) DO UPDATE SET version = version + 1", (title,))
+                version = self.conn.execute("SELECT version FROM versions WHERE title = ?", (title,)).fetchone()[0]
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return version
+
+
+class SingleFlight:
+    """
+    Process-wide single-flight loader: while a load for a key is running,
+    other callers with the same key wait for it and get the same result
+    instead of starting their own. `saved` counts the loads avoided that way.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.loads = 0
+        self.saved = 0
+
+    def do(self, key, func, *args, **kwargs):
+        with self.lock:
+            future = self.in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self.in_flight[key] = Future()
+                self.loads += 1
+            else:
+                self.saved += 1
+        if not leader:
+            return future.result()
+        try:
+            result = func(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+
+
+class SnapshotRefresher:
+    """
+    Stale-while-revalidate snapshots of worksheets.
+
+    A background thread reloads each sheet in `intervals` (title -> seconds)
+    `refresh_ahead` seconds before its interval runs out and swaps the new
+    snapshot in. A change of `version_of(title)` only marks the snapshot
+    stale: it is reloaded in the background once somebody reads it, so writes
+    to a sheet nobody is looking at cost no downloads. Readers are always
+    served the current snapshot; only the very first load of a sheet blocks.
+    A failed reload keeps the old snapshot and is retried after `retry_delay`
+    seconds.
+
+    `warm_start(title)` may return (data, age) of a persisted snapshot to serve
+    on the first load instead of blocking; it is reconciled with the backend in
+    the background right away. `on_refresh(title, data)` runs after each reload.
+    """
+
+    def __init__(self, load, intervals, version_of, refresh_ahead=30.0, retry_delay=30.0, tick=1.0,
+                 single_flight=None, warm_start=None, on_refresh=None):
+        self.load = load
+        self.intervals = dict(intervals)
+        self.version_of = version_of
+        self.refresh_ahead = refresh_ahead
+        self.retry_delay = retry_delay
+        self.tick = tick
+        self.single_flight = single_flight or SingleFlight()
+        self.warm_start = warm_start
+        self.on_refresh = on_refresh
+        self.lock = threading.Lock()
+        self.snapshots = {} # title -> (data, loaded at (monotonic), version)
+        self.started_at = {} # title -> wall-clock time the current snapshot's load started
+        self.retry_at = {}
+        self.requested = set() # Stale snapshots that were read since their version changed
+        self.refreshes = 0
+        self.failures = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="snapshot-refresher", daemon=True)
+        self._thread.start()
+
+    def get(self, title):
+        """Returns (data, age in seconds) of the current snapshot of `title`."""
+        with self.lock:
+            snapshot = self.snapshots.get(title)
+        if snapshot is None:
+            self.single_flight.do(("first load", title), self._first_load, title)
+            with self.lock:
+                snapshot = self.snapshots[title]
+        elif snapshot[2] is not None and snapshot[2] != self.version_of(title):
+            with self.lock:
+                self.requested.add(title) # Served stale this time, reloaded by the background thread
+        return snapshot[0], time.monotonic() - snapshot[1]
+
+    def age(self, title):
+        """Seconds since the snapshot of `title` was loaded, or None if it never was."""
+        with self.lock:
+            snapshot = self.snapshots.get(title)
+        return None if snapshot is None else time.monotonic() - snapshot[1]
+
+    def stamp(self, title):
+        """Changes whenever a new snapshot of `title` is swapped in; usable as a cache key."""
+        with self.lock:
+            snapshot = self.snapshots.get(title)
+        return None if snapshot is None else snapshot[1]
+
+    def loaded_from(self, title):
+        """
+        Wall-clock time the load of the current snapshot of `title` started
+        (None if there is none): rows written before then are in it, later
+        ones may not be.
+        """
+        with self.lock:
+            return self.started_at.get(title)
+
+    def refresh(self, title):
+        # The version is read before loading, so a write during the load triggers another refresh
+        version = self.version_of(title)
+        started = time.time()
+        data = self.single_flight.do(("snapshot", title), self.load, title)
+        with self.lock:
+            self.snapshots[title] = (data, time.monotonic(), version)
+            self.started_at[title] = started
+            self.requested.discard(title)
+            self.refreshes += 1
+        if self.on_refresh:
+            try:
+                self.on_refresh(title, data)
+            except Exception as e:
+                logger.warning("on_refresh for '%s' failed: %s", title, e)
+
+    def _first_load(self, title):
+        with self.lock:
+            if title in self.snapshots:
+                return
+        warm = None
+        if self.warm_start:
+            try:
+                warm = self.warm_start(title)
+            except Exception as e:
+                logger.warning("Could not load the persisted snapshot of '%s': %s", title, e)
+        if warm is None:
+            self.refresh(title)
+            return
+        data, age = warm
+        with self.lock:
+            # No version: the background thread reconciles it with the backend on its next tick
+            self.snapshots[title] = (data, time.monotonic() - age, None)
+            self.started_at[title] = time.time() - age
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(self.tick * 2)
+
+    def _is_due(self, title, now):
+        with self.lock:
+            snapshot = self.snapshots.get(title)
+        if snapshot is None or now < self.retry_at.get(title, 0):
+            return False # Sheets nobody asked for yet are not loaded
+        _, loaded_at, version = snapshot
+        with self.lock:
+            requested = title in self.requested
+        # A warm-started snapshot (no version) is reconciled with the backend right away
+        return version is None or requested or now - loaded_at >= self.intervals[title] - self.refresh_ahead
+
+    def _run(self):
+        while not self._stop.wait(self.tick):
+            for title in self.intervals:
+                if not self._is_due(title, time.monotonic()):
+                    continue
+                try:
+                    self.refresh(title)
+                    self.retry_at.pop(title, None)
+                except Exception as e:
+                    self.failures += 1
+                    self.retry_at[title] = time.monotonic() + self.retry_delay
+                    logger.warning("Refreshing snapshot of '%s' failed, serving the previous one: %s", title, e)
+
+
+class SharedFileLock:
+    """
+    Cross-process lock on `path` (flock), released by the OS if the holder
+    dies. Without fcntl (Windows) `acquire` succeeds right away.
+    """
+
+    def __init__(self, path, poll=0.1):
+        self.path = path
+        self.poll = poll
+        self._file = None
+
+    def acquire(self, timeout):
+        """Waits up to `timeout` seconds for the lock; returns False if it is still held elsewhere."""
+        if fcntl is None:
+            return True
+        self._file = open(self.path, "a")
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    self._file.close()
+                    self._file = None
+                    return False
+                time.sleep(self.poll)
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+def arrow_safe_frame(df):
+    """
+    Text version of object columns (and object categories), which Arrow can't
+    store when they mix numbers and strings, as they do after gspread
+    numericises cells (e.g. a Remark column holding 5 and "x").
+    """
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        is_category = isinstance(series.dtype, pd.CategoricalDtype)
+        if series.dtype == object or (is_category and series.cat.categories.dtype == object):
+            text = series.astype(object).where(series.isna(), series.astype(str)) # Missing values stay missing
+            columns[col] = text.astype("category") if is_category else text
+    return df.assign(**columns) if columns else df
+
+
+class DiskSnapshotStore:
+    """
+    Last good snapshot of each worksheet as an uncompressed Arrow IPC file in
+    `directory`, memory-mapped on load, so a restarted process can serve data
+    before the first download finishes. `meta` (JSON-serialisable) is stored
+    in the file's schema metadata. Object columns are stored as text (see
+    `arrow_safe_frame`). Needs pyarrow; without it `available` is False and
+    nothing is persisted.
+    """
+
+    META_KEY = b"timesheet"
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.available = pa is not None
+        if self.available:
+            os.makedirs(directory, exist_ok=True)
+
+    def path(self, title):
+        return os.path.join(self.directory, re.sub(r"[^\w.-]", "_", title) + ".arrow")
+
+    def save(self, title, df, meta=None):
+        if not self.available:
+            return False
+        table = pa.Table.from_pandas(arrow_safe_frame(df), preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[self.META_KEY] = json.dumps({"saved_at": time.time(), "meta": meta or {}}).encode()
+        table = table.replace_schema_metadata(metadata)
+        path = self.path(title)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, path) # Readers only ever see a complete file
+        return True
+
+    def lock(self, title):
+        """A SharedFileLock for coordinating who downloads and saves `title`."""
+        return SharedFileLock(self.path(title) + ".lock")
+
+    def discard(self, title):
+        """Removes the snapshot of `title`, if there is one."""
+        try:
+            os.remove(self.path(title))
+        except FileNotFoundError:
+            pass
+
+    def load(self, title):
+        """Returns (frame, meta, age in seconds) or None if there is no snapshot."""
+        path = self.path(title)
+        if not self.available or not os.path.exists(path):
+            return None
+        # Not closed explicitly: buffers taken zero-copy from the map keep it alive for as long as they need it
+        table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+        stored = json.loads((table.schema.metadata or {}).get(self.META_KEY, b"{}"))
+        age = max(0.0, time.time() - stored.get("saved_at", os.path.getmtime(path)))
+        return table.to_pandas(), stored.get("meta", {}), age
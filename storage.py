@@ -0,0 +1,1135 @@
+"""
+Storage backends for the Timesheet app.
+
+The app talks to worksheets through a small gspread-like interface
+(`get_all_records`, `row_values`, `col_values`, `append_row(s)`,
+`update_cell`, `delete_rows`). `GoogleSheetsBackend` hands out real gspread
+worksheets, `SQLiteBackend` keeps the same tables in a local SQLite file so the
+app can run (and be profiled / load-tested) without Google Sheets.
+
+`ScheduledBackend` wraps either one so every request goes through a
+`RequestScheduler` (quota budget, retries, merged reads); `FaultInjectingBackend`
+adds latency and quota errors for load tests.
+"""
+import json
+import logging
+import queue
+import random
+import sqlite3
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class WorksheetNotFound(Exception):
+    """Raised by a backend when the requested worksheet does not exist."""
+
+
+class StorageBackend:
+    """Base class for storage backends. Subclasses return worksheet objects."""
+    name = "base"
+
+    def worksheet(self, title):
+        raise NotImplementedError
+
+    def worksheet_titles(self):
+        raise NotImplementedError
+
+    def create_worksheet(self, title, header):
+        raise NotImplementedError
+
+    def read_tail(self, title, start_row):
+        """Returns (header, rows) where rows are the raw values from `start_row` to the end."""
+        raise NotImplementedError
+
+    def update_cells(self, title, cells):
+        """Writes [(row, col, value), ...] (1-based) in one request."""
+        raise NotImplementedError
+
+
+# --- Google Sheets ---
+def _column_letter(col):
+    letters = ""
+    while col > 0:
+        col, rem = divmod(col - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+class GoogleSheetsBackend(StorageBackend):
+    """
+    Backend on top of an authorized gspread client.
+
+    The spreadsheet is opened once and every worksheet handle is resolved with a
+    single metadata call; helpers then reuse the handles from the registry.
+    """
+    name = "gsheets"
+
+    def __init__(self, client, spreadsheet_id, credentials=None):
+        self.client = client
+        self.spreadsheet_id = spreadsheet_id
+        self.credentials = credentials
+        self.lock = threading.Lock()
+        self.timings = {}
+        self._spreadsheet = None
+        self._worksheets = {}
+
+    def _timed(self, phase, func):
+        started = time.perf_counter()
+        result = func()
+        self.timings[phase] = time.perf_counter() - started
+        logger.info("%s took %.3fs", phase, self.timings[phase])
+        return result
+
+    def open(self):
+        """Opens the spreadsheet and resolves all worksheet handles."""
+        self._spreadsheet = self._timed("open_spreadsheet", lambda: self.client.open_by_key(self.spreadsheet_id))
+        self.refresh_worksheets()
+        return self
+
+    def spreadsheet(self):
+        if self._spreadsheet is None:
+            self.open()
+        return self._spreadsheet
+
+    def refresh_worksheets(self):
+        """Re-reads the worksheet list (one metadata call) into the handle registry."""
+        handles = self._timed("resolve_worksheets", lambda: {ws.title: ws for ws in self.spreadsheet().worksheets()})
+        with self.lock:
+            self._worksheets = handles
+
+    def worksheet(self, title):
+        with self.lock:
+            ws = self._worksheets.get(title)
+        if ws is None:
+            # Might have been added since the registry was filled
+            self.refresh_worksheets()
+            with self.lock:
+                ws = self._worksheets.get(title)
+            if ws is None:
+                raise WorksheetNotFound(title)
+        return ws
+
+    def worksheet_titles(self):
+        self.refresh_worksheets()
+        with self.lock:
+            return list(self._worksheets)
+
+    def create_worksheet(self, title, header):
+        ws = self.spreadsheet().add_worksheet(title=title, rows=1000, cols=max(len(header), 1))
+        ws.append_row(list(header))
+        with self.lock:
+            self._worksheets[title] = ws
+        return ws
+
+    def read_tail(self, title, start_row):
+        ws = self.worksheet(title)
+        # One request for both the header and the tail of the sheet. The tail range is open-ended
+        # ("A5:L") because the cached row count of a registry handle does not grow with appends.
+        header_range, tail_range = ws.batch_get(["1:1", f"A{start_row}:{_column_letter(max(ws.col_count, 1))}"])
+        header = list(header_range[0]) if header_range else []
+        return header, [list(r) for r in tail_range]
+
+    def update_cells(self, title, cells):
+        ws = self.worksheet(title)
+        data = [{"range": f"{_column_letter(col)}{row}", "values": [[value]]} for row, col, value in cells]
+        # Same input option as update_cell(), so values are parsed as if typed in
+        ws.batch_update(data, value_input_option="USER_ENTERED")
+
+    def start_credential_refresh(self, margin=300, check_interval=60):
+        """Refreshes the access token in the background before it expires, so no request waits for it."""
+        if self.credentials is None:
+            return
+
+        def run():
+            from google.auth.transport.requests import Request
+            while True:
+                expiry = self.credentials.expiry # naive UTC
+                now = datetime.now(timezone.utc).replace(tzinfo=None)
+                if not self.credentials.valid or expiry is None or expiry - now < timedelta(seconds=margin):
+                    try:
+                        self._timed("refresh_credentials", lambda: self.credentials.refresh(Request()))
+                    except Exception as e:
+                        logger.warning("Credential refresh failed: %s", e)
+                time.sleep(check_interval)
+
+        threading.Thread(target=run, name="credential-refresh", daemon=True).start()
+
+
+# --- Request scheduling ---
+class QuotaExceeded(Exception):
+    """Quota / rate-limit error (raised by FaultInjectingBackend, treated like an HTTP 429)."""
+
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def _status_code(error):
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None) or getattr(error, "code", None)
+
+
+def is_retryable_error(error):
+    """Quota errors, transient server errors (gspread APIError 429/5xx) and connection problems."""
+    if isinstance(error, (QuotaExceeded, ConnectionError, TimeoutError)):
+        return True
+    return _status_code(error) in RETRYABLE_STATUS_CODES
+
+
+def is_rejected_error(error):
+    """
+    Quota errors only (HTTP 429): the request was refused before it did anything.
+    After a 5xx, a timeout or a dropped connection an append may still have been
+    written, so writes are not retried on those.
+    """
+    return isinstance(error, QuotaExceeded) or _status_code(error) == 429
+
+
+class RequestScheduler:
+    """
+    Runs backend requests under a per-minute read and write budget, retries
+    retryable errors (`is_retryable` for reads, `is_retryable_write` for
+    writes, which aren't idempotent) with jittered exponential backoff and
+    merges identical concurrent reads into one request. Counts calls,
+    throttled (had to wait for budget), retried, coalesced and failed
+    requests in `counters`.
+    """
+
+    def __init__(self, reads_per_minute=60, writes_per_minute=60, max_retries=5, base_delay=1.0, max_delay=32.0,
+                 is_retryable=is_retryable_error, is_retryable_write=is_rejected_error, sleep=time.sleep,
+                 clock=time.monotonic):
+        self.budgets = {"read": reads_per_minute, "write": writes_per_minute}
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.is_retryable = {"read": is_retryable, "write": is_retryable_write}
+        self.sleep = sleep
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.sent = {"read": deque(), "write": deque()}
+        self.in_flight = {}
+        self.counters = {"calls": 0, "throttled": 0, "retried": 0, "coalesced": 0, "failed": 0}
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def _acquire(self, kind):
+        """Waits until the rolling 60s window has room for one more request of this kind."""
+        throttled = False
+        while True:
+            with self.lock:
+                now = self.clock()
+                sent = self.sent[kind]
+                while sent and sent[0] <= now - 60:
+                    sent.popleft()
+                if len(sent) < self.budgets[kind]:
+                    sent.append(now)
+                    return
+                wait = sent[0] + 60 - now
+            if not throttled:
+                self._count("throttled")
+                throttled = True
+            self.sleep(max(wait, 0.01))
+
+    def _run(self, kind, func, args, kwargs):
+        for attempt in range(self.max_retries + 1):
+            self._acquire(kind)
+            self._count("calls")
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if attempt == self.max_retries or not self.is_retryable[kind](e):
+                    self._count("failed")
+                    raise
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+                self._count("retried")
+                logger.warning("Request failed (%s), retry %d in ~%.1fs", e, attempt + 1, delay)
+                self.sleep(random.uniform(delay / 2, delay))
+
+    def call(self, kind, func, *args, coalesce_key=None, **kwargs):
+        """Runs `func` as a "read" or "write". Reads with the same `coalesce_key` share one request."""
+        if kind != "read" or coalesce_key is None:
+            return self._run(kind, func, args, kwargs)
+        with self.lock:
+            future = self.in_flight.get(coalesce_key)
+            leader = future is None
+            if leader:
+                future = self.in_flight[coalesce_key] = Future()
+        if not leader:
+            self._count("coalesced")
+            return future.result()
+        try:
+            result = self._run(kind, func, args, kwargs)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(coalesce_key, None)
+
+
+# Worksheet methods that hit the API, by request kind
+WORKSHEET_READ_METHODS = {"get_all_records", "get_all_values", "row_values", "col_values", "batch_get", "get", "get_values"}
+WORKSHEET_WRITE_METHODS = {"append_row", "append_rows", "update_cell", "update", "batch_update", "delete_rows"}
+
+
+class WorksheetProxy:
+    """Worksheet wrapper that passes API methods through `wrap(kind, name, method)`."""
+
+    def __init__(self, worksheet, wrap):
+        self._worksheet = worksheet
+        self._wrap = wrap
+
+    def __getattr__(self, name):
+        attr = getattr(self._worksheet, name)
+        if name in WORKSHEET_READ_METHODS:
+            return self._wrap("read", name, attr)
+        if name in WORKSHEET_WRITE_METHODS:
+            return self._wrap("write", name, attr)
+        return attr
+
+
+class BackendWrapper(StorageBackend):
+    """Base for backends that wrap another backend; unknown attributes go to the inner one."""
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    @property
+    def name(self):
+        return self.inner.name
+
+    def __getattr__(self, name):
+        if name == "inner":
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+    def _wrap(self, kind, name, method, title=None):
+        raise NotImplementedError
+
+    def worksheet(self, title):
+        ws = self.inner.worksheet(title)
+        return WorksheetProxy(ws, lambda kind, name, method: self._wrap(kind, name, method, title))
+
+    def worksheet_titles(self):
+        return self._wrap("read", "worksheet_titles", self.inner.worksheet_titles)()
+
+    def create_worksheet(self, title, header):
+        ws = self._wrap("write", "create_worksheet", self.inner.create_worksheet, title)(title, header)
+        return WorksheetProxy(ws, lambda kind, name, method: self._wrap(kind, name, method, title))
+
+    def read_tail(self, title, start_row):
+        return self._wrap("read", "read_tail", self.inner.read_tail, title)(title, start_row)
+
+    def update_cells(self, title, cells):
+        return self._wrap("write", "update_cells", self.inner.update_cells, title)(title, cells)
+
+
+class ScheduledBackend(BackendWrapper):
+    """Routes every request of the inner backend through a RequestScheduler."""
+
+    def __init__(self, inner, scheduler):
+        super().__init__(inner)
+        self.scheduler = scheduler
+
+    def _wrap(self, kind, name, method, title=None):
+        def scheduled(*args, **kwargs):
+            coalesce_key = (title, name, repr(args), repr(sorted(kwargs.items()))) if kind == "read" else None
+            return self.scheduler.call(kind, method, *args, coalesce_key=coalesce_key, **kwargs)
+        return scheduled
+
+
+class FaultInjectingBackend(BackendWrapper):
+    """
+    Local fake for load tests: adds `latency` seconds to every request and fails
+    a fraction `error_rate` of them with QuotaExceeded.
+    """
+
+    def __init__(self, inner, latency=0.0, error_rate=0.0, seed=None):
+        super().__init__(inner)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+
+    def _wrap(self, kind, name, method, title=None):
+        def faulty(*args, **kwargs):
+            if self.latency:
+                time.sleep(self.latency)
+            if self.random.random() < self.error_rate:
+                raise QuotaExceeded(f"Injected quota error on {name} ({title})")
+            return method(*args, **kwargs)
+        return faulty
+
+
+# --- SQLite ---
+def _numericise(value):
+    """Mimics gspread's numericise(): numeric-looking strings become int/float."""
+    if not isinstance(value, str) or value == "" or "_" in value:
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+class SQLiteWorksheet:
+    """
+    A worksheet stored in SQLite. Row 1 is the header, like in Google Sheets,
+    and row numbers shift up after `delete_rows` the same way.
+    """
+
+    def __init__(self, backend, title):
+        self.backend = backend
+        self.title = title
+
+    def _rows(self, start=1, end=None):
+        sql = "SELECT data FROM sheet_rows WHERE sheet = ? AND pos >= ?"
+        params = [self.title, start]
+        if end is not None:
+            sql += " AND pos <= ?"
+            params.append(end)
+        sql += " ORDER BY pos"
+        with self.backend.lock:
+            cur = self.backend.conn.execute(sql, params)
+            return [json.loads(r[0]) for r in cur.fetchall()]
+
+    @property
+    def row_count(self):
+        with self.backend.lock:
+            cur = self.backend.conn.execute("SELECT COUNT(*) FROM sheet_rows WHERE sheet = ?", (self.title,))
+            return cur.fetchone()[0]
+
+    def get_all_values(self):
+        rows = self._rows()
+        width = max((len(r) for r in rows), default=0)
+        return [["" if v is None else str(v) for v in r] + [""] * (width - len(r)) for r in rows]
+
+    def get_raw_rows(self, start=1):
+        """Rows from `start` as strings with trailing blanks trimmed (like the Sheets values API)."""
+        result = []
+        for r in self._rows(start):
+            values = ["" if v is None else str(v) for v in r]
+            while values and values[-1] == "":
+                values.pop()
+            result.append(values)
+        return result
+
+    def get_all_records(self):
+        rows = self._rows()
+        if not rows:
+            return []
+        header = rows[0]
+        records = []
+        for r in rows[1:]:
+            r = r + [""] * (len(header) - len(r))
+            records.append({h: _numericise(v) for h, v in zip(header, r)})
+        return records
+
+    def row_values(self, row):
+        rows = self._rows(row, row)
+        if not rows:
+            return []
+        values = rows[0]
+        while values and values[-1] in ("", None):
+            values = values[:-1]
+        return ["" if v is None else str(v) for v in values]
+
+    def col_values(self, col):
+        values = []
+        for r in self._rows():
+            v = r[col - 1] if len(r) >= col else ""
+            values.append("" if v is None else str(v))
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    def append_row(self, values):
+        self.append_rows([values])
+
+    def append_rows(self, values):
+        with self.backend.lock, self.backend.conn:
+            cur = self.backend.conn.execute("SELECT COALESCE(MAX(pos), 0) FROM sheet_rows WHERE sheet = ?", (self.title,))
+            pos = cur.fetchone()[0]
+            self.backend.conn.executemany(
+                "INSERT INTO sheet_rows (sheet, pos, data) VALUES (?, ?, ?)",
+                [(self.title, pos + i + 1, json.dumps(list(row), default=str)) for i, row in enumerate(values)]
+            )
+
+    def update_cell(self, row, col, value):
+        with self.backend.lock, self.backend.conn:
+            cur = self.backend.conn.execute("SELECT data FROM sheet_rows WHERE sheet = ? AND pos = ?", (self.title, row))
+            found = cur.fetchone()
+            data = json.loads(found[0]) if found else []
+            data = data + [""] * (col - len(data))
+            data[col - 1] = value
+            self.backend.conn.execute(
+                "INSERT OR REPLACE INTO sheet_rows (sheet, pos, data) VALUES (?, ?, ?)",
+                (self.title, row, json.dumps(data, default=str))
+            )
+
+    def delete_rows(self, start_index, end_index=None):
+        end_index = start_index if end_index is None else end_index
+        with self.backend.lock, self.backend.conn:
+            self.backend.conn.execute(
+                "DELETE FROM sheet_rows WHERE sheet = ? AND pos BETWEEN ? AND ?",
+                (self.title, start_index, end_index)
+            )
+            # Shift the following rows up, like deleting rows in a spreadsheet
+            self.backend.conn.execute(
+                "UPDATE sheet_rows SET pos = -(pos - ?) WHERE sheet = ? AND pos > ?",
+                (end_index - start_index + 1, self.title, end_index)
+            )
+            self.backend.conn.execute(
+                "UPDATE sheet_rows SET pos = -pos WHERE sheet = ? AND pos < 0",
+                (self.title,)
+            )
+
+
+class SQLiteBackend(StorageBackend):
+    """Local backend storing every worksheet in one SQLite file."""
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.timings = {}
+        # Streamlit sessions run on different threads; access is serialized by self.lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS sheets (title TEXT PRIMARY KEY)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS sheet_rows ("
+                "sheet TEXT NOT NULL, pos INTEGER NOT NULL, data TEXT NOT NULL, "
+                "PRIMARY KEY (sheet, pos))"
+            )
+
+    def worksheet(self, title):
+        with self.lock:
+            cur = self.conn.execute("SELECT 1 FROM sheets WHERE title = ?", (title,))
+            if cur.fetchone() is None:
+                raise WorksheetNotFound(title)
+        return SQLiteWorksheet(self, title)
+
+    def worksheet_titles(self):
+        with self.lock:
+            return [r[0] for r in self.conn.execute("SELECT title FROM sheets ORDER BY rowid")]
+
+    def create_worksheet(self, title, header):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO sheets (title) VALUES (?)", (title,))
+        ws = SQLiteWorksheet(self, title)
+        if ws.row_count == 0:
+            ws.append_row(list(header))
+        return ws
+
+    def update_cells(self, title, cells):
+        ws = self.worksheet(title)
+        with self.lock:
+            for row, col, value in cells:
+                ws.update_cell(row, col, value)
+
+    def read_tail(self, title, start_row):
+        ws = self.worksheet(title)
+        header_rows = ws.get_raw_rows(1)
+        header = header_rows[0] if header_rows else []
+        return header, ws.get_raw_rows(start_row)
+
+
+# --- Incremental sync ---
+class SheetRowMap:
+    """
+    Key -> sheet row and header -> column of a worksheet, read from the header
+    row and the key column only, so cell writes don't need the whole sheet.
+    """
+
+    def __init__(self, header, key_column, key_values):
+        self.header = list(header)
+        self.key_column = key_column
+        # key_values[0] is the header cell, data starts at sheet row 2
+        self.rows = {str(value).strip(): row for row, value in enumerate(key_values[1:], start=2)}
+
+    @classmethod
+    def load(cls, worksheet, key_column):
+        header = worksheet.row_values(1)
+        if key_column not in header:
+            return cls(header, key_column, [key_column])
+        return cls(header, key_column, worksheet.col_values(header.index(key_column) + 1))
+
+    def with_current_keys(self, worksheet):
+        """Same header, key column re-read (one request), so rows moved since `load` are found where they are now."""
+        if self.key_column not in self.header:
+            return self
+        return SheetRowMap(self.header, self.key_column, worksheet.col_values(self.header.index(self.key_column) + 1))
+
+    def row_of(self, key):
+        return self.rows.get(str(key).strip())
+
+    def col_of(self, column_name):
+        return self.header.index(column_name) + 1 if column_name in self.header else None
+
+
+def records_frame(header, rows):
+    """Builds a DataFrame from raw sheet rows the same way get_all_records() would."""
+    width = len(header)
+    records = [[_numericise(v) for v in (list(r) + [""] * (width - len(r)))[:width]] for r in rows]
+    return pd.DataFrame(records, columns=header)
+
+
+def apply_schema(df, schema):
+    """
+    Converts columns to compact dtypes. `schema` maps column -> "datetime",
+    "category" or a NumPy numeric dtype such as "float32". Missing columns are skipped.
+    """
+    df = df.copy(deep=False)
+    for col, kind in schema.items():
+        if col not in df.columns:
+            continue
+        if kind == "datetime":
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+        elif kind == "category":
+            df[col] = df[col].astype("category")
+        else:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(kind)
+    return df
+
+
+def concat_typed(old, new, schema):
+    """Appends `new` to `old` (both typed with `schema`) keeping categorical columns categorical."""
+    old = old.copy(deep=False)
+    new = new.copy(deep=False)
+    for col, kind in schema.items():
+        if kind != "category" or col not in old.columns or col not in new.columns:
+            continue
+        try:
+            # Adding categories at the end keeps the existing codes, so the old rows are not recoded
+            extra = new[col].cat.categories.difference(old[col].cat.categories)
+            if len(extra):
+                old[col] = old[col].cat.add_categories(extra)
+            new[col] = new[col].cat.set_categories(old[col].cat.categories)
+        except TypeError:
+            # Categories of different types (e.g. numbers and text), let concat fall back to object
+            pass
+    df = pd.concat([old, new], ignore_index=True)
+    # Columns whose categories could not be merged came out of concat as object
+    leftover = {col: kind for col, kind in schema.items()
+                if kind == "category" and col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype)}
+    return apply_schema(df, leftover)
+
+
+def key_index(df, key_columns):
+    """Set of key tuples (as strings) for the given columns of a DataFrame."""
+    if df.empty or any(col not in df.columns for col in key_columns):
+        return set()
+    columns = []
+    for col in key_columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            # Typed dates are keyed the way they are written to the sheet
+            columns.append(df[col].dt.strftime("%Y-%m-%d"))
+        else:
+            columns.append(df[col].astype(str))
+    return set(zip(*columns))
+
+
+class ValueIndex:
+    """
+    Secondary index: value -> sorted array of row positions, over one or more
+    columns (a row is listed under every value it has in any of the columns).
+    Empty strings and missing values are not indexed.
+    """
+
+    def __init__(self, columns, positions=None):
+        self.columns = list(columns)
+        self.positions = positions or {}
+
+    @classmethod
+    def build(cls, df, columns, offset=0):
+        positions = {}
+        for col in columns:
+            if col not in df.columns or df.empty:
+                continue
+            for value, rows in df.groupby(col, observed=True, sort=False).indices.items():
+                if value == "":
+                    continue
+                rows = rows + offset
+                positions[value] = np.union1d(positions[value], rows) if value in positions else rows
+        return cls(columns, positions)
+
+    def extended(self, new_df, offset):
+        """New index that also covers `new_df`, whose first row sits at position `offset`."""
+        positions = dict(self.positions)
+        for value, rows in ValueIndex.build(new_df, self.columns, offset).positions.items():
+            # Appended rows come after every existing position, so the arrays stay sorted
+            positions[value] = np.concatenate([positions[value], rows]) if value in positions else rows
+        return ValueIndex(self.columns, positions)
+
+    def keys(self):
+        return sorted(self.positions, key=str)
+
+    def get(self, value):
+        return self.positions.get(value, np.empty(0, dtype=np.intp))
+
+
+def build_value_indexes(df, index_columns):
+    """{name: ValueIndex} for `index_columns` mapping an index name to its columns."""
+    return {name: ValueIndex.build(df, columns) for name, columns in index_columns.items()}
+
+
+def select_positions(indexes, selections):
+    """
+    Sorted row positions matching every {index name: value} in `selections`
+    (the intersection of the index entries), or None if nothing is selected,
+    i.e. all rows match.
+    """
+    selected = None
+    for name, value in selections.items():
+        positions = indexes[name].get(value)
+        selected = positions if selected is None else np.intersect1d(selected, positions, assume_unique=True)
+    return selected
+
+
+class AppendOnlySync:
+    """
+    Keeps a DataFrame of an append-only worksheet (e.g. 'presensi') and, on each
+    sync, only fetches the rows added since the previous sync.
+
+    The last loaded row is re-read as an anchor: if it changed or disappeared,
+    or if the header changed, rows were edited/deleted and we do a full reload.
+    Edits to earlier rows don't move the anchor, so with `full_reload_interval`
+    (seconds) the whole sheet is also reloaded once that much time has passed
+    since the last full reload.
+
+    If `key_columns` is given, a set of those key tuples is kept up to date as
+    well, so duplicate checks don't have to scan the frame. If `schema` is given
+    (see `apply_schema`), rows are typed once when they are loaded.
+    `index_columns` ({name: [columns]}) adds `ValueIndex`es that are extended
+    with each batch of appended rows. A `rollup` (an object with `rebuild(df)`
+    and `add(df)`, e.g. rollups.HoursRollup) is kept up to date the same way.
+
+    The frame is replaced, never modified in place, so a frame handed out by
+    `sync()` can be shared by readers.
+    """
+
+    def __init__(self, title, key_columns=None, schema=None, index_columns=None, rollup=None,
+                 full_reload_interval=None, clock=time.monotonic):
+        self.title = title
+        self.key_columns = tuple(key_columns or ())
+        self.schema = schema or {}
+        self.index_columns = index_columns or {}
+        self.indexes = {}
+        self.rollup = rollup
+        self.keys = set()
+        self.lock = threading.Lock()
+        self.header = None
+        self.df = None
+        self.rows_loaded = 0
+        self.last_row = None
+        self.full_reload_interval = full_reload_interval
+        self.clock = clock
+        self.reloaded_at = None
+        self.full_reloads = 0
+        self.incremental_syncs = 0
+
+    def _reload_due(self):
+        return (self.full_reload_interval is not None and self.reloaded_at is not None
+                and self.clock() - self.reloaded_at >= self.full_reload_interval)
+
+    def _full_reload(self, backend):
+        header, rows = backend.read_tail(self.title, 2)
+        self.header = header
+        df = records_frame(header, rows)
+        self.keys = key_index(df, self.key_columns)
+        self.df = apply_schema(df, self.schema)
+        self.indexes = build_value_indexes(self.df, self.index_columns)
+        if self.rollup is not None:
+            self.rollup.rebuild(self.df)
+        self.rows_loaded = len(rows)
+        self.last_row = rows[-1] if rows else None
+        self.reloaded_at = self.clock()
+        self.full_reloads += 1
+        return self.df
+
+    def sync(self, backend):
+        with self.lock:
+            if self.df is None or self._reload_due():
+                return self._full_reload(backend)
+
+            # Sheet row of the last loaded record is rows_loaded + 1 (row 1 is the header)
+            start_row = self.rows_loaded + 1 if self.rows_loaded else 2
+            header, rows = backend.read_tail(self.title, start_row)
+            if header != self.header:
+                return self._full_reload(backend)
+            if self.rows_loaded:
+                if not rows or rows[0] != self.last_row:
+                    return self._full_reload(backend)
+                rows = rows[1:]
+
+            if rows:
+                new_df = records_frame(header, rows)
+                self.keys |= key_index(new_df, self.key_columns)
+                new_df = apply_schema(new_df, self.schema)
+                self.indexes = {name: index.extended(new_df, len(self.df)) for name, index in self.indexes.items()}
+                if self.rollup is not None:
+                    self.rollup.add(new_df)
+                self.df = concat_typed(self.df, new_df, self.schema)
+                self.rows_loaded += len(rows)
+                self.last_row = rows[-1]
+            self.incremental_syncs += 1
+            return self.df
+
+    def state(self):
+        """(frame, sync position) to persist with the frame, see `restore`."""
+        with self.lock:
+            reload_age = self.clock() - self.reloaded_at if self.reloaded_at is not None else None
+            return self.df, {"header": self.header, "rows_loaded": self.rows_loaded, "last_row": self.last_row,
+                             "full_reload_at": time.time() - reload_age if reload_age is not None else None}
+
+    def restore(self, df, state):
+        """
+        Starts from a previously persisted frame and sync position instead of an
+        empty one; the next `sync()` only fetches what was appended since (or
+        reloads fully if the anchor row no longer matches, or if the frame's
+        last full reload is older than `full_reload_interval`). Does nothing if
+        the sync already has a frame.
+        """
+        with self.lock:
+            if self.df is not None:
+                return self.df
+            full_reload_at = state.get("full_reload_at")
+            # States saved before this was tracked count as due for a full reload
+            reload_age = time.time() - full_reload_at if full_reload_at is not None else float("inf")
+            self.reloaded_at = self.clock() - max(reload_age, 0.0)
+            self.header = state["header"]
+            self.rows_loaded = state["rows_loaded"]
+            self.last_row = state["last_row"]
+            self.keys = key_index(df, self.key_columns)
+            self.df = df
+            self.indexes = build_value_indexes(df, self.index_columns)
+            if self.rollup is not None:
+                self.rollup.rebuild(df)
+            return self.df
+
+    def indexes_for(self, df):
+        """Indexes matching a frame returned by `sync()`, rebuilt if the sync has moved on since."""
+        with self.lock:
+            if df is self.df:
+                return self.indexes
+        return build_value_indexes(df, self.index_columns)
+
+    def add_keys(self, keys):
+        """Registers keys of rows we just appended, before the next sync picks the rows up."""
+        with self.lock:
+            self.keys |= {tuple(str(v) for v in key) for key in keys}
+
+
+# --- Month partitions ---
+class MonthPartitionedSheet:
+    """
+    An append-only sheet split into one worksheet per month, e.g.
+    'presensi_2025_01', 'presensi_2025_02', ... The manifest is the list of
+    partition worksheets that exist in the backend. An existing unpartitioned
+    sheet is split into partitions once with `import_sheet`.
+
+    `load_range` only touches the partitions overlapping the requested dates.
+    Each partition has its own `AppendOnlySync`; closed partitions (older than
+    the previous month) are not re-synced once loaded unless rows were written
+    to them through `append_rows`. With a `rollup_factory` (e.g.
+    rollups.HoursRollup) each partition's sync also keeps its own rollup.
+    """
+    manifest_ttl = 60 # seconds before the partition list is re-read
+
+    def __init__(self, base_title, header, date_column="Date", key_columns=None, schema=None, rollup_factory=None,
+                 full_reload_interval=None):
+        self.base_title = base_title
+        self.header = list(header)
+        self.date_column = date_column
+        self.key_columns = key_columns
+        self.schema = schema or {}
+        self.rollup_factory = rollup_factory
+        self.full_reload_interval = full_reload_interval
+        self.lock = threading.Lock()
+        self.syncs = {}
+        self.dirty = set()
+        self._manifest = None
+        self._manifest_loaded_at = 0.0
+        self._migrated = False
+
+    def partition_title(self, month):
+        return f"{self.base_title}_{month}"
+
+    @staticmethod
+    def month_of(value):
+        return pd.Timestamp(value).strftime("%Y_%m")
+
+    @staticmethod
+    def months_between(start, end):
+        return [p.strftime("%Y_%m") for p in pd.period_range(pd.Timestamp(start), pd.Timestamp(end), freq="M")]
+
+    @staticmethod
+    def is_closed(month):
+        # Late submissions for last month are common, so only older months count as closed
+        return month < (pd.Timestamp.today().to_period("M") - 1).strftime("%Y_%m")
+
+    def manifest(self, backend, refresh=False):
+        """{month: worksheet title} of the existing partitions."""
+        with self.lock:
+            if refresh or self._manifest is None or time.monotonic() - self._manifest_loaded_at > self.manifest_ttl:
+                prefix = f"{self.base_title}_"
+                titles = backend.worksheet_titles()
+                self._manifest = {
+                    title[len(prefix):]: title for title in titles
+                    if title.startswith(prefix) and len(title) == len(prefix) + 7
+                }
+                self._migrated = self.marker_title in titles
+                self._manifest_loaded_at = time.monotonic()
+            return dict(self._manifest)
+
+    def _sync_for(self, month):
+        with self.lock:
+            if month not in self.syncs:
+                rollup = self.rollup_factory() if self.rollup_factory else None
+                self.syncs[month] = AppendOnlySync(self.partition_title(month), key_columns=self.key_columns,
+                                                   schema=self.schema, rollup=rollup,
+                                                   full_reload_interval=self.full_reload_interval)
+            return self.syncs[month]
+
+    def load_month(self, backend, month):
+        sync = self._sync_for(month)
+        with self.lock:
+            needs_sync = sync.df is None or month in self.dirty or not self.is_closed(month)
+            self.dirty.discard(month)
+        return sync.sync(backend) if needs_sync else sync.df
+
+    def load_range(self, backend, start, end):
+        """Typed frame of all rows in the partitions overlapping [start, end]."""
+        manifest = self.manifest(backend)
+        frames = [self.load_month(backend, month) for month in self.months_between(start, end) if month in manifest]
+        if not frames:
+            return apply_schema(pd.DataFrame(columns=self.header), self.schema)
+        df = frames[0]
+        for frame in frames[1:]:
+            df = concat_typed(df, frame, self.schema)
+        return df
+
+    def rollups(self, backend):
+        """Rollups of every partition, each brought up to date like `load_month` (needs a `rollup_factory`)."""
+        months = sorted(self.manifest(backend))
+        for month in months:
+            self.load_month(backend, month)
+        return [self._sync_for(month).rollup for month in months]
+
+    def keys_for(self, backend, months):
+        """(Id, Date)-style keys of the given months, syncing only those partitions."""
+        manifest = self.manifest(backend)
+        keys = set()
+        for month in set(months):
+            if month in manifest:
+                self.load_month(backend, month)
+                keys |= self._sync_for(month).keys
+        return keys
+
+    def cached_keys(self, months):
+        """Keys of the given months as far as they are loaded in this process; no backend request."""
+        with self.lock:
+            syncs = [self.syncs[month] for month in set(months) if month in self.syncs]
+        keys = set()
+        for sync in syncs:
+            with sync.lock:
+                keys |= sync.keys
+        return keys
+
+    def append_rows(self, backend, rows):
+        """Appends rows to their month partitions, creating partitions as needed. Returns the months written."""
+        date_idx = self.header.index(self.date_column)
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(self.month_of(row[date_idx]), []).append(row)
+        manifest = self.manifest(backend)
+        for month, month_rows in sorted(by_month.items()):
+            if month in manifest:
+                worksheet = backend.worksheet(manifest[month])
+            else:
+                worksheet = backend.create_worksheet(self.partition_title(month), self.header)
+                with self.lock:
+                    self._manifest[month] = worksheet.title
+            worksheet.append_rows(month_rows)
+            if self.key_columns:
+                key_idx = [self.header.index(col) for col in self.key_columns]
+                self._sync_for(month).add_keys([[row[i] for i in key_idx] for row in month_rows])
+            with self.lock:
+                self.dirty.add(month)
+        return sorted(by_month)
+
+    @property
+    def marker_title(self):
+        """Worksheet whose existence records that `import_sheet` ran to completion."""
+        return f"{self.base_title}_migrated"
+
+    def is_migrated(self, backend, refresh=False):
+        self.manifest(backend, refresh=refresh)
+        return self._migrated
+
+    @staticmethod
+    def _row_key(row):
+        # Sheets drops trailing blank cells when reading rows back
+        values = [str(v) for v in row]
+        while values and values[-1] == "":
+            values.pop()
+        return tuple(values)
+
+    def import_sheet(self, backend, source_title):
+        """
+        One-off split of an existing unpartitioned sheet into month partitions,
+        finished by creating the `marker_title` worksheet. Safe to re-run after a
+        partial failure: rows a partition already has (compared as whole rows)
+        are not appended again. Does nothing once the marker exists. Returns the
+        number of rows appended.
+        """
+        if self.is_migrated(backend, refresh=True):
+            return 0
+        header, rows = backend.read_tail(source_title, 2)
+        date_idx = header.index(self.date_column)
+        width = len(self.header)
+        # Reorder the columns to the partition header
+        positions = [header.index(col) if col in header else None for col in self.header]
+        rows = [[(row[i] if i is not None and i < len(row) else "") for i in positions][:width] for row in rows
+                if date_idx < len(row) and row[date_idx]]
+        new_date_idx = self.header.index(self.date_column)
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(self.month_of(row[new_date_idx]), []).append(row)
+
+        manifest = self.manifest(backend)
+        appended = 0
+        for month, month_rows in sorted(by_month.items()):
+            if month in manifest:
+                # Rows copied by an earlier, interrupted run
+                _, existing = backend.read_tail(manifest[month], 2)
+                already = Counter(self._row_key(row) for row in existing)
+                missing = []
+                for row in month_rows:
+                    key = self._row_key(row)
+                    if already[key]:
+                        already[key] -= 1
+                    else:
+                        missing.append(row)
+                month_rows = missing
+            if month_rows:
+                self.append_rows(backend, month_rows)
+                appended += len(month_rows)
+        marker = backend.create_worksheet(self.marker_title, ["Source", "Rows", "Completed at"])
+        marker.append_row([source_title, len(rows), time.strftime("%Y-%m-%d %H:%M:%S")])
+        with self.lock:
+            self._migrated = True
+        return appended
+
+
+# --- Batched background writer ---
+class BatchedAppendWriter:
+    """
+    Appends rows to a worksheet from a background thread.
+
+    Rows are queued (bounded) and written with one `append_rows` call when
+    `max_batch` rows are waiting or `flush_interval` seconds have passed.
+    A failed append is counted in `dropped`, not retried here (see `_write`).
+    `close()` flushes whatever is still queued.
+    """
+
+    def __init__(self, open_worksheet, max_batch=50, flush_interval=2.0, max_queue=10000, on_flush=None,
+                 name="batched-append-writer"):
+        self.open_worksheet = open_worksheet
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self):
+        """Rows queued or currently being written."""
+        return self._pending
+
+    def _add_pending(self, n):
+        with self._pending_lock:
+            self._pending += n
+
+    def submit(self, row, timeout=1.0):
+        """Queues a row. Raises queue.Full if the queue stays full for `timeout` seconds."""
+        if self._stop.is_set():
+            raise RuntimeError("Writer is closed.")
+        self._add_pending(1)
+        try:
+            self.queue.put(list(row), timeout=timeout)
+        except queue.Full:
+            self._add_pending(-1)
+            raise
+
+    def flush(self, timeout=30.0):
+        """Blocks until everything queued so far is written (or `timeout` runs out)."""
+        deadline = time.monotonic() + timeout
+        while self.pending and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return self.pending == 0
+
+    def close(self, timeout=30.0):
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _next_batch(self):
+        try:
+            batch = [self.queue.get(timeout=0 if self._stop.is_set() else self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            wait = 0 if self._stop.is_set() else max(0.0, deadline - time.monotonic())
+            try:
+                batch.append(self.queue.get(timeout=wait))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        # Retrying is left to the backend's scheduler, which only retries writes that were refused (429);
+        # after any other error the rows may already be in the sheet, so they are dropped, not re-sent
+        try:
+            self.open_worksheet().append_rows(batch)
+        except Exception as e:
+            self.last_error = e
+            self.dropped += len(batch)
+            logger.error("Dropping %d rows after a failed append: %s", len(batch), e)
+            return
+        self.written += len(batch)
+        if self.on_flush:
+            self.on_flush()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                try:
+                    self._write(batch)
+                finally:
+                    self._add_pending(-len(batch))
+            elif self._stop.is_set():
+                return
@@ -0,0 +1,54 @@
+from datetime import date, datetime
+
+import pytest
+
+from audit_archive import AuditLogArchive
+from storage import SQLiteBackend
+
+HEADER = ["Timestamp", "User ID", "Username", "Action", "Details", "Status"]
+
+
+def entry(timestamp, action="Login"):
+    return [timestamp, 7, "budi", action, "", "Success"]
+
+
+@pytest.fixture
+def backend():
+    backend = SQLiteBackend(":memory:")
+    backend.create_worksheet("audit_log", HEADER)
+    return backend
+
+
+def test_old_entries_move_to_monthly_archives(backend, tmp_path):
+    backend.worksheet("audit_log").append_rows([
+        entry("2025-01-05 08:00:00"), entry("2025-01-05 08:00:00"), entry("2025-02-10 09:30:00"),
+        entry("2025-03-01 07:00:00"),
+    ])
+    archive = AuditLogArchive(str(tmp_path))
+    assert archive.archive_old_entries(backend, "audit_log", datetime(2025, 3, 1)) == 3
+    assert archive.months() == ["2025-01", "2025-02"]
+    assert [r["Timestamp"] for r in backend.worksheet("audit_log").get_all_records()] == ["2025-03-01 07:00:00"]
+
+    archived = archive.load_range(date(2025, 1, 1), date(2025, 1, 31))
+    assert len(archived) == 2 # Identical entries logged in the same second are both kept
+    assert archive.load_range(date(2025, 2, 11), date(2025, 2, 28)).empty
+
+
+def test_rerun_after_an_interrupted_delete_adds_nothing_twice(backend, tmp_path):
+    backend.worksheet("audit_log").append_rows([entry("2025-01-05 08:00:00"), entry("2025-01-06 08:00:00")])
+    archive = AuditLogArchive(str(tmp_path))
+    header, rows = backend.read_tail("audit_log", 2)
+    archive._write_month("2025-01", header, rows[:1]) # Written to the archive, then the run died
+
+    assert archive.archive_old_entries(backend, "audit_log", datetime(2025, 2, 1)) == 2
+    assert len(archive.load_range(date(2025, 1, 1), date(2025, 1, 31))) == 2
+    assert archive.archive_old_entries(backend, "audit_log", datetime(2025, 2, 1)) == 0
+
+
+def test_only_the_leading_old_rows_are_moved(backend, tmp_path):
+    backend.worksheet("audit_log").append_rows([
+        entry("2025-01-05 08:00:00"), entry("2025-03-05 08:00:00"), entry("2025-01-07 08:00:00", "Late clock"),
+    ])
+    archive = AuditLogArchive(str(tmp_path))
+    assert archive.archive_old_entries(backend, "audit_log", datetime(2025, 2, 1)) == 1
+    assert len(backend.worksheet("audit_log").get_all_records()) == 2
@@ -0,0 +1,40 @@
+import pandas as pd
+
+from audit_index import AuditLogIndex
+
+
+def audit_frame():
+    return pd.DataFrame({
+        "Timestamp": ["2025-01-03 10:00:00", "2025-01-01 08:00:00", "not a date", "2025-01-02 09:00:00",
+                      "2025-01-03 07:00:00"],
+        "User ID": [7, 8, 7, 7, 8],
+        "Username": ["budi", 8, "budi", "budi", 8], # gspread numericises a numeric-looking username
+        "Action": ["Login", "Login", "Login", "Logout", "Login"],
+        "Status": ["Success", "Failed", "Success", "Success", "Success"],
+    })
+
+
+def test_rows_are_sorted_and_unparseable_timestamps_dropped():
+    index = AuditLogIndex(audit_frame())
+    assert len(index) == 4
+    assert index.df["Timestamp"].is_monotonic_increasing
+    assert index.values("Username") == ["8", "budi"]
+    assert index.values("Description") == []
+
+
+def test_date_range_is_half_open():
+    index = AuditLogIndex(audit_frame())
+    assert index.positions("2025-01-02", "2025-01-03").tolist() == [1]
+    assert index.positions(start="2025-01-03").tolist() == [2, 3]
+    assert index.positions("2025-01-04", "2025-01-05").tolist() == []
+
+
+def test_filters_combine_with_the_range():
+    index = AuditLogIndex(audit_frame())
+    assert index.positions(Username="8").tolist() == [0, 2]
+    assert index.positions(Username="8", Status="Success").tolist() == [2]
+    assert index.positions(Username="nobody").tolist() == []
+    assert index.positions(Action=None, Status="Success").tolist() == [1, 2, 3]
+
+    rows = index.query("2025-01-02", "2025-01-04", Action="Login")
+    assert rows["Timestamp"].dt.strftime("%d %H").tolist() == ["03 07", "03 10"]
@@ -0,0 +1,60 @@
+import threading
+import time
+
+import bcrypt
+import pytest
+
+from auth import LoginThrottled, PasswordVerifier, VerifierBusy
+
+HASH = bcrypt.hashpw(b"rahasia", bcrypt.gensalt(4)).decode()
+
+
+def test_verifies_hashes_and_legacy_plain_text():
+    verifier = PasswordVerifier()
+    assert verifier.verify("rahasia", HASH)
+    assert not verifier.verify("salah", HASH)
+    assert verifier.verify("plain", "plain")
+
+
+def test_timeout_is_busy_and_keeps_the_slot_until_the_check_runs():
+    verifier = PasswordVerifier(max_workers=1, max_pending=2)
+    release = threading.Event()
+    verifier.pool.submit(release.wait, 5) # Occupies the only worker
+    with pytest.raises(VerifierBusy):
+        verifier.verify("rahasia", HASH, timeout=0.05)
+    with pytest.raises(VerifierBusy):
+        verifier.verify("rahasia", HASH, timeout=0.05)
+    with pytest.raises(VerifierBusy): # Both slots still held by the queued checks
+        verifier.verify("rahasia", HASH, timeout=5)
+    release.set()
+    deadline = time.monotonic() + 5
+    while True: # Slots come back once the queued checks have run
+        try:
+            assert verifier.verify("rahasia", HASH, timeout=5)
+            break
+        except VerifierBusy:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+
+def test_repeated_failures_lock_the_id():
+    verifier = PasswordVerifier(max_failures=2, lockout=60)
+    verifier.record_failure("7")
+    verifier.check_throttle("7")
+    verifier.record_failure("7")
+    with pytest.raises(LoginThrottled):
+        verifier.check_throttle("7")
+    verifier.record_success("7")
+    verifier.check_throttle("7")
+
+
+def test_expired_entries_are_dropped():
+    verifier = PasswordVerifier(max_failures=2, failure_window=0.05, lockout=0.05)
+    for key in ["a", "b", "c"]:
+        verifier.record_failure(key)
+    verifier.record_failure("c") # Locked
+    assert set(verifier.failures) == {"a", "b"} and set(verifier.locked_until) == {"c"}
+    time.sleep(0.1)
+    verifier.record_failure("d")
+    assert set(verifier.failures) == {"d"}
+    assert verifier.locked_until == {}
@@ -0,0 +1,61 @@
+import io
+
+import pandas as pd
+import pytest
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+from export import available_formats, export_frame
+
+
+def log_frame(rows=7):
+    return pd.DataFrame({
+        "Timestamp": [f"2025-01-{day % 28 + 1:02d} 08:00:00" for day in range(rows)],
+        "User ID": [day if day % 2 else f"x{day}" for day in range(rows)], # Mixed numbers and text, as gspread returns them
+        "Hours": [8.0] * rows,
+    })
+
+
+def downloaded_bytes(df, fmt):
+    """What st.download_button sends for a deferred `data=lambda: export_frame(...)`."""
+    data, _ = convert_data_to_bytes_and_infer_mime(export_frame(df, fmt), RuntimeError("unsupported type"))
+    return data
+
+
+def test_csv_round_trip_in_chunks():
+    df = log_frame()
+    exported = export_frame(df, "csv", chunk_rows=3).getvalue()
+    assert exported.count(b"Timestamp") == 1 # Header written once across chunks
+    result = pd.read_csv(io.BytesIO(exported), dtype=str)
+    assert result["User ID"].tolist() == df["User ID"].astype(str).tolist()
+    assert len(result) == len(df)
+
+
+def test_csv_of_empty_frame_has_header():
+    assert export_frame(log_frame(0), "csv").getvalue().decode().strip() == "Timestamp,User ID,Hours"
+
+
+@pytest.mark.parametrize("fmt", available_formats())
+def test_download_button_accepts_export(fmt):
+    assert downloaded_bytes(log_frame(), fmt)
+
+
+def test_parquet_round_trip_with_mixed_columns():
+    pytest.importorskip("pyarrow")
+    df = log_frame(10)
+    result = pd.read_parquet(io.BytesIO(downloaded_bytes(df, "parquet")))
+    assert result["User ID"].tolist() == df["User ID"].astype(str).tolist()
+    assert result["Hours"].tolist() == df["Hours"].tolist()
+
+
+def test_parquet_keeps_categories_that_mix_numbers_and_text():
+    pytest.importorskip("pyarrow")
+    df = log_frame(4).assign(Username=pd.Series([7, "budi", None, "budi"]).astype("category"))
+    result = pd.read_parquet(io.BytesIO(export_frame(df, "parquet", chunk_rows=3).getvalue()))
+    assert result["Username"].astype(object).tolist()[:2] == ["7", "budi"]
+    assert pd.isna(result["Username"][2])
+    assert isinstance(result["Username"].dtype, pd.CategoricalDtype)
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        export_frame(log_frame(), "xlsx")
@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+
+from journal import JournalReplayer, SubmissionJournal
+
+HEADER = ["Id", "Username", "Date", "Hours"]
+
+
+class FakeSheet:
+    """Append target for the replayer that remembers what was written."""
+
+    def __init__(self, fail=False, delay=0.0):
+        self.rows = []
+        self.fail = fail
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def keys(self, dates):
+        with self.lock:
+            return {(str(r[0]), str(r[2])) for r in self.rows}
+
+    def append_rows(self, rows):
+        time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("offline")
+        with self.lock:
+            self.rows.extend(rows)
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / "journal.db")
+
+
+def replayer(journal, sheet, **kwargs):
+    # A long interval keeps the background thread idle; the tests call replay_once themselves
+    return JournalReplayer(journal, sheet.keys, sheet.append_rows, interval=3600, **kwargs)
+
+
+def test_replay_writes_pending_entries_once(journal_path):
+    journal = SubmissionJournal(journal_path, HEADER)
+    journal.append([[1, "budi", "2025-01-06", 8], [2, "sari", "2025-01-06", 8]])
+    sheet, committed = FakeSheet(), []
+    replay = replayer(journal, sheet, on_commit=committed.extend)
+    assert replay.replay_once() == 2
+    assert replay.replay_once() == 0
+    assert len(sheet.rows) == 2 and len(committed) == 2
+    assert journal.pending() == []
+
+
+def test_entries_already_in_the_sheet_are_only_marked_committed(journal_path):
+    journal = SubmissionJournal(journal_path, HEADER)
+    sheet = FakeSheet()
+    sheet.rows.append([1, "budi", "2025-01-06", 8]) # Appended before a crash, the commit mark was lost
+    journal.append([[1, "budi", "2025-01-06", 8], [1, "budi", "2025-01-07", 8], [1, "budi", "2025-01-07", 8]])
+    replay = replayer(journal, sheet)
+    assert replay.replay_once() == 1
+    assert replay.skipped == 2
+    assert len(sheet.rows) == 2
+
+
+def test_failed_replay_leaves_entries_pending(journal_path):
+    journal = SubmissionJournal(journal_path, HEADER)
+    journal.append([[1, "budi", "2025-01-06", 8]])
+    sheet = FakeSheet(fail=True)
+    replay = replayer(journal, sheet)
+    with pytest.raises(ConnectionError):
+        replay.replay_once()
+    assert journal.pending_keys() == {("1", "2025-01-06")}
+    sheet.fail = False
+    assert replay.replay_once() == 1
+
+
+def test_replayers_sharing_a_journal_file_do_not_duplicate(journal_path):
+    journals = [SubmissionJournal(journal_path, HEADER) for _ in range(3)]
+    journals[0].append([[i, f"user{i}", "2025-01-06", 8] for i in range(50)])
+    sheet = FakeSheet(delay=0.05) # Slow appends: every replayer runs while another is writing
+    replayers = [replayer(journal, sheet) for journal in journals]
+    threads = [threading.Thread(target=r.replay_once) for r in replayers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert sorted(r[0] for r in sheet.rows) == list(range(50))
+    assert sum(r.replayed for r in replayers) == 50
+
+
+def test_stale_claims_are_taken_over(journal_path):
+    journal = SubmissionJournal(journal_path, HEADER)
+    journal.append([[1, "budi", "2025-01-06", 8]])
+    assert journal.claim("crashed-process") # Claimed, then the process died
+    assert journal.claim("other", stale_after=3600) == []
+    assert [row for _, row in journal.claim("other", stale_after=0)] == [[1, "budi", "2025-01-06", 8]]
+
+
+def test_recently_committed_rows_stay_visible(journal_path):
+    journal = SubmissionJournal(journal_path, HEADER)
+    journal.append([[1, "budi", "2025-01-06", 8]])
+    before_commit = time.time()
+    replayer(journal, FakeSheet()).replay_once()
+    journal.append([[2, "sari", "2025-01-06", 8]])
+    assert journal.pending_rows() == [[2, "sari", "2025-01-06", 8]]
+    # A snapshot whose download started before the commit doesn't have the first row yet
+    assert len(journal.pending_rows(committed_since=before_commit)) == 2
+    assert journal.pending_rows(committed_since=time.time() + 1) == [[2, "sari", "2025-01-06", 8]]
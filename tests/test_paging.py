@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+
+from paging import paginate_frame
+
+
+def frame():
+    return pd.DataFrame({
+        "Hours": [3.0, np.nan, 8.0, 1.0, 5.0],
+        "Date": pd.to_datetime(["2025-01-03", "2025-01-01", "2025-01-05", "2025-01-02", "2025-01-04"]),
+        "Username": pd.Series(["sari", "budi", 7, "andi", "budi"]).astype("category"),
+    })
+
+
+def test_numeric_pages_match_a_full_sort():
+    df = frame()
+    assert paginate_frame(df, "Hours", False, 1, 2)["Hours"].tolist() == [8.0, 5.0]
+    assert paginate_frame(df, "Hours", True, 2, 2)["Hours"].tolist() == [5.0, 8.0]
+    assert paginate_frame(df, "Date", True, 1, 3)["Date"].dt.day.tolist() == [1, 2, 3]
+
+
+def test_empty_values_come_last():
+    last_page = paginate_frame(frame(), "Hours", True, 3, 2)["Hours"]
+    assert len(last_page) == 1 and pd.isna(last_page.iloc[0])
+
+
+def test_mixed_categories_sort_as_text():
+    page = paginate_frame(frame(), "Username", True, 1, 5)
+    assert page["Username"].tolist() == [7, "andi", "budi", "budi", "sari"]
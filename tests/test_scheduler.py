@@ -0,0 +1,144 @@
+import threading
+
+import pytest
+
+from storage import FaultInjectingBackend, QuotaExceeded, RequestScheduler, ScheduledBackend, SQLiteBackend
+
+
+class FakeClock:
+    """Clock and sleep for the scheduler: sleeping just moves the clock forward."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def scheduler(clock, **kwargs):
+    return RequestScheduler(sleep=clock.sleep, clock=clock, **kwargs)
+
+
+def test_reads_beyond_the_budget_wait_for_the_window():
+    clock = FakeClock()
+    sched = scheduler(clock, reads_per_minute=3)
+    results = [sched.call("read", lambda i=i: i) for i in range(5)]
+    assert results == [0, 1, 2, 3, 4]
+    assert clock.now == 60 # The 4th read waits until the first three leave the window; the 5th fits with it
+    assert sched.counters["calls"] == 5
+    assert sched.counters["throttled"] == 1
+
+
+def test_read_and_write_budgets_are_separate():
+    clock = FakeClock()
+    sched = scheduler(clock, reads_per_minute=1, writes_per_minute=1)
+    sched.call("read", lambda: None)
+    sched.call("write", lambda: None)
+    assert clock.now == 0
+    assert sched.counters["throttled"] == 0
+
+
+def test_quota_errors_are_retried_with_backoff():
+    clock = FakeClock()
+    sched = scheduler(clock, base_delay=1.0)
+    attempts = []
+
+    def flaky():
+        attempts.append(clock.now)
+        if len(attempts) < 3:
+            raise QuotaExceeded("429")
+        return "ok"
+
+    assert sched.call("read", flaky) == "ok"
+    assert len(attempts) == 3
+    assert sched.counters["retried"] == 2
+    assert sched.counters["failed"] == 0
+    assert 0.5 <= clock.slept[0] <= 1.0 and 1.0 <= clock.slept[1] <= 2.0 # Jittered, doubling
+
+
+def test_other_errors_fail_without_retry():
+    sched = scheduler(FakeClock())
+    with pytest.raises(KeyError):
+        sched.call("write", lambda: {}["missing"])
+    assert sched.counters["calls"] == 1
+    assert sched.counters["failed"] == 1
+
+
+def failing(error, times):
+    """Function that raises `error` on its first `times` calls, then returns the number of calls."""
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        if len(attempts) <= times:
+            raise error
+        return len(attempts)
+
+    return call
+
+
+def test_writes_are_only_retried_when_refused():
+    sched = scheduler(FakeClock())
+    with pytest.raises(TimeoutError): # The append may have gone through, so it is not sent again
+        sched.call("write", failing(TimeoutError("no response"), 1))
+    assert sched.counters["retried"] == 0
+    assert sched.call("write", failing(QuotaExceeded("429"), 1)) == 2
+    assert sched.call("read", failing(ConnectionError("reset"), 1)) == 2
+    assert sched.counters["retried"] == 2
+
+
+def test_gives_up_after_max_retries():
+    sched = scheduler(FakeClock(), max_retries=2)
+
+    def always_over_quota():
+        raise QuotaExceeded("429")
+
+    with pytest.raises(QuotaExceeded):
+        sched.call("read", always_over_quota)
+    assert sched.counters["calls"] == 3
+    assert sched.counters["failed"] == 1
+
+
+def test_identical_concurrent_reads_are_coalesced():
+    sched = RequestScheduler()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow_read():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "rows"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(sched.call("read", slow_read, coalesce_key="k")))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(sched.call("read", slow_read, coalesce_key="k")))
+    follower.start()
+    while not sched.counters["coalesced"]:
+        threading.Event().wait(0.01)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert results == ["rows", "rows"]
+    assert len(calls) == 1
+
+
+def test_scheduled_fake_backend_absorbs_injected_quota_errors():
+    sqlite = SQLiteBackend(":memory:")
+    sqlite.create_worksheet("presensi", ["Id", "Date"])
+    clock = FakeClock()
+    sched = scheduler(clock, max_retries=10)
+    backend = ScheduledBackend(FaultInjectingBackend(sqlite, error_rate=0.3, seed=7), sched)
+    worksheet = backend.worksheet("presensi")
+    for i in range(20):
+        worksheet.append_row([i, "2025-01-01"])
+    assert len(worksheet.get_all_records()) == 20
+    assert sched.counters["retried"] > 0
+    assert sched.counters["failed"] == 0
@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from sheet_cache import DiskSnapshotStore, SharedFileLock, SingleFlight, SnapshotRefresher, fcntl
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_single_flight_shares_one_load():
+    flight = SingleFlight()
+    release = threading.Event()
+    loads = []
+
+    def load():
+        loads.append(1)
+        release.wait(5)
+        return "data"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", load))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    assert wait_for(lambda: flight.saved == 4)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ["data"] * 5
+    assert len(loads) == 1
+
+
+def test_version_bump_reloads_only_after_a_read():
+    versions = {"audit_log": 0}
+    loads = []
+    refresher = SnapshotRefresher(lambda title: loads.append(title) or len(loads), {"audit_log": 600},
+                                  versions.get, tick=0.01)
+    try:
+        assert refresher.get("audit_log")[0] == 1
+        versions["audit_log"] = 1
+        time.sleep(0.1)
+        assert len(loads) == 1 # Nobody read it: no download
+
+        assert refresher.get("audit_log")[0] == 1 # Served stale, reload requested
+        assert wait_for(lambda: refresher.get("audit_log")[0] == 2)
+        assert len(loads) == 2
+    finally:
+        refresher.close()
+
+
+def test_loaded_from_is_when_the_current_download_started():
+    refresher = SnapshotRefresher(lambda title: time.sleep(0.05), {"presensi": 600}, lambda title: 0, tick=3600)
+    try:
+        assert refresher.loaded_from("presensi") is None
+        before = time.time()
+        refresher.get("presensi")
+        assert before <= refresher.loaded_from("presensi") <= time.time() - 0.05
+    finally:
+        refresher.close()
+
+
+def test_disk_snapshot_round_trip_with_mixed_columns(tmp_path):
+    pytest.importorskip("pyarrow")
+    store = DiskSnapshotStore(str(tmp_path))
+    df = pd.DataFrame({
+        "Remark": [5, "x", None], # gspread numericises cells, so text columns mix numbers and strings
+        "Username": pd.Series([7, "budi", "budi"]).astype("category"),
+        "Hours": pd.Series([8, 4, 0], dtype="float32"),
+        "Date": pd.to_datetime(["2025-01-06"] * 3),
+    })
+    assert store.save("presensi", df, {"sync": {"rows_loaded": 3}})
+    loaded, meta, age = store.load("presensi")
+    assert meta == {"sync": {"rows_loaded": 3}}
+    assert age >= 0
+    assert loaded["Remark"].tolist()[:2] == ["5", "x"] and pd.isna(loaded["Remark"][2])
+    assert list(loaded["Username"].cat.categories) == ["7", "budi"]
+    assert loaded["Hours"].dtype == "float32"
+
+    store.discard("presensi")
+    assert store.load("presensi") is None
+
+
+@pytest.mark.skipif(fcntl is None, reason="needs fcntl")
+def test_shared_file_lock_excludes_other_holders(tmp_path):
+    path = str(tmp_path / "presensi.arrow.lock")
+    holder = SharedFileLock(path)
+    assert holder.acquire(1)
+    assert not SharedFileLock(path).acquire(0.1)
+    holder.release()
+    other = SharedFileLock(path)
+    assert other.acquire(1)
+    other.release()
@@ -0,0 +1,197 @@
+import pandas as pd
+import pytest
+
+from rollups import HoursRollup
+from storage import (AppendOnlySync, BatchedAppendWriter, MonthPartitionedSheet, SheetRowMap, SQLiteBackend, ValueIndex,
+                     build_value_indexes, select_positions)
+
+HEADER = ["Id", "Username", "Date", "Day", "Hours", "Overtime", "Area 1", "Area 2", "Area 3", "Area 4", "Shift", "Remark"]
+SCHEMA = {"Date": "datetime", "Hours": "float32", "Overtime": "float32", "Username": "category", "Shift": "category"}
+INDEX_COLUMNS = {"Username": ["Username"], "Area": ["Area 1", "Area 2", "Area 3", "Area 4"]}
+
+
+def row(user_id, date, hours=8, area="Crusher", shift="Day", remark=""):
+    return [user_id, f"user{user_id}", date, "Monday", hours, 0, area, "", "", "", shift, remark]
+
+
+@pytest.fixture
+def backend():
+    backend = SQLiteBackend(":memory:")
+    backend.create_worksheet("presensi", HEADER)
+    return backend
+
+
+def presensi_sync():
+    return AppendOnlySync("presensi", key_columns=("Id", "Date"), schema=SCHEMA, index_columns=INDEX_COLUMNS,
+                          rollup=HoursRollup())
+
+
+def test_appended_rows_are_fetched_incrementally(backend):
+    worksheet = backend.worksheet("presensi")
+    worksheet.append_rows([row(1, "2025-01-06"), row(2, "2025-01-06", area="Mill")])
+    sync = presensi_sync()
+    assert len(sync.sync(backend)) == 2
+
+    worksheet.append_rows([row(1, "2025-01-07", remark=5), row(3, "2025-01-07", remark="x")])
+    df = sync.sync(backend)
+    assert len(df) == 4
+    assert sync.full_reloads == 1 and sync.incremental_syncs == 1
+    assert ("1", "2025-01-07") in sync.keys
+    assert sync.indexes["Area"].get("Crusher").tolist() == [0, 2, 3]
+    assert sync.rollup.frame("area").set_index("Area")["Hours"].to_dict() == {"Crusher": 24.0, "Mill": 8.0}
+    assert isinstance(df["Username"].dtype, pd.CategoricalDtype)
+
+
+def test_deleted_rows_force_a_full_reload(backend):
+    worksheet = backend.worksheet("presensi")
+    worksheet.append_rows([row(1, "2025-01-06"), row(2, "2025-01-06"), row(3, "2025-01-06")])
+    sync = presensi_sync()
+    sync.sync(backend)
+    worksheet.delete_rows(4) # The last loaded row, i.e. the sync's anchor
+    worksheet.append_rows([row(4, "2025-01-07")])
+    df = sync.sync(backend)
+    assert sync.full_reloads == 2
+    assert df["Id"].tolist() == [1, 2, 4]
+    assert ("3", "2025-01-06") not in sync.keys
+    assert sync.rollup.rows == 3
+
+
+def test_restored_sync_only_fetches_newer_rows(backend):
+    worksheet = backend.worksheet("presensi")
+    worksheet.append_rows([row(1, "2025-01-06"), row(2, "2025-01-06")])
+    first = presensi_sync()
+    first.sync(backend)
+    df, state = first.state()
+
+    worksheet.append_rows([row(3, "2025-01-07")])
+    restored = presensi_sync()
+    restored.restore(df, state)
+    assert len(restored.sync(backend)) == 3
+    assert restored.full_reloads == 0
+    assert restored.rollup.rows == 3
+
+
+def test_row_map_follows_rows_moved_by_hand():
+    backend = SQLiteBackend(":memory:")
+    worksheet = backend.create_worksheet("user", ["Id", "Username", "Password"])
+    worksheet.append_rows([[1, "budi", "x"], [2, "sari", "y"]])
+    row_map = SheetRowMap.load(worksheet, "Id")
+    worksheet.delete_rows(2)
+    current = row_map.with_current_keys(worksheet)
+    assert row_map.row_of(2) == 3
+    assert current.row_of(2) == 2
+    assert current.row_of(1) is None
+    assert current.col_of("Password") == 3
+
+
+def test_month_partitions_keep_keys_and_rollups(backend):
+    partitions = MonthPartitionedSheet("presensi", HEADER, key_columns=("Id", "Date"), schema=SCHEMA,
+                                       rollup_factory=HoursRollup)
+    assert partitions.append_rows(backend, [row(1, "2025-01-31"), row(1, "2025-02-03", hours=4)]) == ["2025_01", "2025_02"]
+    assert partitions.keys_for(backend, ["2025_02"]) == {("1", "2025-02-03")}
+    assert len(partitions.load_range(backend, "2025-02-01", "2025-02-28")) == 1
+
+    assert partitions.cached_keys(["2025_02", "2025_03"]) == {("1", "2025-02-03")} # From memory only
+    partitions.append_rows(backend, [row(2, "2025-02-04", hours=6)])
+    totals = HoursRollup.merged(partitions.rollups(backend))
+    assert totals.rows == 3
+    assert totals.frame("user_month").groupby("Month")["Hours"].sum().to_dict() == {"2025-01": 8.0, "2025-02": 10.0}
+
+
+def test_batched_writer_flushes_every_row(backend):
+    flushes = []
+    writer = BatchedAppendWriter(lambda: backend.worksheet("presensi"), max_batch=4, flush_interval=0.05,
+                                 on_flush=lambda: flushes.append(1))
+    for i in range(10):
+        writer.submit(row(i, "2025-01-06"))
+    assert writer.flush(5)
+    writer.close()
+    assert writer.written == 10
+    assert len(backend.worksheet("presensi").get_all_records()) == 10
+    assert len(flushes) >= 3 # At most max_batch rows per append
+
+
+def test_hand_edits_are_picked_up_by_the_periodic_full_reload(backend):
+    worksheet = backend.worksheet("presensi")
+    worksheet.append_rows([row(1, "2025-01-06"), row(2, "2025-01-06")])
+    now = [0.0]
+    sync = AppendOnlySync("presensi", key_columns=("Id", "Date"), schema=SCHEMA, full_reload_interval=600,
+                          clock=lambda: now[0])
+    sync.sync(backend)
+    worksheet.update_cell(2, 5, 4) # Hours of the first row, above the anchor
+    assert sync.sync(backend)["Hours"].tolist() == [8, 8]
+    now[0] = 600
+    assert sync.sync(backend)["Hours"].tolist() == [4, 8]
+    assert sync.full_reloads == 2
+
+
+def test_restored_sync_keeps_the_full_reload_schedule(backend):
+    backend.worksheet("presensi").append_rows([row(1, "2025-01-06")])
+    first = AppendOnlySync("presensi", full_reload_interval=600)
+    first.sync(backend)
+    df, state = first.state()
+    restored = AppendOnlySync("presensi", full_reload_interval=600)
+    restored.restore(df, state)
+    restored.sync(backend)
+    assert restored.full_reloads == 0
+
+    state["full_reload_at"] -= 600 # Saved ten minutes ago
+    overdue = AppendOnlySync("presensi", full_reload_interval=600)
+    overdue.restore(df, state)
+    overdue.sync(backend)
+    assert overdue.full_reloads == 1
+
+
+def test_value_index_lists_rows_under_every_column_value():
+    df = pd.DataFrame({"Area 1": ["Crusher", "Mill", "Crusher"], "Area 2": ["Mill", "", None]})
+    index = ValueIndex.build(df, ["Area 1", "Area 2"])
+    assert index.keys() == ["Crusher", "Mill"] # Blank and missing values are not indexed
+    assert index.get("Mill").tolist() == [0, 1]
+    assert index.get("Kiln").tolist() == []
+
+    extended = index.extended(pd.DataFrame({"Area 1": ["Kiln"], "Area 2": ["Mill"]}), offset=3)
+    assert extended.get("Mill").tolist() == [0, 1, 3]
+    assert index.get("Mill").tolist() == [0, 1] # The original index is left as it was
+
+
+def test_selected_positions_are_the_intersection_of_the_filters():
+    df = pd.DataFrame({"Username": ["budi", "sari", "budi", "budi"], "Shift": ["Day", "Day", "Night", "Day"],
+                       "Area 1": ["Crusher", "Crusher", "Crusher", "Mill"]})
+    indexes = build_value_indexes(df, {"Username": ["Username"], "Shift": ["Shift"], "Area": ["Area 1"]})
+    assert select_positions(indexes, {}) is None
+    assert select_positions(indexes, {"Username": "budi", "Shift": "Day"}).tolist() == [0, 3]
+    assert select_positions(indexes, {"Username": "budi", "Shift": "Day", "Area": "Crusher"}).tolist() == [0]
+    assert select_positions(indexes, {"Username": "nobody", "Shift": "Day"}).tolist() == []
+
+
+def test_interrupted_import_resumes_without_duplicates(backend):
+    legacy = [row(1, "2025-01-06"), row(1, "2025-01-06"), row(2, "2025-01-07"), row(1, "2025-02-03")]
+    backend.worksheet("presensi").append_rows(legacy)
+    partitions = MonthPartitionedSheet("presensi", HEADER, key_columns=("Id", "Date"), schema=SCHEMA)
+    partitions.append_rows(backend, legacy[:1]) # A first run copied one row, then failed
+    assert not partitions.is_migrated(backend)
+
+    assert partitions.import_sheet(backend, "presensi") == 3
+    assert len(backend.worksheet("presensi_2025_01").get_all_records()) == 3 # The repeated row is kept twice
+    assert len(backend.worksheet("presensi_2025_02").get_all_records()) == 1
+    assert partitions.is_migrated(backend)
+
+    other_replica = MonthPartitionedSheet("presensi", HEADER, key_columns=("Id", "Date"), schema=SCHEMA)
+    assert other_replica.import_sheet(backend, "presensi") == 0
+    assert len(backend.worksheet("presensi_2025_01").get_all_records()) == 3
+
+
+def test_batched_writer_drops_a_failed_append_instead_of_resending_it():
+    class TimingOutSheet:
+        calls = 0
+
+        def append_rows(self, rows):
+            TimingOutSheet.calls += 1
+            raise TimeoutError("no response")
+
+    writer = BatchedAppendWriter(TimingOutSheet, max_batch=10, flush_interval=0.05)
+    writer.submit(row(1, "2025-01-06"))
+    assert writer.flush(5)
+    writer.close()
+    assert TimingOutSheet.calls == 1
+    assert writer.dropped == 1 and writer.written == 0
@@ -0,0 +1,79 @@
+import pandas as pd
+import pytest
+
+from validation import build_presensi_rows, normalize_import, validate_timesheet
+
+USERNAMES = {"7": "budi", "8": "sari"}
+
+
+def timesheet(**columns):
+    base = {"Id": [7, 7], "Username": "budi", "Date": ["2025-01-06", "2025-01-07"], "Day": ["Monday", "Tuesday"],
+            "Hours": [8, 8], "Overtime": [0, 0], "Area 1": "Crusher", "Shift": "Day Shift"}
+    base.update(columns)
+    return pd.DataFrame(base)
+
+
+def import_frame(dates, ids=None):
+    ids = ids or ["7"] * len(dates)
+    return pd.DataFrame({"Id": ids, "Date": dates, "Hours": "8", "Overtime": "", "Area 1": "Crusher", "Shift": "Day Shift"})
+
+
+def test_slashed_dates_are_day_first():
+    rows, errors = normalize_import(import_frame(["05/01/2025", "2025-01-05", "2025-01-05 00:00:00"]), USERNAMES)
+    assert rows["Date"].tolist() == ["2025-01-05"] * 3
+    assert rows["Day"].tolist() == ["Sunday"] * 3
+    assert errors.map(len).tolist() == [0, 0, 0]
+
+
+def test_month_first_and_free_form_dates_are_rejected():
+    rows, errors = normalize_import(import_frame(["01/31/2025", "5 Jan 2025"]), USERNAMES)
+    assert all(messages[0].startswith("Invalid date") for messages in errors)
+
+
+def test_ids_and_usernames():
+    rows, errors = normalize_import(import_frame(["2025-01-05"] * 3, ids=["007", "8.0", "99"]), USERNAMES)
+    assert rows["Id"].tolist() == ["7", "8", "99"]
+    assert rows["Username"].tolist() == ["budi", "sari", ""]
+    assert rows["Overtime"].tolist() == ["0"] * 3
+    assert errors[2] == ["Unknown user Id: **99**."]
+
+
+def test_rules_flag_each_failing_row():
+    df = timesheet(Hours=["x", 20], Overtime=[0, 5], **{"Area 1": ["", "Moon"]})
+    report = validate_timesheet(df, valid_areas=["Crusher"])
+    assert report["invalid_number"].tolist() == [True, False]
+    assert report["too_many_hours"].tolist() == [False, True]
+    assert report["empty_area"].tolist() == [True, False]
+    assert report["unknown_area"].tolist() == [False, True]
+    assert not report["Valid"].any()
+    assert report.at[1, "Errors"][0].startswith("Total hours (Working Hours + Overtime) on Date: **2025-01-07**")
+
+
+def test_duplicates_against_existing_keys_and_within_the_frame():
+    df = timesheet(Date=["2025-01-06", "2025-01-06"])
+    assert validate_timesheet(df)["Duplicate"].tolist() == [False, True]
+    report = validate_timesheet(timesheet(), existing_keys=[{("7", "2025-01-07")}, set()])
+    assert report["Duplicate"].tolist() == [False, True]
+    assert report["Valid"].all() # Duplicates are reported separately from the rules
+
+
+def test_presensi_rows_follow_the_sheet_columns():
+    rows = build_presensi_rows(timesheet(Hours=["7.5", 8]))
+    assert rows[0] == [7, "budi", "2025-01-06", "Monday", 7.5, 0.0, "Crusher", "", "", "", "Day Shift", ""]
+    assert all(type(value) in (int, float, str) for value in rows[1])
+
+
+def test_shift_must_be_one_of_the_form_options():
+    report = validate_timesheet(timesheet(Shift=["Night Shift", "Graveyard"]))
+    assert report["unknown_shift"].tolist() == [False, True]
+    assert report.at[1, "Errors"] == ["Unknown shift on Date: **2025-01-07**. Shift must be one of: "
+                                      "Day Shift, Night Shift, Noon Shift."]
+
+
+def test_imported_shifts_ignore_case():
+    df = import_frame(["2025-01-05", "2025-01-06", "2025-01-07"]).assign(Shift=["night shift", " Noon Shift ", ""])
+    rows, _ = normalize_import(df, USERNAMES)
+    assert rows["Shift"].tolist() == ["Night Shift", "Noon Shift", ""]
+    assert validate_timesheet(rows)["unknown_shift"].tolist() == [False, False, True]
+    with pytest.raises(ValueError, match="Shift"):
+        normalize_import(df.drop(columns="Shift"), USERNAMES)
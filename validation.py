@@ -0,0 +1,144 @@
+"""
+Validation of timesheet rows before they are appended to the 'presensi' sheet.
+
+All rules run column-wise over the whole frame. `validate_timesheet` returns a
+per-row report and `build_presensi_rows` turns the accepted rows into the
+`append_rows` payload.
+"""
+import pandas as pd
+
+# Column order of the 'presensi' sheet
+PRESENSI_COLUMNS = ["Id", "Username", "Date", "Day", "Hours", "Overtime",
+                    "Area 1", "Area 2", "Area 3", "Area 4", "Shift", "Remark"]
+AREA_COLUMNS = ["Area 1", "Area 2", "Area 3", "Area 4"]
+TEXT_COLUMNS = ["Day", "Area 1", "Area 2", "Area 3", "Area 4", "Shift", "Remark"]
+MAX_DAILY_HOURS = 24.01 # Working Hours + Overtime, with a little tolerance for rounding
+# The shifts offered by the timesheet form
+SHIFT_OPTIONS = ["Day Shift", "Night Shift", "Noon Shift"]
+
+# (code, message) in the order they are reported for a row
+RULES = [
+    ("invalid_number", "Invalid numeric input for Hours or Overtime on Date: **{date}**."),
+    ("negative_hours", "Hours or Overtime cannot be negative on Date: **{date}**."),
+    ("too_many_hours", "Total hours (Working Hours + Overtime) on Date: **{date}** exceeds 24 hours. Please correct."),
+    ("empty_area", "**Area 1** cannot be empty on Date: **{date}**."),
+    ("unknown_area", "Unknown area on Date: **{date}**. Please choose areas from the 'areas' list."),
+    ("unknown_shift", "Unknown shift on Date: **{date}**. Shift must be one of: " + ", ".join(SHIFT_OPTIONS) + "."),
+]
+
+
+def _text(series):
+    return series.fillna("").astype(str).str.strip()
+
+
+def validate_timesheet(df, existing_keys=None, valid_areas=None):
+    """
+    Validates timesheet rows (needs at least Id, Date, Hours, Overtime and Area 1;
+    a Shift column must hold one of SHIFT_OPTIONS).
+
+    Returns a DataFrame with the same index as `df` holding one boolean column
+    per rule, `Duplicate` (the (Id, Date) key already exists in `existing_keys`
+    or earlier in `df`), `Errors` (list of messages) and `Valid`.
+    `existing_keys` is a set of keys or a list of such sets.
+    """
+    dates = df["Date"].astype(str)
+    hours = pd.to_numeric(df["Hours"], errors="coerce")
+    overtime = pd.to_numeric(df["Overtime"], errors="coerce")
+
+    report = pd.DataFrame({"Date": dates}, index=df.index)
+    report["invalid_number"] = hours.isna() | overtime.isna()
+    report["negative_hours"] = (hours < 0) | (overtime < 0)
+    report["too_many_hours"] = (hours.fillna(0) + overtime.fillna(0)) > MAX_DAILY_HOURS
+    report["empty_area"] = _text(df["Area 1"]) == ""
+
+    report["unknown_area"] = False
+    if valid_areas is not None:
+        valid_areas = set(valid_areas) | {""}
+        for col in AREA_COLUMNS:
+            if col in df.columns:
+                report["unknown_area"] |= ~_text(df[col]).isin(valid_areas)
+
+    report["unknown_shift"] = ~_text(df["Shift"]).isin(SHIFT_OPTIONS) if "Shift" in df.columns else False
+
+    keys = pd.MultiIndex.from_arrays([df["Id"].astype(str), dates])
+    report["Duplicate"] = keys.duplicated()
+    key_sets = [ks for ks in (existing_keys if isinstance(existing_keys, (list, tuple)) else [existing_keys]) if ks]
+    if key_sets:
+        # Hash lookups per submitted row, independent of how big the existing sheet is
+        report["Duplicate"] |= pd.Series([any(key in ks for ks in key_sets) for key in keys], index=df.index)
+
+    # Messages are only formatted for the rows that actually failed a rule
+    report["Errors"] = [[] for _ in range(len(report))]
+    errors = report["Errors"]
+    for code, message in RULES:
+        for idx, date in report.loc[report[code], "Date"].items():
+            errors[idx].append(message.format(date=date))
+
+    report["Valid"] = ~report[[code for code, _ in RULES]].any(axis=1)
+    return report
+
+
+def build_presensi_rows(df):
+    """Builds the `append_rows` payload (lists in PRESENSI_COLUMNS order) in one step."""
+    payload = pd.DataFrame(index=df.index)
+    for col in PRESENSI_COLUMNS:
+        payload[col] = df[col] if col in df.columns else ""
+    payload["Date"] = payload["Date"].astype(str)
+    payload["Hours"] = pd.to_numeric(payload["Hours"], errors="coerce").astype(float)
+    payload["Overtime"] = pd.to_numeric(payload["Overtime"], errors="coerce").astype(float)
+    payload[TEXT_COLUMNS] = payload[TEXT_COLUMNS].fillna("")
+    # astype(object) turns NumPy scalars into plain Python values that gspread can serialize
+    return payload.astype(object).values.tolist()
+
+
+# Columns an uploaded timesheet file must have; the others in PRESENSI_COLUMNS are optional
+IMPORT_REQUIRED_COLUMNS = ["Id", "Date", "Hours", "Overtime", "Area 1", "Shift"]
+# Accepted date formats, tried in order. Slashed dates are day first (05/01/2025 is 5 January), as written
+# locally; month-first or other formats are rejected instead of guessed. Excel date cells read as text
+# come out as "YYYY-MM-DD 00:00:00".
+IMPORT_DATE_FORMATS = ["%Y-%m-%d", "%d/%m/%Y", "%Y-%m-%d %H:%M:%S"]
+
+
+def normalize_import(df, usernames):
+    """
+    Turns an uploaded timesheet file (one row per user and date) into rows
+    `validate_timesheet` and `build_presensi_rows` can take: Ids are written
+    the way the sheet stores them, dates (see IMPORT_DATE_FORMATS) as YYYY-MM-DD, Day is derived from the
+    date, blank Overtime is 0, Shift is matched to SHIFT_OPTIONS ignoring case
+    and Username is looked up in `usernames` (Id -> Username).
+
+    Returns (frame, schema errors) where the errors are a list of messages per
+    row. Raises ValueError if required columns are missing.
+    """
+    df = df.rename(columns=lambda col: str(col).strip())
+    missing = [col for col in IMPORT_REQUIRED_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+
+    rows = pd.DataFrame(index=df.index)
+    for col in PRESENSI_COLUMNS:
+        rows[col] = _text(df[col]) if col in df.columns else ""
+
+    # Numeric Ids are stored as numbers in the sheet, so "007" and "7.0" both mean 7
+    numeric_ids = pd.to_numeric(rows["Id"], errors="coerce")
+    integral = numeric_ids.notna() & (numeric_ids % 1 == 0)
+    rows.loc[integral, "Id"] = numeric_ids[integral].astype("int64").astype(str)
+    rows["Username"] = rows["Id"].map(usernames).fillna("")
+    rows.loc[rows["Overtime"] == "", "Overtime"] = "0" # Blank overtime means none, like the form's default
+    # "night shift" is accepted as Night Shift; anything else is left for validate_timesheet to reject
+    shift_names = {shift.lower(): shift for shift in SHIFT_OPTIONS}
+    rows["Shift"] = rows["Shift"].map(lambda shift: shift_names.get(shift.lower(), shift))
+
+    dates = pd.Series(pd.NaT, index=rows.index, dtype="datetime64[ns]")
+    for date_format in IMPORT_DATE_FORMATS:
+        dates = dates.fillna(pd.to_datetime(rows["Date"], errors="coerce", format=date_format))
+    valid_date = dates.notna()
+    rows.loc[valid_date, "Date"] = dates[valid_date].dt.strftime("%Y-%m-%d")
+    rows.loc[valid_date, "Day"] = dates[valid_date].dt.strftime("%A")
+
+    errors = pd.Series([[] for _ in range(len(rows))], index=rows.index)
+    for idx in rows.index[~valid_date]:
+        errors[idx].append(f"Invalid date: **{rows.at[idx, 'Date']}** (use YYYY-MM-DD or DD/MM/YYYY).")
+    for idx in rows.index[rows["Username"] == ""]:
+        errors[idx].append(f"Unknown user Id: **{rows.at[idx, 'Id']}**.")
+    return rows, errors